@@ -0,0 +1 @@
+""" pytest configuration: makes the repository root (config, utils) importable from tests/ """
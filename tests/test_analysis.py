@@ -0,0 +1,182 @@
+""" Tests of utils.analysis against the original loop-based implementations """
+
+from collections import Counter
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analysis import (
+    MISSING_PATH,
+    bootstrap_CI_prob_all_cats,
+    bootstrap_CI_prob_cat,
+    category_transition_matrix,
+    distance_matrix,
+    lookup_shortest_paths,
+    shortest_path_find,
+)
+from utils.preprocessing import BACKCLICK
+from utils.shortest_paths import UNREACHABLE
+from utils.synthetic import synthetic_articles, synthetic_games, synthetic_links
+
+
+def baseline_shortest_path_find(df, articles, shortest_paths):
+    shortest_unfinished = []
+    not_found = 0
+    for i in range(len(df)):
+        source = articles.loc[articles["article"] == df.iloc[i]["path"][0]]
+        target = articles.loc[articles["article"] == df.iloc[i]["target"]]
+        if len(source) != 0 and len(target) != 0:
+            shortest_unfinished.append(int(shortest_paths[source.index[0]][target.index[0]]))
+        else:
+            shortest_unfinished.append(None)
+            not_found += 1
+    return shortest_unfinished, not_found
+
+
+def make_games(n_articles=30, n_games=200, seed=0):
+    rng = np.random.default_rng(seed)
+    articles = pd.DataFrame({"article": ["A{}".format(i) for i in range(n_articles)]})
+    names = articles["article"].tolist() + ["Unknown"]
+    games = pd.DataFrame(
+        {
+            "path": [[names[i], "<"] for i in rng.integers(0, len(names), n_games)],
+            "target": [names[i] for i in rng.integers(0, len(names), n_games)],
+        }
+    )
+    matrix = rng.integers(0, 10, (n_articles, n_articles))
+    return games, articles, matrix
+
+
+def test_shortest_path_find_matches_baseline():
+    games, articles, matrix = make_games()
+    expected, expected_missing = baseline_shortest_path_find(games, articles, matrix)
+    lengths, missing = shortest_path_find(games, articles, matrix)
+    assert missing == expected_missing
+    assert [None if pd.isna(x) else int(x) for x in lengths] == expected
+
+
+def test_shortest_path_find_digit_rows_match_baseline():
+    games, articles, matrix = make_games(seed=1)
+    rows = ["".join(map(str, row)) for row in matrix]
+    expected, expected_missing = baseline_shortest_path_find(games, articles, rows)
+    lengths, missing = shortest_path_find(games, articles, rows)
+    assert missing == expected_missing
+    assert [None if pd.isna(x) else int(x) for x in lengths] == expected
+
+
+def test_digit_rows_are_parsed_by_callers():
+    rows = ["012", "1_2", "210"]
+    parsed = distance_matrix(rows)
+    assert distance_matrix(parsed) is parsed
+    np.testing.assert_array_equal(parsed[[0, 2, 1], [2, 0, 1]], [2, 2, UNREACHABLE])
+    lengths = lookup_shortest_paths(np.array([0, MISSING_PATH, 1]), np.array([2, 0, 1]), parsed)
+    np.testing.assert_array_equal(lengths, [2, MISSING_PATH, MISSING_PATH])
+    # the per-chunk lookup never parses, rows must be parsed once beforehand
+    with pytest.raises(ValueError):
+        lookup_shortest_paths(np.array([0]), np.array([2]), rows)
+
+
+def baseline_bootstrap_CI_prob_cat(data_f, data_u, cat, category_dict, iterations=1000):
+    finished = [item for artic in data_f if artic in category_dict for item in category_dict[artic]]
+    unfinished = [item for artic in data_u if artic in category_dict for item in category_dict[artic]]
+    means = np.zeros(iterations)
+    for i in range(iterations):
+        sample_f = Counter(np.random.choice(finished, size=len(finished), replace=True))
+        sample_u = Counter(np.random.choice(unfinished, size=len(unfinished), replace=True))
+        means[i] = sample_u[cat] / (sample_u[cat] + sample_f[cat])
+    return np.percentile(means, 2.5), np.percentile(means, 97.5)
+
+
+def make_targets(seed=0):
+    rng = np.random.default_rng(seed)
+    category_dict = {"A{}".format(i): [["Art", "Science", "History"][i % 3]] * (1 + i % 2) for i in range(30)}
+    names = list(category_dict) + ["Unknown"]
+    data_f = pd.Series([names[i] for i in rng.integers(0, len(names), 2000)])
+    data_u = pd.Series([names[i] for i in rng.integers(0, len(names), 800)])
+    return data_f, data_u, category_dict
+
+
+def test_bootstrap_matches_baseline_interval():
+    data_f, data_u, category_dict = make_targets()
+    np.random.seed(0)
+    expected = baseline_bootstrap_CI_prob_cat(data_f, data_u, "Science", category_dict)
+    lower, upper = bootstrap_CI_prob_cat(data_f, data_u, "Science", category_dict, seed=0)
+    np.testing.assert_allclose([lower, upper], expected, atol=0.01)
+
+    intervals = bootstrap_CI_prob_all_cats(data_f, data_u, category_dict, seed=0)
+    assert (intervals["lower_bound"] <= intervals["prob"]).all()
+    assert (intervals["prob"] <= intervals["upper_bound"]).all()
+
+
+def test_bootstrap_reproducible_with_global_seed():
+    data_f, data_u, category_dict = make_targets(seed=1)
+    np.random.seed(42)
+    first = bootstrap_CI_prob_cat(data_f, data_u, "Art", category_dict, iterations=200)
+    np.random.seed(42)
+    assert bootstrap_CI_prob_cat(data_f, data_u, "Art", category_dict, iterations=200) == first
+    assert bootstrap_CI_prob_cat(data_f, data_u, "Art", category_dict, iterations=200, seed=3) == (
+        bootstrap_CI_prob_cat(data_f, data_u, "Art", category_dict, iterations=200, seed=3)
+    )
+
+
+def baseline_category_transitions(nodes, connections, start_col, end_col):
+    graph = nx.DiGraph()
+    for _, node in nodes.iterrows():
+        graph.add_node(node["broad_category"])
+    for _, row in connections.iterrows():
+        start_category = row[start_col]
+        end_category = row[end_col]
+        if graph.has_edge(start_category, end_category):
+            graph[start_category][end_category]["size"] += 1
+        else:
+            graph.add_edge(start_category, end_category, size=1)
+    return graph
+
+
+def make_click_connections(seed=0):
+    """One row per click of synthetic paths (back-clicks skipped), with the categories of both pages."""
+    articles, categories = synthetic_articles(120, seed=seed)
+    links = synthetic_links(articles, mean_out_degree=8, seed=seed)
+    finished, _, _ = synthetic_games(400, articles, links, backclick_rate=0.2, seed=seed)
+    first = categories.drop_duplicates("article").set_index("article")
+    clicks = [
+        (start, end)
+        for path in finished["path"]
+        for start, end in zip(path[:-1], path[1:])
+        if BACKCLICK not in (start, end)
+    ]
+    connections = pd.DataFrame(clicks, columns=["start", "end"])
+    for side in ("start", "end"):
+        connections[side + "_broad_category"] = first.loc[connections[side], "broad_category"].to_numpy()
+        connections[side + "_category"] = first.loc[connections[side], "category"].to_numpy()
+    return categories, connections
+
+
+@pytest.mark.parametrize("level", ["broad_category", "category"])
+def test_category_transition_matrix_matches_networkx_baseline(level):
+    categories, connections = make_click_connections()
+    start_col, end_col = "start_" + level, "end_" + level
+    # the baseline takes its nodes from a 'broad_category' column
+    nodes = pd.DataFrame({"broad_category": pd.unique(categories[level])})
+    graph = baseline_category_transitions(nodes, connections, start_col, end_col)
+
+    labels = pd.unique(nodes["broad_category"])
+    weights, order = category_transition_matrix(connections, labels=labels, start_col=start_col, end_col=end_col)
+    assert list(order[: len(labels)]) == list(labels)
+    assert weights.sum() == len(connections) == sum(size for _, _, size in graph.edges(data="size"))
+
+    expected = nx.to_numpy_array(graph, nodelist=list(order), weight="size", dtype=np.int64)
+    np.testing.assert_array_equal(weights.toarray(), expected)
+
+
+def test_category_transition_matrix_appends_unlisted_categories():
+    connections = pd.DataFrame(
+        {"start_broad_category": ["Art", "Music", "Art"], "end_broad_category": ["Music", "Science", "Music"]}
+    )
+    weights, labels = category_transition_matrix(connections, labels=["History", "Art"])
+    assert list(labels) == ["History", "Art", "Music", "Science"]
+    np.testing.assert_array_equal(
+        weights.toarray(), [[0, 0, 0, 0], [0, 0, 2, 0], [0, 0, 0, 1], [0, 0, 0, 0]]
+    )
@@ -0,0 +1,79 @@
+""" Tests of the resumable article metrics extraction """
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from utils import article_metrics
+from utils.article_metrics import METRIC_COLUMNS, extract_article_metrics, load_article_metrics
+
+
+def word_metrics(text, stop_words=None):
+    """Stands in for the NLTK metrics, whose corpora are not needed to test the bookkeeping."""
+    metrics = {column: 0 for column in METRIC_COLUMNS[1:]}
+    metrics.update(word_count=len(text.split()), paragraph_count=text.count("\n\n") + 1)
+    return metrics
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    # workers are forked, so they see the patched module
+    monkeypatch.setattr(article_metrics, "compute_article_metrics", word_metrics)
+    monkeypatch.setattr(article_metrics, "_init_worker", lambda: None)
+    articles = tmp_path / "articles"
+    articles.mkdir()
+    for i in range(8):
+        (articles / "Article_{}.txt".format(i)).write_text("word " * (i + 1))
+    (articles / "%C3%81ed%C3%A1n_mac_Gabr%C3%A1in.txt").write_text("a king\n\nof Dál Riata")
+    return articles, str(tmp_path / "article_metrics.csv")
+
+
+def word_counts(output_csv):
+    metrics = load_article_metrics(output_csv)
+    return dict(zip(metrics["article"], metrics["word_count"]))
+
+
+def test_resumes_after_a_partial_run(folder):
+    articles, output_csv = folder
+    assert extract_article_metrics(str(articles), output_csv, processes=2, chunk_size=2) == 9
+    expected = word_counts(output_csv)
+    assert expected["Áedán_mac_Gabráin"] == 5 and expected["Article_7"] == 8
+
+    # an interrupted run: 4 articles written, the last manifest line cut halfway
+    with open(output_csv) as f:
+        lines = f.readlines()
+    with open(output_csv, "w") as f:
+        f.writelines(lines[:5])
+    manifest_path = output_csv + ".manifest.jsonl"
+    written = set(pd.read_csv(output_csv)["article"])
+    with open(manifest_path) as f:
+        entries = [json.loads(line) for line in f]
+    with open(manifest_path, "w") as f:
+        for entry in entries:
+            if entry["article"] in written:
+                f.write(json.dumps(entry) + "\n")
+        f.write('{"article": "Arti')
+
+    assert extract_article_metrics(str(articles), output_csv, processes=2) == 5
+    assert word_counts(output_csv) == expected
+    assert extract_article_metrics(str(articles), output_csv, processes=2) == 0
+
+
+def test_changed_and_deleted_articles(folder):
+    articles, output_csv = folder
+    extract_article_metrics(str(articles), output_csv, processes=2)
+
+    (articles / "Article_2.txt").write_text("now four words here")
+    os.remove(articles / "Article_5.txt")
+    # touched but unchanged
+    os.utime(articles / "Article_1.txt", ns=(0, 10**18))
+    assert extract_article_metrics(str(articles), output_csv, processes=2) == 1
+
+    counts = word_counts(output_csv)
+    assert counts["Article_2"] == 4 and "Article_5" not in counts and len(counts) == 8
+    assert "Article_5" not in set(pd.read_csv(output_csv)["article"])
+    with open(output_csv + ".manifest.jsonl") as f:
+        assert {json.loads(line)["article"] for line in f} == set(counts)
+    assert extract_article_metrics(str(articles), output_csv, processes=2) == 0
@@ -0,0 +1,54 @@
+""" Tests of the benchmark harness """
+
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from utils.benchmark import compare_results, measure
+from utils.instrumentation import profiling
+
+
+def allocate():
+    return np.ones(1_000_000).sum()
+
+
+def test_measure_keeps_caller_tracing():
+    seconds, peak_mb = measure(allocate, repeat=2)
+    assert seconds > 0 and 7.5 <= peak_mb < 20
+    assert not tracemalloc.is_tracing()
+
+    with profiling(trace_memory=True):
+        _, traced_peak_mb = measure(allocate, repeat=1)
+        assert tracemalloc.is_tracing()
+    assert 7.5 <= traced_peak_mb < 20
+    assert not tracemalloc.is_tracing()
+
+
+def test_compare_results_flags_regressions():
+    baseline = pd.DataFrame(
+        {
+            "function": ["filter_games", "filter_games", "backclick_summary", "removed"],
+            "size": [1000, 10_000, 1000, 1000],
+            "seconds": [1.0, 1.0, 0.001, 1.0],
+            "peak_mb": [10.0, 10.0, 0.1, 1.0],
+        }
+    )
+    results = pd.DataFrame(
+        {
+            "function": ["filter_games", "filter_games", "backclick_summary", "added"],
+            "size": [1000, 10_000, 1000, 1000],
+            # slower, bigger, and slower but below the noise floors
+            "seconds": [1.5, 1.1, 0.005, 1.0],
+            "peak_mb": [10.0, 20.0, 0.5, 1.0],
+        }
+    )
+    comparison = compare_results(results, baseline)
+    assert comparison[["function", "size"]].values.tolist() == [
+        ["filter_games", 1000],
+        ["filter_games", 10_000],
+        ["backclick_summary", 1000],
+    ]
+    assert comparison["regression"].tolist() == [True, True, False]
+    np.testing.assert_allclose(comparison["time_ratio"], [1.5, 1.1, 5.0])
+    assert not compare_results(results, baseline, threshold=1.5)["regression"].iloc[0]
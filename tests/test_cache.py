@@ -0,0 +1,117 @@
+""" Tests of the artifact cache """
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.article_metrics import METRIC_COLUMNS, article_metrics_with_categories
+from utils.cache import INDEX_FILE, ArtifactCache, cached
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ArtifactCache(str(tmp_path / "cache"))
+
+
+def test_key_follows_content_not_mtime(cache, tmp_path):
+    source = tmp_path / "links.tsv"
+    source.write_text("a\tb\n")
+    key = cache.key("links", files=[str(source)], params={"min_length": 2})
+
+    os.utime(source, ns=(0, 10**18))
+    assert cache.key("links", files=[str(source)], params={"min_length": 2}) == key
+    source.write_text("a\tc\n")
+    changed = cache.key("links", files=[str(source)], params={"min_length": 2})
+    assert changed != key
+    assert cache.key("links", files=[str(source)], params={"min_length": 3}) != changed
+    assert cache.key("links", files=[str(source)], params={"min_length": 2}, version="v2") != changed
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=2500)
+    for name in ("a", "b"):
+        cache.put(name, np.zeros(1000, dtype=np.uint8), name=name)
+    cache.get("a")
+    cache.put("c", np.zeros(1000, dtype=np.uint8), name="c")
+    assert [cache.get(name)[0] for name in ("a", "b", "c")] == [True, False, True]
+    assert not os.path.exists(os.path.join(cache.folder, "b.pkl"))
+
+
+def test_index_persists_and_hits_do_not_write(cache):
+    cache.put("key", {"value": 1}, name="stage")
+    index_path = os.path.join(cache.folder, INDEX_FILE)
+    written = os.stat(index_path).st_mtime_ns
+    with open(index_path) as f:
+        created = json.load(f)["artifacts"]["key"]["last_access"]
+
+    hit, value = cache.get("key")
+    assert hit and value == {"value": 1}
+    assert os.stat(index_path).st_mtime_ns == written
+    cache.close()
+
+    with ArtifactCache(cache.folder) as reopened:
+        assert reopened._index["artifacts"]["key"]["last_access"] > created
+        assert reopened.get("key") == (True, {"value": 1})
+
+
+def test_stage_recomputes_only_on_change(cache):
+    calls = []
+
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    first = cache.stage("square", square, params={"x": 3})
+    second = cache.stage("square", square, params={"x": 3})
+    third = cache.stage("square", square, params={"x": 4}, depends=(first.key,))
+    assert (first.hit, second.hit, third.hit) == (False, True, False)
+    assert (second.value, third.value, calls) == (9, 16, [3, 4])
+
+
+def test_cached_decorator_binds_arguments(cache):
+    calls = []
+
+    @cached(cache)
+    def combine(a, /, b=2, *args, scale=1, **kwargs):
+        calls.append(a)
+        return (a + b + sum(args) + sum(kwargs.values())) * scale
+
+    assert combine(1) == 3
+    assert combine(1, 2) == 3
+    assert combine(1, b=2) == 3
+    assert len(calls) == 1
+    assert combine(1, 2, 3, 4, scale=2, extra=5) == 30
+    assert combine(1, 2, 3, 4, scale=2, extra=5) == 30
+    assert combine(1, 2, 3, 4, scale=2, other=5) == 30
+    assert len(calls) == 3
+
+
+def test_article_metrics_with_categories_stage(cache, tmp_path):
+    metrics_file, categories_file = tmp_path / "article_metrics.csv", tmp_path / "categories.tsv"
+    metrics = pd.DataFrame({column: [1, 2] for column in METRIC_COLUMNS})
+    metrics["article"] = ["Áedán_mac_Gabráin", "Zebra"]
+    metrics["stopword_percentage"] = [0.25, 0.5]
+    metrics.to_csv(metrics_file, index=False)
+    categories_file.write_text(
+        "# categories\n"
+        "%C3%81ed%C3%A1n_mac_Gabr%C3%A1in\tsubject.History.British_History\n"
+        "%C3%81ed%C3%A1n_mac_Gabr%C3%A1in\tsubject.People.Historical_figures\n"
+        "Zebra\tsubject.Science.Biology\n"
+    )
+    output = tmp_path / "article_metrics_with_categories.pkl"
+    paths = dict(metrics_file=str(metrics_file), categories_file=str(categories_file), output_file=str(output))
+
+    merged = article_metrics_with_categories(cache=cache, **paths)
+    assert merged["broad_category"].tolist() == ["History", "People", "Science"]
+    assert merged["stopword_percentage"].tolist() == [25.0, 25.0, 50.0]
+    pd.testing.assert_frame_equal(pd.read_pickle(output), merged)
+
+    written = os.stat(output).st_mtime_ns
+    article_metrics_with_categories(cache=cache, **paths)
+    assert os.stat(output).st_mtime_ns == written
+
+    categories_file.write_text("Zebra\tsubject.Science.Biology\n")
+    assert len(article_metrics_with_categories(cache=cache, **paths)) == 1
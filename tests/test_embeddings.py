@@ -0,0 +1,112 @@
+""" Tests of the embedding store against brute-force cosine similarities """
+
+import os
+from urllib.parse import quote
+
+import numpy as np
+import pytest
+
+from utils.embeddings import EmbeddingStore, HashingTfidfEncoder, build_embedding_store
+
+TEXTS = {
+    "World War II": "World War II (1939-1945) was a global war, fought by the Allies and the Axis.",
+    "Éire": "Éire is the Irish name of Ireland, an island in the North Atlantic.",
+    "Bath, Somerset": "Bath is a city in Somerset, known for its Roman baths.",
+    "Ireland": "Ireland is an island; the Republic of Ireland covers most of it.",
+    "Cold War": "The Cold War followed World War II, from 1947 to 1991.",
+}
+
+
+@pytest.fixture()
+def article_folder(tmp_path):
+    folder = tmp_path / "plaintext"
+    folder.mkdir()
+    for name, text in TEXTS.items():
+        (folder / (quote(name, safe="") + ".txt")).write_text(text, encoding="utf-8")
+    return str(folder)
+
+
+def brute_force_cosine(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def test_tokens_keep_punctuated_words():
+    encoder = HashingTfidfEncoder(n_features=1 << 16)
+    counts = encoder._term_counts(["war, (1945) War"])
+    expected = encoder._term_counts(["war 1945 war"])
+    np.testing.assert_array_equal(counts, expected)
+    assert counts.sum() == 3
+
+
+def test_store_roundtrip(article_folder, tmp_path):
+    output = str(tmp_path / "store")
+    encoder = HashingTfidfEncoder(n_features=256)
+    store = build_embedding_store(article_folder, output, encoder, batch_size=2, dtype=np.float32)
+    assert sorted(store.articles) == sorted(TEXTS)
+    assert isinstance(store.embeddings, np.memmap)
+
+    loaded = EmbeddingStore.load(output, mmap_mode=None)
+    assert loaded.articles.equals(store.articles)
+    np.testing.assert_array_equal(loaded.embeddings, store.embeddings)
+    np.testing.assert_allclose(np.linalg.norm(loaded.embeddings, axis=1), 1, rtol=1e-6)
+
+    # the stored rows are the normalized encodings of the articles
+    names = list(store.articles)
+    vectors = encoder([TEXTS[name] for name in names])
+    np.testing.assert_allclose(
+        loaded.embeddings, vectors / np.linalg.norm(vectors, axis=1, keepdims=True), rtol=1e-5, atol=1e-7
+    )
+
+
+@pytest.mark.parametrize("fresh", [True, False])
+def test_empty_folder_gives_empty_store(tmp_path, fresh):
+    output = str(tmp_path / "store")
+    if fresh:
+        store = EmbeddingStore.load(output)
+    else:
+        os.makedirs(str(tmp_path / "plaintext"))
+        store = build_embedding_store(str(tmp_path / "plaintext"), output, HashingTfidfEncoder())
+    assert len(store.articles) == 0 and len(store.embeddings) == 0
+    ids = store.ids(["Ireland", "Cold War"])
+    np.testing.assert_array_equal(ids, [-1, -1])
+    assert np.isnan(store.similarity(ids, ids)).all()
+
+
+def test_similarity_matches_brute_force():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(40, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    store = EmbeddingStore(["Article_{}".format(i) for i in range(40)], vectors.astype(np.float16))
+
+    sources = rng.integers(-1, 40, 500)
+    targets = rng.integers(-1, 40, 500)
+    similarities = store.similarity(sources, targets, chunk_size=37)
+    stored = store.embeddings.astype(np.float32)
+    for source, target, similarity in zip(sources, targets, similarities):
+        if source < 0 or target < 0:
+            assert np.isnan(similarity)
+        else:
+            assert similarity == pytest.approx(brute_force_cosine(stored[source], stored[target]), abs=1e-3)
+
+    matrix = store.similarity_matrix([0, 5, 7], [1, 2])
+    for i, a in enumerate([0, 5, 7]):
+        for j, b in enumerate([1, 2]):
+            assert matrix[i, j] == pytest.approx(brute_force_cosine(stored[a], stored[b]), abs=1e-3)
+
+
+def test_path_similarity_matches_per_step_loop():
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(10, 4)).astype(np.float32)
+    store = EmbeddingStore(list("abcdefghij"), vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    paths = [[0, 3, -1, 5], [2], [7, 7, 1]]
+    target_ids = [9, -1, 4]
+    tokens = np.concatenate(paths)
+    offsets = np.concatenate([[0], np.cumsum([len(path) for path in paths])])
+
+    similarities = store.path_similarity(tokens, offsets, target_ids, chunk_size=2)
+    expected = [
+        np.nan if step < 0 or target < 0 else brute_force_cosine(vectors[step], vectors[target])
+        for path, target in zip(paths, target_ids)
+        for step in path
+    ]
+    np.testing.assert_allclose(similarities, expected, rtol=1e-5)
@@ -0,0 +1,54 @@
+""" Tests of the persisted SHAP store """
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from utils import explain
+from utils.explain import explain_games, load_shap_values
+
+
+@pytest.fixture(scope="module")
+def forest():
+    rng = np.random.default_rng(0)
+    X = rng.random((120, 4))
+    y = X[:, 0] + 0.3 * rng.random(120) > 0.6
+    return RandomForestClassifier(5, max_depth=4, random_state=0).fit(X, y), X
+
+
+def test_values_match_tree_explainer(forest, tmp_path):
+    import shap
+
+    model, X = forest
+    ids = np.arange(len(X))
+    result = explain_games(model, X, ids, ["a", "b", "c", "d"], str(tmp_path), chunk_size=50, processes=2)
+    expected = shap.TreeExplainer(model).shap_values(X)
+    expected = expected[:, :, 1] if np.ndim(expected) == 3 else expected[1]
+    order = np.argsort(result.game_ids)
+    np.testing.assert_allclose(np.asarray(result.values)[order], expected, atol=1e-5)
+
+    loaded = load_shap_values(model, str(tmp_path))
+    np.testing.assert_array_equal(loaded.game_ids, result.game_ids)
+    np.testing.assert_array_equal(loaded.values, result.values)
+
+
+def test_interrupted_save_keeps_previous_store(forest, tmp_path, monkeypatch):
+    model, X = forest
+    ids = np.arange(len(X))
+    before = explain_games(model, X[:60], ids[:60], ["a", "b", "c", "d"], str(tmp_path), processes=1)
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(explain.np, "savez", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        explain_games(model, X, ids, ["a", "b", "c", "d"], str(tmp_path), processes=1)
+    monkeypatch.undo()
+
+    loaded = load_shap_values(model, str(tmp_path))
+    np.testing.assert_array_equal(loaded.game_ids, before.game_ids)
+    np.testing.assert_array_equal(loaded.values, before.values)
+
+    # the next run completes the store from the previous generation
+    after = explain_games(model, X, ids, ["a", "b", "c", "d"], str(tmp_path), processes=1)
+    assert sorted(after.game_ids) == list(ids)
@@ -0,0 +1,75 @@
+""" Tests of the datastory payload export """
+
+import json
+
+import numpy as np
+
+from utils.cache import ArtifactCache
+from utils.export import PlotSpec, encode_payload, export_plots, histogram_payload
+
+
+def constant_payload(value=1.0):
+    return {"value": value}
+
+
+def noisy_payload(n=2000):
+    return {"values": np.random.default_rng(0).random(n)}
+
+
+def statuses(report):
+    return dict(zip(report["plot"], report["status"]))
+
+
+def test_params_default_is_not_shared():
+    first, second = PlotSpec("a", constant_payload), PlotSpec("b", constant_payload)
+    assert first.params is None and second.params is None
+
+
+def test_encode_payload_lowers_precision_to_fit():
+    payload = noisy_payload()
+    full, fits = encode_payload(payload, budget=10**9)
+    assert fits
+    budget = int(len(full) * 0.75)
+    data, fits = encode_payload(payload, budget=budget)
+    assert fits and len(data) <= budget
+    np.testing.assert_allclose(json.loads(data)["values"], payload["values"], rtol=1e-2)
+    _, fits = encode_payload(payload, budget=100)
+    assert not fits
+
+
+def test_histogram_payload_matches_numpy():
+    samples = np.random.default_rng(0).normal(size=1000)
+    payload = histogram_payload({"normal": samples, "shifted": samples + 1}, bins=20)
+    edges = np.histogram_bin_edges(np.concatenate([samples, samples + 1]), bins=20)
+    assert payload["series"]["normal"].tolist() == np.histogram(samples, bins=edges)[0].tolist()
+    assert payload["series"]["shifted"].tolist() == np.histogram(samples + 1, bins=edges)[0].tolist()
+    np.testing.assert_allclose(payload["edges"], edges)
+
+
+def test_export_skips_unchanged_plots(tmp_path):
+    source = tmp_path / "input.txt"
+    source.write_text("v1")
+    output, cache = str(tmp_path / "plots"), ArtifactCache(str(tmp_path / "cache"))
+    specs = [
+        PlotSpec("constant", constant_payload, (str(source),)),
+        PlotSpec("scaled", constant_payload, (str(source),), {"value": 2.0}),
+        PlotSpec("missing", constant_payload, (str(tmp_path / "absent"),)),
+        PlotSpec("large", noisy_payload, budget=100),
+    ]
+
+    report = export_plots(specs, output, processes=2, cache=cache)
+    assert statuses(report) == {
+        "constant": "built",
+        "scaled": "built",
+        "missing": "missing inputs",
+        "large": "over budget",
+    }
+    with open(tmp_path / "plots" / "scaled.json") as f:
+        assert json.load(f) == {"value": 2.0}
+
+    report = export_plots(specs, output, processes=2, cache=cache)
+    assert statuses(report)["constant"] == "unchanged" and statuses(report)["scaled"] == "unchanged"
+
+    source.write_text("v2")
+    report = export_plots(specs[:2], output, processes=2, cache=cache)
+    assert set(report["status"]) == {"built"}
@@ -0,0 +1,99 @@
+""" Tests of the id-based design matrix against the merge-based feature table """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analysis import build_article_index
+from utils.embeddings import EmbeddingStore
+from utils.features import METRICS, GameFeatureBuilder, build_article_features
+from utils.shortest_paths import UNREACHABLE, ShortestPathOracle, build_link_graph
+from utils.synthetic import synthetic_articles, synthetic_links
+
+
+@pytest.fixture(scope="module")
+def setup():
+    rng = np.random.default_rng(0)
+    articles, categories = synthetic_articles(60, seed=1)
+    links = synthetic_links(articles, mean_out_degree=4, seed=1)
+    metrics = pd.DataFrame(rng.random((len(articles), len(METRICS))), columns=METRICS)
+    metrics.insert(0, "article", articles["article"])
+    metrics.loc[3, METRICS[0]] = np.nan
+    # an article without categories
+    categories = categories[categories["article"] != articles["article"][4]]
+    matrix = rng.integers(1, 8, (len(articles), len(articles))).astype(np.uint8)
+    matrix[1, 2] = UNREACHABLE
+    vectors = rng.normal(size=(len(articles) - 1, 8)).astype(np.float32)
+    embeddings = EmbeddingStore(articles["article"][1:], vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+
+    names = np.append(articles["article"].to_numpy(), "Unknown_article")
+    starts = names[rng.integers(0, len(names), 500)]
+    targets = names[rng.integers(0, len(names), 500)]
+    # unreachable pair, NaN metric, article without embedding, article without categories
+    starts[:4] = articles["article"].to_numpy()[[1, 3, 0, 4]]
+    targets[:4] = articles["article"].to_numpy()[[2, 2, 2, 5]]
+    return articles, categories, links, metrics, matrix, embeddings, starts, targets
+
+
+def merged_features(articles, categories, links, metrics, matrix, embeddings, starts, targets):
+    """The feature table built with string merges, as before the builder."""
+    games = pd.DataFrame({"start": starts, "target": targets})
+    indicators = pd.crosstab(categories["article"], categories["broad_category"]).clip(upper=1)
+    indicators = indicators.iloc[:, 1:]
+    for side in ("start", "target"):
+        side_indicators = indicators.add_prefix(side + "_broad_category[T.").rename(columns=lambda c: c + "]")
+        games = games.merge(side_indicators, how="left", left_on=side, right_index=True)
+        games[side_indicators.columns] = games[side_indicators.columns].fillna(0)
+    for side in ("start", "target"):
+        side_metrics = metrics.set_index("article").add_prefix(side + "_")
+        games = games.merge(side_metrics, how="left", left_on=side, right_index=True)
+    games["links_from_source"] = games["start"].map(links["linkSource"].value_counts()).fillna(0)
+    games["links_to_target"] = games["target"].map(links["linkTarget"].value_counts()).fillna(0)
+
+    article_index = build_article_index(articles)
+    known = games["start"].isin(article_index.index) & games["target"].isin(article_index.index)
+    lengths = np.full(len(games), np.nan)
+    lengths[known] = matrix[
+        article_index[games["start"][known]].to_numpy(), article_index[games["target"][known]].to_numpy()
+    ]
+    games["shortest_path_length"] = np.where(lengths == UNREACHABLE, np.nan, lengths)
+
+    vectors = pd.DataFrame(np.asarray(embeddings.embeddings), index=embeddings.articles)
+    start_vectors = vectors.reindex(games["start"]).to_numpy()
+    target_vectors = vectors.reindex(games["target"]).to_numpy()
+    games["sims_start_target"] = np.einsum("ij,ij->i", start_vectors, target_vectors)
+    games = games.drop(columns=["start", "target"])
+    return games[games.notna().all(axis=1)]
+
+
+def test_design_matrix_matches_merged_features(setup):
+    articles, categories, links, metrics, matrix, embeddings, starts, targets = setup
+    features = build_article_features(metrics, categories, links)
+    builder = GameFeatureBuilder(
+        features, build_article_index(articles), shortest_paths=matrix, embeddings=embeddings
+    )
+    design = builder.transform(starts, targets)
+    expected = merged_features(articles, categories, links, metrics, matrix, embeddings, starts, targets)
+
+    assert design.rows.tolist() == expected.index.tolist()
+    assert not set(design.rows) & {0, 1, 2}
+    assert 3 in design.rows
+    X = pd.DataFrame(design.X.toarray(), columns=design.feature_names)
+    pd.testing.assert_frame_equal(
+        X, expected[design.feature_names].reset_index(drop=True), check_dtype=False, atol=1e-6
+    )
+
+
+def test_article_index_is_required_for_a_matrix(setup):
+    articles, categories, links, metrics, matrix, _, starts, targets = setup
+    features = build_article_features(metrics, categories, links)
+    with pytest.raises(ValueError, match="article_index"):
+        GameFeatureBuilder(features, shortest_paths=matrix)
+
+    oracle = ShortestPathOracle(build_link_graph(links, articles["article"]), distances=matrix)
+    from_oracle = GameFeatureBuilder(features, shortest_paths=oracle).transform(starts, targets)
+    expected = GameFeatureBuilder(features, build_article_index(articles), shortest_paths=matrix).transform(
+        starts, targets
+    )
+    assert from_oracle.rows.tolist() == expected.rows.tolist()
+    assert (from_oracle.X != expected.X).nnz == 0
@@ -0,0 +1,127 @@
+""" Tests of the vectorized hypothesis tests against scipy """
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from utils.hypothesis import adjust_pvalues, compare_groups
+
+
+@pytest.fixture(scope="module")
+def games():
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame(
+        {
+            "finished": rng.random(n) < 0.6,
+            "category": rng.choice(["Art", "History", "Science"], size=n),
+            # rounded values, so that Mann-Whitney has ties
+            "length": np.round(rng.lognormal(1.8, 0.5, size=n)),
+            "duration": rng.gamma(2.0, 30.0, size=n),
+        }
+    )
+    df.loc[df["finished"], "duration"] *= 1.1
+    df.loc[rng.random(n) < 0.05, "duration"] = np.nan
+    return df
+
+
+def _scipy_tests(class_1, class_0):
+    both = np.concatenate([class_1, class_0])
+    labels = np.concatenate([np.ones(len(class_1)), np.zeros(len(class_0))])
+    return {
+        "welch": stats.ttest_ind(class_1, class_0, equal_var=False),
+        "pointbiserial": stats.pointbiserialr(labels, both),
+        "mannwhitney": stats.mannwhitneyu(class_1, class_0, method="asymptotic"),
+    }
+
+
+def test_tests_match_scipy(games):
+    results = compare_groups(games, ["length", "duration"], "finished", by="category", correction=None)
+    assert len(results) == 4 * 2 * 3
+    for row in results.itertuples():
+        rows = games if row.group == "all" else games[games["category"] == row.group]
+        values = rows[row.metric]
+        valid = values.notna()
+        class_1 = values[valid & rows["finished"]].to_numpy()
+        class_0 = values[valid & ~rows["finished"]].to_numpy()
+        expected = _scipy_tests(class_1, class_0)[row.test]
+        assert (row.n_1, row.n_0) == (len(class_1), len(class_0))
+        np.testing.assert_allclose(row.statistic, expected.statistic, rtol=1e-8)
+        np.testing.assert_allclose(row.pvalue, expected.pvalue, rtol=1e-6, atol=1e-300)
+
+
+def test_permutation_pvalues_match_scipy(games):
+    results = compare_groups(
+        games.iloc[:400], ["length"], "finished", tests=(), n_permutations=20_000, correction=None, seed=0
+    )
+    rows = games.iloc[:400]
+    expected = stats.permutation_test(
+        (rows.loc[rows["finished"], "length"], rows.loc[~rows["finished"], "length"]),
+        lambda x, y: np.mean(x) - np.mean(y),
+        n_resamples=20_000,
+        random_state=0,
+    )
+    assert abs(results["pvalue"].iloc[0] - expected.pvalue) < 0.02
+
+
+@pytest.fixture(scope="module")
+def offset_games():
+    # timestamp-like metrics: a large offset with a small spread and a real class shift
+    rng = np.random.default_rng(2)
+    n = 76_000
+    finished = rng.random(n) < 0.5
+    return pd.DataFrame(
+        {
+            "finished": finished,
+            "timestamp": 1.3e9 + rng.normal(0, 50, size=n) + 3 * finished,
+            "offset": 1e6 + rng.normal(0, 10, size=n) + 0.35 * finished,
+        }
+    )
+
+
+def test_large_offsets_match_scipy(offset_games):
+    results = compare_groups(offset_games, ["timestamp", "offset"], "finished", correction=None)
+    for row in results.itertuples():
+        values = offset_games[row.metric]
+        class_1, class_0 = values[offset_games["finished"]], values[~offset_games["finished"]]
+        expected = _scipy_tests(class_1.to_numpy(), class_0.to_numpy())[row.test]
+        np.testing.assert_allclose(row.statistic, expected.statistic, rtol=1e-6)
+        np.testing.assert_allclose(row.pvalue, expected.pvalue, rtol=1e-4)
+
+
+def test_large_offset_permutation_matches_scipy(offset_games):
+    results = compare_groups(
+        offset_games, ["offset"], "finished", tests=(), n_permutations=1000, correction=None, seed=0
+    )
+    finished = offset_games["finished"]
+    expected = stats.permutation_test(
+        (offset_games.loc[finished, "offset"], offset_games.loc[~finished, "offset"]),
+        lambda x, y, axis: np.mean(x, axis=axis) - np.mean(y, axis=axis),
+        n_resamples=1000,
+        vectorized=True,
+        batch=250,
+        random_state=0,
+    )
+    assert expected.pvalue < 0.05
+    assert abs(results["pvalue"].iloc[0] - expected.pvalue) < 0.01
+
+
+def test_adjust_pvalues():
+    rng = np.random.default_rng(1)
+    pvalues = np.concatenate([rng.random(40) ** 3, [np.nan]])
+    p = pvalues[:-1]
+
+    np.testing.assert_allclose(adjust_pvalues(pvalues, "fdr_bh")[:-1], stats.false_discovery_control(p))
+    np.testing.assert_allclose(adjust_pvalues(pvalues, "bonferroni")[:-1], np.minimum(p * len(p), 1))
+    # Holm: the k-th smallest p-value times (m - k), made monotone
+    holm = np.empty(len(p))
+    running = 0.0
+    for k, i in enumerate(np.argsort(p)):
+        running = max(running, min(p[i] * (len(p) - k), 1.0))
+        holm[i] = running
+    np.testing.assert_allclose(adjust_pvalues(pvalues, "holm")[:-1], holm)
+    assert np.isnan(adjust_pvalues(pvalues)[-1])
+
+    with pytest.raises(ValueError):
+        adjust_pvalues(pvalues, "sidak")
@@ -0,0 +1,142 @@
+""" Tests of the columnar dataset ingestion against pandas loaders of the raw files """
+
+import mmap
+import os
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.ingest import compact_games, ingest_all, ingest_games, ingest_shortest_paths, load_games, load_vocabulary
+from utils.shortest_paths import parse_distance_rows
+from utils.synthetic import (
+    synthetic_articles,
+    synthetic_distance_matrix,
+    synthetic_games,
+    synthetic_links,
+    write_raw_files,
+)
+
+FINISHED_COLUMNS = ["hashedIpAddress", "timestamp", "durationInSec", "path", "rating"]
+UNFINISHED_COLUMNS = ["hashedIpAddress", "timestamp", "durationInSec", "path", "target", "type"]
+
+
+@pytest.fixture(scope="module")
+def raw_folder(tmp_path_factory):
+    articles, categories = synthetic_articles(n_articles=60, seed=4)
+    # names that need URL-encoding in the raw files
+    renamed = {"Article_1": "Éire", "Article_2": "Bath, Somerset", "Article_3": "War (1945)"}
+    articles["article"] = articles["article"].replace(renamed)
+    categories["article"] = categories["article"].replace(renamed)
+    links = synthetic_links(articles, mean_out_degree=26, seed=4)
+    finished, unfinished, _ = synthetic_games(900, articles, links, seed=4)
+    finished["rating"] = np.where(np.arange(len(finished)) % 4 == 0, np.nan, np.arange(len(finished)) % 5 + 1)
+    folder = str(tmp_path_factory.mktemp("raw"))
+    write_raw_files(folder, articles, categories, links, finished, unfinished)
+    return folder
+
+
+def read_raw_games(raw_folder, table, columns):
+    """Baseline loader of a raw game log."""
+    games = pd.read_csv(os.path.join(raw_folder, table + ".tsv"), sep="\t", comment="#", names=columns)
+    games["path"] = games["path"].map(lambda path: [unquote(page) for page in path.split(";")])
+    if "target" in games:
+        games["target"] = games["target"].map(unquote)
+    return games
+
+
+def memory_mapped(array):
+    while array is not None:
+        if isinstance(array, mmap.mmap):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def test_round_trip_matches_pandas_loaders(raw_folder, tmp_path):
+    dataset = str(tmp_path / "dataset")
+    ingest_all(dataset, raw_folder, chunk_rows=128)
+
+    for table, columns in (("paths_finished", FINISHED_COLUMNS), ("paths_unfinished", UNFINISHED_COLUMNS)):
+        expected = read_raw_games(raw_folder, table, columns)
+        games, paths = load_games(table, dataset=dataset, columns=columns)
+        assert len(games) == len(expected)
+        np.testing.assert_array_equal(games["hashedIpAddress"], expected["hashedIpAddress"])
+        np.testing.assert_array_equal(games["timestamp"], expected["timestamp"])
+        np.testing.assert_array_equal(games["durationInSec"], expected["durationInSec"])
+        assert paths.to_series().tolist() == expected["path"].tolist()
+        if table == "paths_finished":
+            np.testing.assert_array_equal(games["rating"], expected["rating"])
+        else:
+            np.testing.assert_array_equal(games["target"], expected["target"])
+            np.testing.assert_array_equal(games["type"], expected["type"])
+
+    articles = pd.read_csv(os.path.join(raw_folder, "articles.tsv"), sep="\t", comment="#", names=["article"])
+    with open(os.path.join(raw_folder, "shortest-path-distance-matrix.txt")) as f:
+        rows = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    distances = np.load(os.path.join(dataset, "shortest_paths", "distances.npy"))
+    np.testing.assert_array_equal(distances, parse_distance_rows(rows))
+    ids = np.load(os.path.join(dataset, "shortest_paths", "article.npy"))
+    assert load_vocabulary(dataset)[ids].tolist() == articles["article"].map(unquote).tolist()
+
+
+def test_single_partition_is_memory_mapped(raw_folder, tmp_path):
+    dataset = str(tmp_path / "dataset")
+    ingest_all(dataset, raw_folder, chunk_rows=128)
+    games, paths = load_games("paths_finished", columns=["timestamp", "durationInSec", "path"], dataset=dataset)
+    for column in ("timestamp", "durationInSec"):
+        assert memory_mapped(games[column].to_numpy())
+    assert memory_mapped(paths.tokens) and memory_mapped(paths.offsets)
+    assert os.listdir(os.path.join(dataset, "paths_finished")) == ["compact-00001"]
+
+
+def test_incremental_ingestion_matches_full(raw_folder, tmp_path):
+    raw_file = os.path.join(raw_folder, "paths_unfinished.tsv")
+    with open(raw_file) as f:
+        lines = f.readlines()
+    partial = str(tmp_path / "paths_unfinished.tsv")
+    with open(partial, "w") as f:
+        f.writelines(lines[: len(lines) // 2])
+
+    incremental, full = str(tmp_path / "incremental"), str(tmp_path / "full")
+    ingest_games("paths_unfinished", partial, incremental, chunk_rows=50)
+    with open(partial, "a") as f:
+        f.writelines(lines[len(lines) // 2 :])
+    ingest_games("paths_unfinished", partial, incremental, chunk_rows=50)
+    ingest_games("paths_unfinished", raw_file, full, chunk_rows=50)
+
+    columns = ["hashedIpAddress", "timestamp", "target", "type", "path_length", "path"]
+    games, paths = load_games("paths_unfinished", columns=columns, dataset=incremental)
+    expected, expected_paths = load_games("paths_unfinished", columns=columns, dataset=full)
+    pd.testing.assert_frame_equal(games, expected)
+    assert paths.to_series().tolist() == expected_paths.to_series().tolist()
+
+
+def test_uncompacted_partitions_load_the_same(raw_folder, tmp_path):
+    raw_file = os.path.join(raw_folder, "paths_finished.tsv")
+    dataset = str(tmp_path / "dataset")
+    assert len(ingest_games("paths_finished", raw_file, dataset, chunk_rows=100, compact=False)) > 1
+    games, paths = load_games("paths_finished", columns=["timestamp", "rating", "path"], dataset=dataset)
+    compact_games("paths_finished", dataset)
+    compacted, compacted_paths = load_games("paths_finished", columns=["timestamp", "rating", "path"], dataset=dataset)
+    pd.testing.assert_frame_equal(games, compacted)
+    assert paths.to_series().tolist() == compacted_paths.to_series().tolist()
+
+
+@pytest.mark.parametrize("drop", ["row", "column"])
+def test_short_distance_matrix_raises(tmp_path, drop):
+    articles, categories = synthetic_articles(n_articles=12, seed=1)
+    links = synthetic_links(articles, mean_out_degree=3, seed=1)
+    distances = synthetic_distance_matrix(articles, links)
+    distances = distances[:-1] if drop == "row" else distances[:, :-1]
+    finished, unfinished, _ = synthetic_games(20, articles, links, seed=1)
+    raw = str(tmp_path / "raw")
+    write_raw_files(raw, articles, categories, links, finished, unfinished, distances=distances)
+
+    dataset = str(tmp_path / "dataset")
+    with pytest.raises(ValueError):
+        ingest_shortest_paths(
+            os.path.join(raw, "shortest-path-distance-matrix.txt"), os.path.join(raw, "articles.tsv"), dataset
+        )
+    assert not os.path.exists(os.path.join(dataset, "shortest_paths", "distances.npy"))
@@ -0,0 +1,32 @@
+""" Tests of the profiling instrumentation """
+
+import tracemalloc
+
+import numpy as np
+
+from utils.instrumentation import instrument, profiling
+
+
+@instrument(name="allocate")
+def allocate(n):
+    return np.ones(n)
+
+
+def test_spans_record_rows_and_memory():
+    with profiling(trace_memory=True) as profile:
+        allocate(1_000_000)
+    summary = profile.summary()
+    assert summary.loc["allocate", "calls"] == 1
+    assert summary.loc["allocate", "rows_out"] == 1_000_000
+    assert summary.loc["allocate", "peak_mb"] >= 7.5
+    assert not tracemalloc.is_tracing()
+
+
+def test_caller_tracing_is_left_running():
+    tracemalloc.start()
+    try:
+        with profiling(trace_memory=True):
+            allocate(10)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,47 @@
+""" Tests of the parallel cross-validation of the quit-prediction models """
+
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold, cross_validate
+
+from utils.model_selection import cross_validate_grid, parameter_grid, summarize_cv_results
+
+
+@pytest.fixture(scope="module")
+def problem():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 5))
+    y = (X[:, 0] + 0.5 * X[:, 1] + rng.normal(size=300) > 0).astype(np.int64)
+    return X, y
+
+
+def test_parameter_grid():
+    assert parameter_grid({"C": [1, 2], "penalty": ["l2"]}) == [
+        {"C": 1, "penalty": "l2"},
+        {"C": 2, "penalty": "l2"},
+    ]
+
+
+@pytest.mark.parametrize("as_sparse", [False, True])
+def test_fold_scores_match_sklearn(problem, as_sparse):
+    X, y = problem
+    grid = {"C": [0.01, 1.0]}
+    results = cross_validate_grid(
+        LogisticRegression(), grid, sparse.csr_matrix(X) if as_sparse else X, y, n_splits=4, processes=2, seed=3
+    )
+    assert len(results) == 2 * 4
+    assert (results["fit_time"] > 0).all() and (results["peak_memory_mb"] > 0).all()
+
+    folds = StratifiedKFold(n_splits=4, shuffle=True, random_state=3)
+    for config_id, params in enumerate(parameter_grid(grid)):
+        expected = cross_validate(
+            LogisticRegression(**params), X, y, cv=folds, scoring=["accuracy", "f1", "precision", "recall"]
+        )
+        rows = results[results["config_id"] == config_id]
+        for metric in ("accuracy", "f1", "precision", "recall"):
+            np.testing.assert_allclose(rows[metric].to_numpy(), expected["test_" + metric], rtol=1e-6)
+
+    summary = summarize_cv_results(results)
+    assert len(summary) == 2 and summary[("f1", "mean")].is_monotonic_decreasing
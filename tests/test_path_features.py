@@ -0,0 +1,117 @@
+""" Tests of the chunked per-step path features against a per-path loop """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analysis import MISSING_PATH, build_article_index
+from utils.embeddings import EmbeddingStore
+from utils.path_features import iter_path_progress, path_progress_features
+from utils.path_store import PathStore
+from utils.preprocessing import BACKCLICK
+from utils.shortest_paths import UNREACHABLE
+from utils.synthetic import synthetic_articles, synthetic_games, synthetic_links
+
+
+@pytest.fixture(scope="module")
+def setup():
+    rng = np.random.default_rng(2)
+    articles, _ = synthetic_articles(80, seed=2)
+    links = synthetic_links(articles, mean_out_degree=6, seed=2)
+    finished, unfinished, _ = synthetic_games(600, articles, links, backclick_rate=0.25, seed=2)
+    games = pd.concat([finished, unfinished], ignore_index=True)
+    # a hand-written path going back twice in a row and one back to its first page
+    games["path"] = [
+        ["Article_1", "Article_2", "Article_3", BACKCLICK, BACKCLICK, "Article_4"],
+        ["Article_5", "Article_6", BACKCLICK],
+    ] + games["path"].tolist()[2:]
+    targets = games["target"].to_numpy(dtype=object)
+    targets[2] = "Unknown_article"
+    targets[0] = "Article_4"
+
+    names = articles["article"].to_numpy()
+    matrix = rng.integers(1, 9, (len(names), len(names))).astype(np.uint8)
+    matrix[rng.random(matrix.shape) < 0.2] = UNREACHABLE
+    np.fill_diagonal(matrix, 0)
+    out_degree = links["linkSource"].value_counts().reindex(names, fill_value=0).to_numpy()
+    vectors = rng.normal(size=(len(names) - 10, 8)).astype(np.float32)
+    # the last ten articles have no embedding
+    embeddings = EmbeddingStore(names[:-10], vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    return games, targets, build_article_index(articles), matrix, out_degree, embeddings
+
+
+def progress_loop(paths, targets, article_index, matrix, out_degree, embeddings):
+    """Reference: resolve the back-clicks of every path with a stack and look up each step."""
+    rows = []
+    for game, (path, target) in enumerate(zip(paths, targets)):
+        stack = []
+        for page in path:
+            if page == BACKCLICK:
+                stack.pop()
+            else:
+                stack.append(page)
+        for step, page in enumerate(stack):
+            source, goal = article_index.get(page), article_index.get(target)
+            distance = MISSING_PATH
+            if source is not None and goal is not None and matrix[source, goal] != UNREACHABLE:
+                distance = int(matrix[source, goal])
+            similarity = np.nan
+            if page in embeddings.articles and target in embeddings.articles:
+                a = embeddings.embeddings[embeddings.articles.get_loc(page)]
+                b = embeddings.embeddings[embeddings.articles.get_loc(target)]
+                similarity = float(np.dot(a, b))
+            rows.append(
+                {
+                    "game_id": game,
+                    "step": step,
+                    "progress": step / (len(stack) - 1) if len(stack) > 1 else 1.0,
+                    "distance_to_target": distance,
+                    "out_degree": int(out_degree[source]) if source is not None else MISSING_PATH,
+                    "similarity_to_target": similarity,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 100_000])
+def test_matches_per_path_loop(setup, chunk_size):
+    games, targets, article_index, matrix, out_degree, embeddings = setup
+    paths = PathStore.from_paths(games["path"])
+    features = path_progress_features(
+        paths,
+        targets,
+        article_index=article_index,
+        shortest_paths=matrix,
+        out_degree=out_degree,
+        embeddings=embeddings,
+        chunk_size=chunk_size,
+    )
+    expected = progress_loop(games["path"], targets, article_index, matrix, out_degree, embeddings)
+    pd.testing.assert_frame_equal(features, expected, check_dtype=False, atol=1e-6)
+
+    # the hand-written paths: back-clicks undone, and a target unknown to every source
+    assert features.loc[features["game_id"] == 0, "step"].tolist() == [0, 1]
+    assert features.loc[features["game_id"] == 0, "distance_to_target"].iloc[-1] == 0
+    assert features.loc[features["game_id"] == 1, "progress"].tolist() == [1.0]
+    unknown = features[features["game_id"] == 2]
+    assert (unknown["distance_to_target"] == MISSING_PATH).all()
+    assert unknown["similarity_to_target"].isna().all()
+    assert (features["distance_to_target"] == MISSING_PATH).sum() > unknown.shape[0]
+
+
+def test_chunks_cover_games_once(setup):
+    games, targets, _, _, _, _ = setup
+    paths = PathStore.from_paths(games["path"])
+    game_ids = np.arange(len(games)) * 10
+    chunks = list(iter_path_progress(paths, targets, game_ids=game_ids, chunk_size=50))
+    assert len(chunks) == -(-len(games) // 50)
+    features = pd.concat(chunks, ignore_index=True)
+    assert list(features.columns) == ["game_id", "step", "progress"]
+    np.testing.assert_array_equal(np.unique(features["game_id"]), game_ids)
+    assert features.groupby("game_id")["progress"].max().eq(1).all()
+
+
+def test_feature_sources_need_article_index(setup):
+    games, targets, _, matrix, _, _ = setup
+    with pytest.raises(ValueError):
+        path_progress_features(PathStore.from_paths(games["path"]), targets, shortest_paths=matrix)
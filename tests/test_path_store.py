@@ -0,0 +1,73 @@
+""" Tests of the path store and of the functions accepting it instead of a 'path' column """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analysis import shortest_path_find
+from utils.path_store import PathStore
+from utils.preprocessing import filter_games
+from utils.synthetic import synthetic_articles, synthetic_games, synthetic_links
+
+
+@pytest.fixture(scope="module")
+def games():
+    articles, _ = synthetic_articles(200, seed=0)
+    links = synthetic_links(articles, seed=0)
+    finished, unfinished, _ = synthetic_games(3000, articles, links, n_players=150, seed=0)
+    return articles, finished, unfinished
+
+
+def test_roundtrip(games, tmp_path):
+    _, finished, _ = games
+    store = PathStore.from_paths(finished["path"])
+    store.save(str(tmp_path))
+    loaded = PathStore.load(str(tmp_path))
+    assert len(loaded) == len(finished)
+    assert list(loaded) == finished["path"].tolist()
+    assert loaded.to_series().tolist() == finished["path"].tolist()
+
+
+@pytest.mark.parametrize(
+    "selection",
+    [slice(10, 50), slice(None, None, 3), slice(-20, None), slice(40, 10), [5, 0, 5, -1], "mask"],
+)
+def test_selection_matches_list_indexing(games, selection):
+    _, finished, _ = games
+    paths = finished["path"].tolist()
+    store = PathStore.from_paths(paths)
+    if isinstance(selection, str):
+        selection = np.random.default_rng(0).random(len(paths)) < 0.3
+        expected = [path for path, keep in zip(paths, selection) if keep]
+    elif isinstance(selection, slice):
+        expected = paths[selection]
+    else:
+        expected = [paths[i] for i in selection]
+    sub = store[selection if not isinstance(selection, list) else np.array(selection)]
+    assert isinstance(sub, PathStore)
+    assert list(sub) == expected
+    np.testing.assert_array_equal(sub.lengths(), [len(path) for path in expected])
+
+
+def test_filter_games_with_path_stores(games):
+    _, finished, unfinished = games
+    expected = filter_games(finished, unfinished, min_games=5, verbose=False)
+    stores = (PathStore.from_paths(finished["path"]), PathStore.from_paths(unfinished["path"]))
+    result = filter_games(
+        finished.drop(columns="path"), unfinished.drop(columns="path"), min_games=5, verbose=False, paths=stores
+    )
+    pd.testing.assert_frame_equal(result.finished, expected.finished.drop(columns="path"))
+    pd.testing.assert_frame_equal(result.unfinished, expected.unfinished.drop(columns="path"))
+    assert list(result.paths_finished) == expected.finished["path"].tolist()
+    assert list(result.paths_unfinished) == expected.unfinished["path"].tolist()
+    assert result.stats == expected.stats
+
+
+def test_shortest_path_find_with_path_store(games):
+    articles, _, unfinished = games
+    matrix = np.random.default_rng(0).integers(1, 9, (len(articles), len(articles)))
+    expected, expected_missing = shortest_path_find(unfinished, articles, matrix)
+    store = PathStore.from_paths(unfinished["path"])
+    lengths, missing = shortest_path_find(unfinished.drop(columns="path"), articles, matrix, paths=store)
+    assert missing == expected_missing
+    pd.testing.assert_extension_array_equal(lengths, expected)
@@ -0,0 +1,77 @@
+""" Tests of the incrementally aggregated player store """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.player_store import MAX_TRACKED_LENGTH, PlayerStore
+from utils.preprocessing import filter_games
+from utils.synthetic import synthetic_articles, synthetic_games, synthetic_links
+
+
+@pytest.fixture(scope="module")
+def games():
+    articles, _ = synthetic_articles(200, seed=0)
+    links = synthetic_links(articles, seed=0)
+    finished, unfinished, _ = synthetic_games(3000, articles, links, n_players=150, seed=0)
+    rng = np.random.default_rng(0)
+    # some games without a player
+    for df in (finished, unfinished):
+        df.loc[rng.random(len(df)) < 0.05, "hashedIpAddress"] = np.nan
+    return finished, unfinished
+
+
+def _store(finished, unfinished, batches=3):
+    store = PlayerStore()
+    for kind, df in (("finished", finished), ("unfinished", unfinished)):
+        for batch in np.array_split(np.arange(len(df)), batches):
+            store.update(df.iloc[batch], kind)
+    return store
+
+
+def _expected_num_games(finished, unfinished, min_length, type):
+    unfinished = unfinished if type == "all" else unfinished[unfinished["type"] == type]
+    games = pd.concat([finished, unfinished], ignore_index=True)
+    return games[games["path"].str.len() >= min_length]["hashedIpAddress"].value_counts()
+
+
+@pytest.mark.parametrize("min_length,type", [(0, "restart"), (2, "restart"), (5, "timeout"), (3, "all")])
+def test_num_games_matches_counting(games, min_length, type):
+    finished, unfinished = games
+    num_games = _store(finished, unfinished).num_games(min_length, type)
+    expected = _expected_num_games(finished, unfinished, min_length, type)
+    num_games = num_games[num_games > 0]
+    pd.testing.assert_series_equal(
+        num_games.sort_index(), expected.sort_index(), check_names=False, check_dtype=False
+    )
+
+
+def test_missing_players_are_left_out(games):
+    finished, unfinished = games
+    store = _store(finished, unfinished)
+    players = pd.concat([finished["hashedIpAddress"], unfinished["hashedIpAddress"]])
+    assert set(store.to_frame().index) == set(players.dropna())
+    assert store.to_frame()["games"].sum() == players.notna().sum()
+    assert (store.player_ids([np.nan, finished["hashedIpAddress"].dropna().iloc[0]]) >= 0).tolist() == [False, True]
+
+
+@pytest.mark.parametrize("min_length", [2, MAX_TRACKED_LENGTH + 5])
+def test_filter_games_with_store(games, min_length):
+    finished, unfinished = games
+    store = _store(finished, unfinished)
+    expected = filter_games(finished, unfinished, min_length=min_length, min_games=5, verbose=False)
+    result = filter_games(
+        finished, unfinished, min_length=min_length, min_games=5, verbose=False, player_store=store
+    )
+    pd.testing.assert_frame_equal(result.finished, expected.finished)
+    pd.testing.assert_frame_equal(result.unfinished, expected.unfinished)
+    assert result.stats == expected.stats
+
+
+def test_roundtrip(games, tmp_path):
+    finished, unfinished = games
+    store = _store(finished, unfinished)
+    store.save(str(tmp_path))
+    loaded = PlayerStore.load(str(tmp_path))
+    pd.testing.assert_frame_equal(loaded.to_frame(), store.to_frame())
+    assert loaded.last_timestamp == store.last_timestamp
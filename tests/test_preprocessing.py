@@ -0,0 +1,163 @@
+""" Tests of utils.preprocessing against the original loop-based implementations """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.preprocessing import (
+    backclick_summary,
+    build_category_index,
+    category_index_codes,
+    create_category_dictionaries,
+    filter_games,
+    filter_games_chunked,
+    filter_games_grid,
+    get_backclicked_pages,
+    get_quitted_page,
+)
+from utils.synthetic import synthetic_articles, synthetic_games, synthetic_links
+
+
+def baseline_create_category_dictionaries(categories):
+    article_to_category = {}
+    article_to_broad_category = {}
+    for i in range(len(categories)):
+        article = categories.iloc[i]["article"]
+        if article in article_to_category:
+            article_to_category[article].append(categories.iloc[i]["category"])
+            article_to_broad_category[article].append(categories.iloc[i]["broad_category"])
+        else:
+            article_to_category[article] = [categories.iloc[i]["category"]]
+            article_to_broad_category[article] = [categories.iloc[i]["broad_category"]]
+    return article_to_category, article_to_broad_category
+
+
+def test_create_category_dictionaries_matches_baseline():
+    _, categories = synthetic_articles(500, extra_category_share=0.3, seed=0)
+    categories = categories.sample(frac=1, random_state=0)
+    expected = baseline_create_category_dictionaries(categories)
+    result = create_category_dictionaries(categories)
+    assert result == expected
+    assert [list(d) for d in result] == [list(d) for d in expected]
+
+
+def test_category_index_matches_dictionaries():
+    _, categories = synthetic_articles(300, extra_category_share=0.3, seed=1)
+    _, article_to_broad_category = create_category_dictionaries(categories)
+    index = build_category_index(categories)
+    names = np.array(list(article_to_broad_category) + ["Unknown"])
+    rows, codes = category_index_codes(names, index)
+    for i, name in enumerate(names):
+        assert list(index.labels[codes[rows == i]]) == article_to_broad_category.get(name, [])
+
+
+def baseline_get_backclicked_pages(path):
+    s, res = [], []
+    for page in path:
+        if page == "<":
+            res.append(s.pop())
+        else:
+            s.append(page)
+    return res
+
+
+def baseline_get_quitted_page(path):
+    clean_path = []
+    for page in path:
+        if page != "<":
+            clean_path.append(page)
+        else:
+            clean_path.pop()
+    return clean_path[-1]
+
+
+def synthetic_paths(n_games=2000, seed=0):
+    articles, _ = synthetic_articles(200, seed=seed)
+    links = synthetic_links(articles, seed=seed)
+    finished, unfinished, _ = synthetic_games(n_games, articles, links, backclick_rate=0.2, seed=seed)
+    paths = pd.concat([finished["path"], unfinished["path"]], ignore_index=True)
+    # hand-written cases: no back-click, back to the start, nested back-clicks, ending on a back-click
+    extra = [["a"], ["a", "b", "<"], ["a", "b", "c", "<", "<", "d"], ["a", "b", "<", "c", "d", "<", "<"]]
+    return pd.concat([paths, pd.Series(extra)], ignore_index=True)
+
+
+def test_backclick_summary_matches_baseline():
+    paths = synthetic_paths()
+    summary = backclick_summary(paths)
+    assert (summary.n_backclicks > 0).any()
+    for i, path in enumerate(paths):
+        backclicked = summary.backclicked[summary.backclicked_offsets[i] : summary.backclicked_offsets[i + 1]]
+        effective = summary.effective[summary.effective_offsets[i] : summary.effective_offsets[i + 1]]
+        assert list(backclicked) == baseline_get_backclicked_pages(path)
+        assert list(backclicked) == get_backclicked_pages(path)
+        assert summary.quit_page[i] == baseline_get_quitted_page(path) == get_quitted_page(path)
+        assert summary.n_backclicks[i] == path.count("<")
+        assert effective[-1] == summary.quit_page[i]
+        assert summary.effective_length[i] == len(path) - 2 * path.count("<")
+
+
+def baseline_filter_games(df_finished, df_unfinished, min_length=2, min_games=10, type="restart"):
+    bck_an_finished = df_finished.copy(deep=True)
+    bck_an_unfinished = df_unfinished.copy(deep=True)
+    if type == "restart" or type == "timeout":
+        bck_an_unfinished = bck_an_unfinished[bck_an_unfinished["type"] == type]
+    bck_an_unfinished = bck_an_unfinished[bck_an_unfinished["path"].apply(lambda x: len(x) >= min_length)]
+    bck_an_finished = bck_an_finished[bck_an_finished["path"].apply(lambda x: len(x) >= min_length)]
+    considered_players = pd.concat(
+        [bck_an_finished[["hashedIpAddress", "datetime"]], bck_an_unfinished[["hashedIpAddress", "datetime"]]]
+    )
+    considered_players = considered_players.groupby(by="hashedIpAddress").size().reset_index(name="num_games")
+    considered_players = considered_players[considered_players["num_games"] >= min_games]
+    bck_an_finished = pd.merge(left=bck_an_finished, right=considered_players, how="inner", on="hashedIpAddress")
+    bck_an_unfinished = pd.merge(left=bck_an_unfinished, right=considered_players, how="inner", on="hashedIpAddress")
+    return bck_an_finished, bck_an_unfinished
+
+
+@pytest.mark.parametrize("length_column", [True, False])
+@pytest.mark.parametrize("min_length, min_games, type", [(2, 10, "restart"), (0, 1, "all"), (5, 3, "timeout")])
+def test_filter_games_matches_baseline(min_length, min_games, type, length_column):
+    articles, _ = synthetic_articles(200, seed=2)
+    links = synthetic_links(articles, seed=2)
+    finished, unfinished, _ = synthetic_games(5000, articles, links, n_players=300, seed=2)
+    if not length_column:
+        finished, unfinished = finished.drop(columns="path_length"), unfinished.drop(columns="path_length")
+    expected = baseline_filter_games(finished, unfinished, min_length, min_games, type)
+    result = filter_games(finished, unfinished, min_length, min_games, type, verbose=False)
+    pd.testing.assert_frame_equal(result.finished, expected[0], check_dtype=False)
+    pd.testing.assert_frame_equal(result.unfinished, expected[1], check_dtype=False)
+    assert result.paths_finished is None and result.paths_unfinished is None
+
+    stats = result.stats
+    grid = filter_games_grid(finished, unfinished, [min_length], [min_games], type)
+    assert tuple(grid.iloc[0]) == tuple(stats)
+    assert stats.finished_games == len(expected[0]) and stats.unfinished_games == len(expected[1])
+
+
+def test_filter_games_chunked_matches_filter_games():
+    articles, _ = synthetic_articles(200, seed=3)
+    links = synthetic_links(articles, seed=3)
+    finished, unfinished, _ = synthetic_games(4000, articles, links, n_players=250, seed=3)
+
+    def make_chunks():
+        rows_finished = np.array_split(np.arange(len(finished)), 6)
+        rows_unfinished = np.array_split(np.arange(len(unfinished)), 6)
+        for rows_f, rows_u in zip(rows_finished, rows_unfinished):
+            yield finished.iloc[rows_f], unfinished.iloc[rows_u]
+
+    expected = filter_games(finished, unfinished, min_length=3, min_games=5, type="all", verbose=False)
+    chunks = list(filter_games_chunked(make_chunks, min_length=3, min_games=5, type="all"))
+    pd.testing.assert_frame_equal(
+        pd.concat([chunk for chunk, _ in chunks], ignore_index=True), expected.finished, check_dtype=False
+    )
+    pd.testing.assert_frame_equal(
+        pd.concat([chunk for _, chunk in chunks], ignore_index=True), expected.unfinished, check_dtype=False
+    )
+
+
+@pytest.mark.parametrize("min_length, min_games, type", [(-1, 10, "restart"), (2, -3, "all"), (2, 10, "finished")])
+def test_filter_games_chunked_checks_parameters_eagerly(min_length, min_games, type):
+    def make_chunks():
+        raise AssertionError("no chunk should be read before the parameters are checked")
+
+    with pytest.raises(ValueError):
+        filter_games_chunked(make_chunks, min_length, min_games, type)
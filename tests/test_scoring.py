@@ -0,0 +1,110 @@
+""" Tests of the scoring bundle and GameScorer against the design matrix they are trained on """
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from utils.analysis import build_article_index
+from utils.features import METRICS, GameFeatureBuilder, build_article_features
+from utils.scoring import GameScorer, save_scoring_bundle
+from utils.shortest_paths import UNREACHABLE, ShortestPathOracle, build_link_graph
+from utils.synthetic import synthetic_articles, synthetic_links
+
+
+@pytest.fixture(scope="module")
+def setup():
+    rng = np.random.default_rng(0)
+    articles, categories = synthetic_articles(80, seed=0)
+    links = synthetic_links(articles, mean_out_degree=4, seed=0)
+    metrics = pd.DataFrame(rng.random((len(articles), len(METRICS))), columns=METRICS)
+    metrics.insert(0, "article", articles["article"])
+    features = build_article_features(metrics, categories, links)
+    matrix = rng.integers(1, 8, (len(articles), len(articles))).astype(np.uint8)
+    matrix[0, 1] = UNREACHABLE
+    starts = articles["article"].to_numpy()[rng.integers(0, len(articles), 400)]
+    targets = articles["article"].to_numpy()[rng.integers(0, len(articles), 400)]
+    starts[0], targets[0] = articles["article"][0], articles["article"][1]
+    return articles, links, features, matrix, starts, targets, rng.random(400) < 0.4
+
+
+def fit(setup, shortest_paths, model):
+    articles, _, features, _, starts, targets, y = setup
+    builder = GameFeatureBuilder(features, build_article_index(articles), shortest_paths=shortest_paths)
+    design = builder.transform(starts, targets)
+    model.fit(design.X.toarray(), y[design.rows])
+    return builder, design, model
+
+
+@pytest.mark.parametrize("model", [LogisticRegression(max_iter=500), RandomForestClassifier(10, random_state=0)])
+@pytest.mark.parametrize("form", ["matrix", "int64", "rows", "oracle"])
+def test_scorer_matches_model(setup, tmp_path, model, form):
+    articles, links, _, matrix, starts, targets, _ = setup
+    shortest_paths = {
+        "matrix": matrix,
+        "int64": matrix.astype(np.int64),
+        "rows": ["".join("_" if d == UNREACHABLE else str(d) for d in row) for row in matrix],
+        "oracle": ShortestPathOracle(build_link_graph(links, articles["article"]), distances=matrix),
+    }[form]
+    builder, design, model = fit(setup, shortest_paths, model)
+    if form == "rows":
+        # parsed once by the builder, not at every lookup
+        np.testing.assert_array_equal(builder.shortest_paths, matrix)
+    save_scoring_bundle(str(tmp_path), model, builder)
+    scorer = GameScorer.load(str(tmp_path))
+    assert scorer.feature_names == design.feature_names
+
+    scores = scorer.score_batch(starts, targets)
+    expected = np.full(len(starts), np.nan)
+    expected[design.rows] = model.predict_proba(design.X.toarray())[:, 1]
+    np.testing.assert_allclose(scores, expected)
+    assert np.isnan(scores[0])  # unreachable pair
+    assert scorer.score(starts[5], targets[5]) == pytest.approx(expected[5], nan_ok=True)
+
+
+class FormulaResults:
+    """Stand-in for a fitted statsmodels results object, which exposes its coefficients as 'params'."""
+
+    def __init__(self, params):
+        self.params = params
+
+
+def formula_results(model, feature_names):
+    return FormulaResults(
+        pd.concat([pd.Series(model.intercept_, index=["Intercept"]), pd.Series(model.coef_[0], index=feature_names)])
+    )
+
+
+def test_formula_params_match_model(setup, tmp_path):
+    _, _, _, matrix, starts, targets, _ = setup
+    builder, design, model = fit(setup, matrix, LogisticRegression(max_iter=500))
+    params = formula_results(model, design.feature_names).params
+    # statsmodels orders the parameters by formula term, not as the builder does
+    save_scoring_bundle(str(tmp_path), FormulaResults(params.iloc[::-1]), builder)
+    scores = GameScorer.load(str(tmp_path)).score_batch(starts, targets)
+    expected = np.full(len(starts), np.nan)
+    expected[design.rows] = model.predict_proba(design.X.toarray())[:, 1]
+    np.testing.assert_allclose(scores, expected)
+
+
+@pytest.mark.parametrize("change", ["missing", "unknown"])
+def test_formula_params_must_match_features(setup, tmp_path, change):
+    _, _, _, matrix, _, _, _ = setup
+    builder, design, model = fit(setup, matrix, LogisticRegression(max_iter=500))
+    params = formula_results(model, design.feature_names).params
+    if change == "missing":
+        params = params.drop(design.feature_names[3])
+    else:
+        params = pd.concat([params, pd.Series([0.5], index=["duration"])])
+    save_scoring_bundle(str(tmp_path), FormulaResults(params), builder)
+    with pytest.raises(ValueError, match=change):
+        GameScorer.load(str(tmp_path))
+
+
+def test_oracle_without_matrix_cannot_be_saved(setup, tmp_path):
+    articles, links, *_ = setup
+    oracle = ShortestPathOracle(build_link_graph(links, articles["article"]))
+    builder, _, model = fit(setup, oracle, LogisticRegression(max_iter=500))
+    with pytest.raises(ValueError, match="ShortestPathOracle"):
+        save_scoring_bundle(str(tmp_path), model, builder)
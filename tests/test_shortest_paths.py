@@ -0,0 +1,73 @@
+""" Tests of the batched BFS engine against the on-demand oracle """
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analysis import MISSING_PATH, lookup_shortest_paths, shortest_path_find
+from utils.shortest_paths import (
+    UNREACHABLE,
+    ShortestPathOracle,
+    all_pairs_distances,
+    bfs_distances,
+    build_link_graph,
+)
+
+
+def fan_in_graph(k):
+    """source -> k middle articles -> target, so the target is reached through k parallel paths."""
+    middles = ["M{}".format(i) for i in range(k)]
+    links = pd.DataFrame(
+        {"linkSource": ["source"] * k + middles, "linkTarget": middles + ["target"] * k}
+    )
+    return build_link_graph(links)
+
+
+def random_graph(n=60, n_links=150, seed=0):
+    rng = np.random.default_rng(seed)
+    names = np.array(["A{}".format(i) for i in range(n)])
+    links = pd.DataFrame(
+        {"linkSource": names[rng.integers(0, n, n_links)], "linkTarget": names[rng.integers(0, n, n_links)]}
+    )
+    return build_link_graph(links, articles=names)
+
+
+@pytest.mark.parametrize("k", [1, 127, 128, 256, 300])
+def test_bfs_high_fan_in_matches_oracle(k):
+    graph = fan_in_graph(k)
+    source, target = graph.articles.get_indexer(["source", "target"])
+    distances = bfs_distances(graph.adjacency(), np.array([source]))
+    assert ShortestPathOracle(graph).distance(source, target) == 2
+    assert distances[0, target] == 2
+
+
+def test_bfs_matches_oracle_on_random_graph():
+    graph = random_graph()
+    n = len(graph.articles)
+    distances = bfs_distances(graph.adjacency(), np.arange(n))
+    oracle = ShortestPathOracle(graph)
+    sources, targets = np.divmod(np.arange(n * n), n)
+    np.testing.assert_array_equal(distances.reshape(-1), oracle.distances(sources, targets))
+    assert (distances == UNREACHABLE).any()
+
+
+def test_all_pairs_distances_matches_bfs(tmp_path):
+    graph = random_graph(seed=1)
+    distances = all_pairs_distances(graph, str(tmp_path / "distances.npy"), batch_size=16, processes=2)
+    np.testing.assert_array_equal(distances, bfs_distances(graph.adjacency(), np.arange(len(graph.articles))))
+
+
+def test_unreachable_pairs_are_missing():
+    matrix = np.array([[0, UNREACHABLE], [1, 0]], dtype=np.uint8)
+    lengths = lookup_shortest_paths(np.array([0, 1, MISSING_PATH]), np.array([1, 0, 0]), matrix)
+    np.testing.assert_array_equal(lengths, [MISSING_PATH, 1, MISSING_PATH])
+
+    articles = pd.DataFrame({"article": ["a", "b"]})
+    games = pd.DataFrame({"path": [["a"], ["b"]], "target": ["b", "a"]})
+    shortest, not_found = shortest_path_find(games, articles, matrix)
+    assert not_found == 1
+    assert pd.isna(shortest[0]) and shortest[1] == 1
+
+    graph = build_link_graph(pd.DataFrame({"linkSource": ["b"], "linkTarget": ["a"]}), articles=["a", "b"])
+    lengths = lookup_shortest_paths(np.array([0, 1]), np.array([1, 0]), ShortestPathOracle(graph))
+    np.testing.assert_array_equal(lengths, [MISSING_PATH, 1])
@@ -1,58 +1,64 @@
 """ Module to store all functions related to data analysis tasks """
 
-import networkx as nx
-import matplotlib.pyplot as plt
-from scipy import stats
 from collections import Counter
 import numpy as np
 import pandas as pd
-from sklearn.metrics import ConfusionMatrixDisplay, accuracy_score, f1_score, precision_score, recall_score
-import matplotlib.colors as colors
 
-def visualize_article_connections_per_category(connections, nodes, description, edge_widths=None):
+from .instrumentation import instrument
+from .preprocessing import CategoryIndex, category_index_codes
+from .shortest_paths import UNREACHABLE, parse_distance_rows
+
+# scipy, scikit-learn and the plotting libraries are imported inside the functions using them,
+# so that compute-only callers (batch jobs, scoring workers) start quickly.
+
+# rendering functions now live in utils.plotting, still importable from here
+_PLOTTING = {
+    "visualize_article_connections_per_category",
+    "draw_category_transitions",
+    "create_coefplot",
+    "plot_confusion_matrices",
+    "plot_cv_results",
+    "evaluate_predictions",
+}
+
+
+def __getattr__(name):
+    if name in _PLOTTING:
+        from . import plotting
+
+        return getattr(plotting, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+@instrument
+def category_transition_matrix(
+    connections, labels=None, start_col="start_broad_category", end_col="end_broad_category"
+):
     """
-    Function to plot a network (vertices: article categories, edges: strength of connection)
-    :param connections: Edges.
-    :param nodes: Vertices.
+    Function to count the connections between every pair of categories in one sparse accumulation.
+    :param connections: Dataframe with one row per connection (link or click).
+    :param labels: Optional array of category names fixing the row/column order, extended with
+    the categories of 'connections' that are missing from it.
+    :param start_col: Column of the category of the connection start (e.g. start_category for fine categories).
+    :param end_col: Column of the category of the connection end.
+    :return weights: scipy.sparse CSR matrix, weights[i, j] being the number of connections from labels[i] to labels[j].
+    :return labels: Array of category names indexing the matrix.
     """
-    graph = nx.DiGraph()
-
-    for _, node in nodes.iterrows():
-        graph.add_node(node["broad_category"])
-
-    for _, row in connections.iterrows():
-        start_category = row["start_broad_category"]
-        end_category = row["end_broad_category"]
-        if graph.has_edge(start_category, end_category):
-            graph[start_category][end_category]["size"] += 1
-        else:
-            graph.add_edge(start_category, end_category, size=1)
-
-    if edge_widths is None:
-        edge_weights = [graph[u][v]["size"] for u, v in graph.edges()]
-        max_edge_weight = max(edge_weights)
-        min_edge_weight = min(edge_weights)
-        normalized_edge_weights = [
-            (weight - min_edge_weight) / (max_edge_weight - min_edge_weight)
-            for weight in edge_weights
-        ]
-        edge_widths = [weight * 5 for weight in normalized_edge_weights]
-
-    plt.figure(figsize=(10, 10))
-    nx.draw(
-        graph,
-        pos=nx.shell_layout(graph),
-        with_labels=True,
-        width=edge_widths,
-        edge_color="gray",
-        arrows=True,
-    )
-    plt.title(description)
-    plt.show()
+    start = connections[start_col].to_numpy()
+    end = connections[end_col].to_numpy()
+    labels = pd.Index([] if labels is None else labels)
+    labels = labels.append(pd.Index(pd.unique(np.concatenate([start, end]))).difference(labels, sort=False))
+
+    from scipy.sparse import coo_matrix
 
-    return graph, edge_widths
+    weights = coo_matrix(
+        (np.ones(len(start), dtype=np.int64), (labels.get_indexer(start), labels.get_indexer(end))),
+        shape=(len(labels), len(labels)),
+    ).tocsr()  # duplicate (start, end) entries are summed
+    return weights, labels.to_numpy()
 
 
+@instrument
 def t_test_article_metrics(metrics, dist1, dist2):
     """
     Function to perform a simple t-test on article metrics and print out the results in a readable format.
@@ -60,10 +66,17 @@ def t_test_article_metrics(metrics, dist1, dist2):
     :param dist1: First of the two distributions going into the t-test.
     :param dist2: Second of the two distributions going into the t-test.
     """
-    for metric in metrics:
-        statistic, pvalue = stats.ttest_ind(
-            dist1[metric], dist2[metric], nan_policy="omit", equal_var=False
-        )
+    from .hypothesis import GroupedData, welch_t
+
+    # all the metrics are tested at once, see hypothesis.compare_groups for grouped sweeps
+    metrics = list(metrics)
+    data = GroupedData(
+        np.concatenate([dist1[metrics].to_numpy(dtype=np.float64), dist2[metrics].to_numpy(dtype=np.float64)]),
+        np.arange(len(dist1) + len(dist2)) < len(dist1),
+        metric_names=metrics,
+    )
+    statistics, pvalues = welch_t(*data.moments())
+    for metric, statistic, pvalue in zip(metrics, statistics[0], pvalues[0]):
         print(
             "\t - {} - t-statistic: {:.3f}, p-value: {:.3f}".format(
                 metric, statistic, pvalue
@@ -77,21 +90,33 @@ def simple_t_test(dist1, dist2):
     :param dist1: First of the two distributions going into the t-test.
     :param dist2: Second of the two distributions going into the t-test.
     """
+    from scipy import stats
+
     statistic, pvalue = stats.ttest_ind(
         dist1, dist2, nan_policy="omit", equal_var=False
     )
     print("t-statistic: {:.3f}, p-value: {:.3f}".format(statistic, pvalue))
 
 
+@instrument
 def sorted_category_counts(df, category_dict, part="target"):
     """
     Function to create a dictionary of the counts of the categories present in the targets in a dataframe,
     and sort this dictionary alphabetically.
     :param df: Dataframe in which the targets in question are found.
-    :param category_dict: Dictionary for mapping article names to categories.
+    :param category_dict: Dictionary (or CategoryIndex) for mapping article names to categories.
     :param part: Part of the path, can be start/target.
     :return sorted_cats: Dictionary of the counts of the categories sorted alphabetically by category.
     """
+    if isinstance(category_dict, CategoryIndex):
+        _, codes = category_index_codes(df[part], category_dict)
+        counts = np.bincount(codes, minlength=len(category_dict.labels))
+        return {
+            label: int(count)
+            for label, count in zip(category_dict.labels, counts)
+            if count > 0
+        }
+
     all_target_categories = [
         category_dict[target] for target in df[part] if target in category_dict
     ]
@@ -105,243 +130,220 @@ def sorted_category_counts(df, category_dict, part="target"):
     return sorted_cats
 
 
-def shortest_path_find(df, articles, shortest_paths):
+MISSING_PATH = -1
+
+
+def build_article_index(articles):
+    """
+    Function to build a lookup from article names to their row in the shortest path matrix.
+    :param articles: Dataframe of the article names (its index is the row/column of 'shortest_paths').
+    :return article_index: Series mapping article names to matrix indices (first occurrence wins).
+    """
+    first = ~articles["article"].duplicated(keep="first").to_numpy()
+    return pd.Series(
+        articles.index.to_numpy()[first], index=articles["article"].to_numpy()[first]
+    )
+
+
+def lookup_article_indices(names, article_index):
+    """
+    Function to translate an array of article names to matrix indices in one go.
+    :param names: Array-like of article names.
+    :param article_index: Series returned by 'build_article_index'.
+    :return indices: Integer array of matrix indices, MISSING_PATH where the article is unknown.
     """
-    Function to manually find the shortest possible path length in a game.
+    positions = article_index.index.get_indexer(pd.Index(names))
+    return np.where(
+        positions >= 0, article_index.to_numpy()[positions], MISSING_PATH
+    ).astype(np.int64)
+
+
+def distance_matrix(shortest_paths):
+    """
+    Function to get a square integer matrix from a distance matrix. Rows of digit strings (as in the
+    raw distance matrix file) are parsed on every call, so parse them once and pass the result around.
+    ShortestPathOracles are returned as they are.
+    :param shortest_paths: Square matrix of shortest path lengths, array/list of digit-string rows,
+    or ShortestPathOracle.
+    :return matrix: Integer matrix (uint8 with UNREACHABLE for parsed rows), or the oracle.
+    """
+    if hasattr(shortest_paths, "distances") or (isinstance(shortest_paths, np.ndarray) and shortest_paths.ndim == 2):
+        return shortest_paths
+    matrix = np.asarray(shortest_paths)
+    if matrix.ndim == 1:
+        matrix = parse_distance_rows(shortest_paths)
+    return matrix
+
+
+@instrument
+def lookup_shortest_paths(source_idx, target_idx, shortest_paths):
+    """
+    Function to gather the shortest path lengths of many (source, target) pairs with fancy indexing.
+    :param source_idx: Integer array of source indices (MISSING_PATH for unknown articles).
+    :param target_idx: Integer array of target indices (MISSING_PATH for unknown articles).
+    :param shortest_paths: Square matrix containg the length of the shortest paths between articles,
+    or a ShortestPathOracle whose node ids are the same indices. Rows of digit strings must first
+    be parsed with 'distance_matrix'.
+    :return lengths: Integer array of the shortest path lengths, MISSING_PATH for missing or unreachable pairs.
+    """
+    if not hasattr(shortest_paths, "distances") and np.ndim(shortest_paths) != 2:
+        raise ValueError("shortest_paths must be a square matrix or a ShortestPathOracle, see 'distance_matrix'.")
+    source_idx = np.asarray(source_idx, dtype=np.int64)
+    target_idx = np.asarray(target_idx, dtype=np.int64)
+    found = (source_idx != MISSING_PATH) & (target_idx != MISSING_PATH)
+
+    lengths = np.full(len(source_idx), MISSING_PATH, dtype=np.int64)
+    if hasattr(shortest_paths, "distances"):
+        # ShortestPathOracle from utils.shortest_paths
+        lengths[found] = shortest_paths.distances(source_idx[found], target_idx[found])
+    else:
+        lengths[found] = np.asarray(shortest_paths)[source_idx[found], target_idx[found]]
+
+    # pairs without a path are missing, not 255 hops long
+    lengths[lengths == UNREACHABLE] = MISSING_PATH
+    return lengths
+
+
+@instrument
+def shortest_path_find(df, articles, shortest_paths, article_index=None, paths=None):
+    """
+    Function to find the shortest possible path length of every game in a dataframe.
     :param df: Dataframe containg the games in question.
     :param articles: Dataframe of the article names.
-    :param shortest_paths: Square matrix containg the length of the shortest paths between articles.
-    :return shortest_unfinished: List of the shortest possible path lengths of the games in df.
+    :param shortest_paths: Square matrix containg the length of the shortest paths between articles
+    (or its rows of digit strings, parsed by this call), or a ShortestPathOracle whose node ids
+    follow the index of 'articles'.
+    :param article_index: Optional lookup returned by 'build_article_index', to reuse across calls.
+    :param paths: Optional PathStore of the paths of the games, used instead of the 'path' column.
+    :return shortest_unfinished: Nullable integer array of the shortest possible path lengths of the games in df.
     :return not_found: Integer of the number of shortest paths that could not be found in 'shortest_paths'.
     """
-    shortest_unfinished = []
-    not_found = 0
-    for i in range(len(df)):
-        source = articles.loc[articles["article"] == df.iloc[i]["path"][0]]
-        target = articles.loc[articles["article"] == df.iloc[i]["target"]]
-        if len(source) != 0 and len(target) != 0:
-            index_source = source.index[0]
-            index_target = target.index[0]
-            shortest_unfinished.append(int(shortest_paths[index_source][index_target]))
-        else:
-            shortest_unfinished.append(None)
-            not_found += 1
-    return shortest_unfinished, not_found
-
-def bootstrap_CI_prob_cat(data_f, data_u, cat, category_dict, iterations=1000):
+    if article_index is None:
+        article_index = build_article_index(articles)
+
+    starts = df["path"].str[0] if paths is None else paths.decode(paths.first_pages())
+    source_idx = lookup_article_indices(starts, article_index)
+    target_idx = lookup_article_indices(df["target"], article_index)
+    lengths = lookup_shortest_paths(source_idx, target_idx, distance_matrix(shortest_paths))
+
+    missing = lengths == MISSING_PATH
+    shortest_unfinished = pd.array(lengths, dtype="Int64")
+    shortest_unfinished[missing] = pd.NA
+    return shortest_unfinished, int(missing.sum())
+
+def category_codes(data, category_dict, labels=None):
+    """
+    Function to encode the categories of a series of articles as integer codes.
+    :param data: A Pandas Series (or iterable) of article names.
+    :param category_dict: Dictionary (or CategoryIndex) for mapping article names to categories.
+    :param labels: Optional sorted array of category names to encode against.
+    :return codes: Integer array with one code per (article, category) pair.
+    :return labels: Sorted array of category names indexed by the codes.
+    """
+    if isinstance(category_dict, CategoryIndex):
+        _, codes = category_index_codes(data, category_dict)
+        if labels is None:
+            return codes, category_dict.labels
+        labels = np.asarray(labels, dtype=str)
+        return np.searchsorted(labels, category_dict.labels)[codes].astype(np.int64), labels
+
+    flat = [item for artic in data if artic in category_dict for item in category_dict[artic]]
+    flat = np.asarray(flat, dtype=str)
+    if labels is None:
+        labels, codes = np.unique(flat, return_inverse=True)
+    else:
+        labels = np.asarray(labels, dtype=str)
+        codes = np.searchsorted(labels, flat)
+    return codes.astype(np.int64), labels
+
+
+@instrument
+def bootstrap_CI_prob_all_cats(
+    data_f, data_u, category_dict, iterations=1000, seed=None, chunk_size=1000, alpha=0.05
+):
+    """
+    Function to bootstrap the confidence intervals of the empirical likelihood that a target
+    belonging to a category is not reached, for every category at once.
+    A resample of n categories is drawn directly as multinomial category counts, so each chunk
+    of resamples only needs (chunk_size x number of categories) memory.
+    :param data_f: A Pandas Series of articles from the finished paths.
+    :param data_u: A Pandas Series of articles from the unfinished paths.
+    :param category_dict: Dictionary (or CategoryIndex) for mapping article names to categories.
+    :param iterations: The number of bootstrap samples to generate.
+    :param seed: Seed (or np.random.Generator) used for the resampling. If None, the samples are drawn
+    from the global random state, so results are reproducible with np.random.seed as before.
+    :param chunk_size: Maximum number of bootstrap samples drawn at a time.
+    :param alpha: Significance level, 0.05 gives the 95% confidence interval.
+    :return: Dataframe indexed by category with the empirical likelihood and the interval bounds.
+    """
+    # the module-level functions of np.random draw from the global RandomState
+    rng = np.random if seed is None else np.random.default_rng(seed)
+
+    _, labels_f = category_codes(data_f, category_dict)
+    _, labels_u = category_codes(data_u, category_dict)
+    labels = np.union1d(labels_f, labels_u)
+    codes_f, _ = category_codes(data_f, category_dict, labels)
+    codes_u, _ = category_codes(data_u, category_dict, labels)
+
+    counts_f = np.bincount(codes_f, minlength=len(labels))
+    counts_u = np.bincount(codes_u, minlength=len(labels))
+    p_f = counts_f / max(len(codes_f), 1)
+    p_u = counts_u / max(len(codes_u), 1)
+
+    means = np.empty((iterations, len(labels)))
+    for start in range(0, iterations, chunk_size):
+        size = min(chunk_size, iterations - start)
+        sample_f = rng.multinomial(len(codes_f), p_f, size=size)
+        sample_u = rng.multinomial(len(codes_u), p_u, size=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[start : start + size] = sample_u / (sample_u + sample_f)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        prob = counts_u / (counts_u + counts_f)
+    return pd.DataFrame(
+        {
+            "prob": prob,
+            "lower_bound": np.nanpercentile(means, 100 * alpha / 2, axis=0),
+            "upper_bound": np.nanpercentile(means, 100 * (1 - alpha / 2), axis=0),
+        },
+        index=pd.Index(labels, name="category"),
+    )
+
+
+@instrument
+def bootstrap_CI_prob_cat(data_f, data_u, cat, category_dict, iterations=1000, seed=None):
     """
     Function to bootstrap the 95% confidence interval of the empirical likelihood that a target 
     belonging to a certain category not being reached.
+    To get the intervals of several categories, call 'bootstrap_CI_prob_all_cats' once instead.
     :param data_f: A Pandas Series of articles from the finished paths.
     :param data_u: A Pandas Series of articles from the unfinished paths.
     :param cat: Category name.
-    :param category_dict: Dictionary for mapping article names to categories.
+    :param category_dict: Dictionary (or CategoryIndex) for mapping article names to categories.
     :param iterations: The number of bootstrap samples to generate.
+    :param seed: Seed (or np.random.Generator) used for the resampling, the global random state if None.
     :return: A tuple representing the lower and upper bounds of the 95% confidence interval
     """
-    finished_target_categories = [
-        category_dict[artic] for artic in data_f if artic in category_dict
-    ]
-    finished_target_categories = [
-        item for sublist in finished_target_categories for item in sublist
-    ]
-
-    unfinished_target_categories = [
-        category_dict[artic] for artic in data_u if artic in category_dict
-    ]
-    unfinished_target_categories = [
-        item for sublist in unfinished_target_categories for item in sublist
-    ]
+    intervals = bootstrap_CI_prob_all_cats(
+        data_f, data_u, category_dict, iterations=iterations, seed=seed
+    )
+    if cat not in intervals.index:
+        return (np.nan, np.nan)
+    return (intervals.loc[cat, "lower_bound"], intervals.loc[cat, "upper_bound"])
 
-    means = np.zeros(iterations)
-
-    for i in range(iterations):
-        bootstrap_sample_f = np.random.choice(finished_target_categories, size=len(finished_target_categories), replace=True)
-        bootstrap_sample_u = np.random.choice(unfinished_target_categories, size=len(unfinished_target_categories), replace=True)
-        count_cats_sample_f = Counter(bootstrap_sample_f)
-        count_cats_sample_u = Counter(bootstrap_sample_u)
-        means[i] = count_cats_sample_u[cat] / (count_cats_sample_u[cat] + count_cats_sample_f[cat])
-        
-    lower_bound = np.percentile(means, 2.5)
-    upper_bound = np.percentile(means, 97.5)
-    
-    return (lower_bound, upper_bound)
-
-def create_coefplot(model_summary, figsize=(14, 18), height_ratios=[0.7, 2.0, 2.5, 2.5]):
-    """
-    Function to plot the coefficient of a statsmodel regression summary, including confidence intervals in the defined variable groups.
-    :param model_summary: a statsmodel summary object
-    :return: A tuple of plt figure and axes
+@instrument
+def classification_metrics(y_test, y_pred):
     """
-    err_series = model_summary.params - model_summary.conf_int()[0]
-    temp_df = pd.DataFrame({"coef": model_summary.params.values[1:],
-                            "error": err_series.values[1:], 
-                            "variable": err_series.index.values[1:]})
-    
-
-    CATEGORIES = {'Start Category: Business_Studies': 'Start Categories',
-    'Start Category: Citizenship': 'Start Categories',
-    'Start Category: Countries': 'Start Categories',
-    'Start Category: Design_and_Technology': 'Start Categories',
-    'Start Category: Everyday_life': 'Start Categories',
-    'Start Category: Geography': 'Start Categories',
-    'Start Category: History': 'Start Categories',
-    'Start Category: IT': 'Start Categories',
-    'Start Category: Language_and_literature': 'Start Categories',
-    'Start Category: Mathematics': 'Start Categories',
-    'Start Category: Music': 'Start Categories',
-    'Start Category: People': 'Start Categories',
-    'Start Category: Religion': 'Start Categories',
-    'Start Category: Science': 'Start Categories',
-    'Target Category: Business_Studies': 'Target Categories',
-    'Target Category: Citizenship': 'Target Categories',
-    'Target Category: Countries': 'Target Categories',
-    'Target Category: Design_and_Technology': 'Target Categories',
-    'Target Category: Everyday_life': 'Target Categories',
-    'Target Category: Geography': 'Target Categories',
-    'Target Category: History': 'Target Categories',
-    'Target Category: IT': 'Target Categories',
-    'Target Category: Language_and_literature': 'Target Categories',
-    'Target Category: Mathematics': 'Target Categories',
-    'Target Category: Music': 'Target Categories',
-    'Target Category: People': 'Target Categories',
-    'Target Category: Religion': 'Target Categories',
-    'Target Category: Science': 'Target Categories',
-    'Start Article: Avg. Sentence Length': 'Article Metrics',
-    'Start Article: Avg. Word Length': 'Article Metrics',
-    'Start Article: Paragraph Count': 'Article Metrics',
-    'Start Article: Readability Score': 'Article Metrics',
-    'Start Article: Stopword Percentage': 'Article Metrics',
-    'Target Article: Avg. Sentence Length': 'Article Metrics',
-    'Target Article: Avg. Word Length': 'Article Metrics',
-    'Target Article: Paragraph Count': 'Article Metrics',
-    'Target Article: Readability Score': 'Article Metrics',
-    'Target Article: Stopword Percentage': 'Article Metrics',
-    'Links from Source': 'Game Difficulty',
-    'Links to Target': 'Game Difficulty',
-    'Shortest Possible Path': 'Game Difficulty',
-    'Semantic Similarity Start Target': 'Game Difficulty'}
-    MAPPING = {
-    # Starting Categories    
-    'start_broad_category[T.Business_Studies]': 'Start Category: Business_Studies',
-    'start_broad_category[T.Citizenship]': 'Start Category: Citizenship',
-    'start_broad_category[T.Countries]': 'Start Category: Countries',
-    'start_broad_category[T.Design_and_Technology]': 'Start Category: Design_and_Technology',
-    'start_broad_category[T.Everyday_life]': 'Start Category: Everyday_life',
-    'start_broad_category[T.Geography]': 'Start Category: Geography',
-    'start_broad_category[T.History]': 'Start Category: History',
-    'start_broad_category[T.IT]': 'Start Category: IT',
-    'start_broad_category[T.Language_and_literature]': 'Start Category: Language_and_literature',
-    'start_broad_category[T.Mathematics]': 'Start Category: Mathematics',
-    'start_broad_category[T.Music]': 'Start Category: Music',
-    'start_broad_category[T.People]': 'Start Category: People',
-    'start_broad_category[T.Religion]': 'Start Category: Religion',
-    'start_broad_category[T.Science]': 'Start Category: Science',
-
-    # Ending Categories
-    'target_broad_category[T.Business_Studies]': 'Target Category: Business_Studies',
-    'target_broad_category[T.Citizenship]': 'Target Category: Citizenship',
-    'target_broad_category[T.Countries]': 'Target Category: Countries',
-    'target_broad_category[T.Design_and_Technology]': 'Target Category: Design_and_Technology',
-    'target_broad_category[T.Everyday_life]': 'Target Category: Everyday_life',
-    'target_broad_category[T.Geography]': 'Target Category: Geography',
-    'target_broad_category[T.History]': 'Target Category: History',
-    'target_broad_category[T.IT]': 'Target Category: IT',
-    'target_broad_category[T.Language_and_literature]': 'Target Category: Language_and_literature',
-    'target_broad_category[T.Mathematics]': 'Target Category: Mathematics',
-    'target_broad_category[T.Music]': 'Target Category: Music',
-    'target_broad_category[T.People]': 'Target Category: People',
-    'target_broad_category[T.Religion]': 'Target Category: Religion',
-    'target_broad_category[T.Science]': 'Target Category: Science',
-
-    # article metrics
-    'start_avg_sent_length': 'Start Article: Avg. Sentence Length',
-    'start_avg_word_length': 'Start Article: Avg. Word Length',
-    'start_paragraph_count': 'Start Article: Paragraph Count',
-    'start_readability_score': 'Start Article: Readability Score',
-    'start_stopword_percentage': 'Start Article: Stopword Percentage',
-
-    'target_avg_sent_length': 'Target Article: Avg. Sentence Length',
-    'target_avg_word_length': 'Target Article: Avg. Word Length',
-    'target_paragraph_count': 'Target Article: Paragraph Count',
-    'target_readability_score': 'Target Article: Readability Score',
-    'target_stopword_percentage': 'Target Article: Stopword Percentage',
-
-    # game difficulty
-    'links_from_source': 'Links from Source',
-    'links_to_target': 'Links to Target',
-    'shortest_path_length': 'Shortest Possible Path',
-    'sims_start_target': 'Semantic Similarity Start Target'}
-    TITLE_SIZE = 14
-    AXIS_SIZE = 12
-
-    temp_df["clean_name"] = temp_df.variable.map(MAPPING)
-    temp_df["group"] = temp_df.clean_name.map(CATEGORIES)
-
-    # sort by coefficent
-    temp_df = temp_df.sort_values(by="coef")
-
-    # make individual dfs for plotting
-    diff = temp_df[temp_df.group == "Game Difficulty"]
-    start = temp_df[temp_df.group == "Start Categories"]
-    target = temp_df[temp_df.group == "Target Categories"]
-    metrics = temp_df[temp_df.group == "Article Metrics"]
-
-    fig, ax = plt.subplots(4, 1, figsize=figsize, gridspec_kw={'height_ratios': height_ratios}, sharex=True)
-
-    ax[0].axvline(0, c="darkgrey", linestyle="--")
-    ax[0].scatter(y="clean_name", x="coef", data=diff, s=120, marker="s", c="coef", norm=colors.CenteredNorm(), cmap="RdYlGn_r")
-    ax[0].errorbar(y="clean_name", x="coef", xerr="error", c="white", data=diff, ecolor="grey", fmt="none" )
-    ax[0].xaxis.set_tick_params(which='both', labelbottom=True)
-    ax[0].set_title("Game Difficulty", fontsize=TITLE_SIZE, fontweight="bold")
-    ax[0].tick_params(axis='both', which='major', labelsize=AXIS_SIZE)
-
-    ax[1].axvline(0, c="darkgrey", linestyle="--")
-    ax[1].errorbar(y="clean_name", x="coef", xerr="error", c="white", data=metrics, ecolor="grey", fmt="none" )
-    ax[1].scatter(y="clean_name", x="coef", data=metrics, s=120, marker="s", c="coef", norm=colors.CenteredNorm(), cmap="RdYlGn_r")
-    ax[1].xaxis.set_tick_params(which='both', labelbottom=True)
-    ax[1].set_title("Article Metrics", fontsize=TITLE_SIZE, fontweight="bold")
-    ax[1].tick_params(axis='both', which='major', labelsize=AXIS_SIZE)
-
-    ax[2].axvline(0, c="darkgrey", linestyle="--")
-    ax[2].errorbar(y="clean_name", x="coef", xerr="error", c="white", data=start, ecolor="grey", fmt="none" )
-    ax[2].scatter(y="clean_name", x="coef", data=start, s=120, marker="s", c="coef", norm=colors.CenteredNorm(), cmap="RdYlGn_r")
-    ax[2].xaxis.set_tick_params(which='both', labelbottom=True)
-    ax[2].set_title("Starting Categories", fontsize=TITLE_SIZE, fontweight="bold")
-    ax[2].tick_params(axis='both', which='major', labelsize=AXIS_SIZE)
-
-    ax[3].axvline(0, c="darkgrey", linestyle="--")
-    ax[3].scatter(y="clean_name", x="coef", data=target, s=120, marker="s", c="coef", norm=colors.CenteredNorm(), cmap="RdYlGn_r")
-    ax[3].errorbar(y="clean_name", x="coef", xerr="error", c="white", data=target, ecolor="grey", fmt="none" )
-    ax[3].xaxis.set_tick_params(which='both', labelbottom=True)
-    ax[3].set_title("Target Categories", fontsize=TITLE_SIZE, fontweight="bold")
-    ax[3].tick_params(axis='both', which='major', labelsize=AXIS_SIZE)
-
-    plt.tight_layout()
-
-    return fig, ax
-
-def evaluate_predictions(y_test, y_pred):
-    """
-    Function to print out classification metrics and display confusion matrices.
-    :param y_test: array of predicted class labels
+    Function to compute the classification metrics of a set of predictions.
     :param y_test: array of ground truths
-    :return: None (printouts and plots)
+    :param y_pred: array of predicted class labels
+    :return: Dictionary with the accuracy, F1-score, precision and recall.
     """
-    print(" Accuracy: {:.4f} \n F1-Score: {:.4f} \n Precision: {:.4f}\n Recall: {:.4f}".format(
-            accuracy_score(y_test, y_pred),
-            f1_score(y_test, y_pred),
-            precision_score(y_test, y_pred),
-            recall_score(y_test, y_pred),
-        )  
-    )
-
-    # Plot Confusion Matrices
-    fig, axes = plt.subplots(1, 3, figsize=(14, 8))
-    ConfusionMatrixDisplay.from_predictions(y_test, y_pred, ax=axes[0])
-    axes[0].set_title("Raw Counts")
-    ConfusionMatrixDisplay.from_predictions(y_test, y_pred, normalize="true", ax=axes[1])
-    axes[1].set_title("Normalized by True Values (Per Class Recall)")
-    ConfusionMatrixDisplay.from_predictions(y_test, y_pred, normalize="pred", ax=axes[2])
-    axes[2].set_title("Normalized by True Values (Per Class Recall)")
-    fig.show()
\ No newline at end of file
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+    return {
+        "accuracy": accuracy_score(y_test, y_pred),
+        "f1": f1_score(y_test, y_pred),
+        "precision": precision_score(y_test, y_pred),
+        "recall": recall_score(y_test, y_pred),
+    }
@@ -0,0 +1,251 @@
+""" Module to store all functions related to extracting language metrics from the plaintext articles """
+
+import csv
+import hashlib
+import json
+import os
+from collections import Counter
+from multiprocessing import Pool
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+from config import GENERATED_METRICS, PATH_GRAPH_FOLDER, PATH_TO_DATA
+
+from .cache import ArtifactCache
+
+ARTICLE_METRICS_FILE = os.path.join(GENERATED_METRICS, "article_metrics.csv")
+ARTICLE_METRICS_WITH_CATEGORIES_FILE = os.path.join(GENERATED_METRICS, "article_metrics_with_categories.pkl")
+CATEGORIES_FILE = os.path.join(PATH_TO_DATA, PATH_GRAPH_FOLDER, "categories.tsv")
+
+METRIC_COLUMNS = [
+    "article",
+    "word_count",
+    "non_stopword_count",
+    "non_stopword_percentage",
+    "stopword_count",
+    "stopword_percentage",
+    "avg_word_length",
+    "avg_sent_length",
+    "paragraph_count",
+    "common_words",
+    "readability_score",
+]
+
+_STOPWORDS = None
+
+
+def _init_worker():
+    from nltk.corpus import stopwords
+
+    global _STOPWORDS
+    _STOPWORDS = set(stopwords.words("english"))
+
+
+def compute_article_metrics(text, stop_words=None):
+    """
+    Function to compute the language metrics of one article.
+    :param text: Plaintext of the article.
+    :param stop_words: Set of stopwords, defaults to the NLTK english stopwords.
+    :return metrics: Dictionary of the metrics (all METRIC_COLUMNS except 'article').
+    """
+    import textstat
+    from nltk.corpus import stopwords
+    from nltk.tokenize import sent_tokenize, word_tokenize
+
+    if stop_words is None:
+        stop_words = _STOPWORDS if _STOPWORDS is not None else set(stopwords.words("english"))
+
+    words = [word.lower() for word in word_tokenize(text) if word.isalpha()]
+    sentences = sent_tokenize(text)
+    paragraphs = [paragraph for paragraph in text.split("\n\n") if paragraph.strip()]
+
+    is_stopword = np.fromiter((word in stop_words for word in words), dtype=bool, count=len(words))
+    word_count = len(words)
+    stopword_count = int(is_stopword.sum())
+    non_stopwords = [word for word, stop in zip(words, is_stopword) if not stop]
+
+    return {
+        "word_count": word_count,
+        "non_stopword_count": word_count - stopword_count,
+        "non_stopword_percentage": (word_count - stopword_count) / word_count if word_count else np.nan,
+        "stopword_count": stopword_count,
+        "stopword_percentage": stopword_count / word_count if word_count else np.nan,
+        "avg_word_length": np.mean([len(word) for word in words]) if words else np.nan,
+        "avg_sent_length": np.mean([len(sentence) for sentence in sentences]) if sentences else np.nan,
+        "paragraph_count": len(paragraphs),
+        "common_words": str(Counter(non_stopwords).most_common(10)),
+        "readability_score": textstat.flesch_reading_ease(text),
+    }
+
+
+def _process_file(task):
+    article, path, signature = task
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    metrics = compute_article_metrics(text)
+    metrics["article"] = article
+    return metrics, signature
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_manifest(manifest_path):
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of an interrupted run
+                    continue
+                manifest[entry["article"]] = entry
+    return manifest
+
+
+def _pending_articles(article_folder, manifest):
+    """
+    Lists the (article, path, signature) of every article file that is new or changed since the
+    manifest, refreshing in place the signature of touched but unchanged files.
+    :return pending: List of tasks.
+    :return articles: Set of the articles present in the folder.
+    """
+    pending, articles = [], set()
+    with os.scandir(article_folder) as entries:
+        for entry in entries:
+            if not entry.is_file() or not entry.name.endswith(".txt"):
+                continue
+            article = unquote(entry.name[: -len(".txt")])
+            articles.add(article)
+            stat = entry.stat()
+            signature = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            known = manifest.get(article)
+            if known is not None and known["mtime_ns"] == stat.st_mtime_ns and known["size"] == stat.st_size:
+                continue
+            signature["sha256"] = _file_digest(entry.path)
+            if known is not None and known.get("sha256") == signature["sha256"]:
+                # touched but unchanged, only refresh the signature
+                manifest[article] = {"article": article, **signature}
+                continue
+            pending.append((article, entry.path, signature))
+    return pending, articles
+
+
+def extract_article_metrics(article_folder, output_csv, processes=None, chunk_size=16):
+    """
+    Function to compute the metrics of every article in a folder with a process pool, writing each
+    article to the output as soon as it is done. A manifest next to the output records the mtime,
+    size and hash of every processed file, so an interrupted run resumes where it stopped and
+    later runs only reprocess articles whose file changed. Articles deleted from the folder are
+    removed from the output and the manifest.
+    :param article_folder: Folder of plaintext articles (URL-encoded names with a .txt extension).
+    :param output_csv: CSV file the metrics are appended to (see 'load_article_metrics').
+    :param processes: Number of worker processes, defaults to the number of CPUs.
+    :param chunk_size: Number of articles sent to a worker at a time.
+    :return processed: Number of articles (re)processed by this run.
+    """
+    manifest_path = output_csv + ".manifest.jsonl"
+    manifest = _load_manifest(manifest_path)
+    # listed up front, so the manifest is only touched by this thread and not by the pool's task feeder
+    tasks, articles = _pending_articles(article_folder, manifest)
+    deleted = set(manifest) - articles
+    for article in deleted:
+        del manifest[article]
+    write_header = not os.path.exists(output_csv) or os.path.getsize(output_csv) == 0
+
+    processed = 0
+    with open(output_csv, "a", newline="", encoding="utf-8") as out, open(manifest_path, "a") as log:
+        writer = csv.DictWriter(out, fieldnames=METRIC_COLUMNS)
+        if write_header:
+            writer.writeheader()
+        if tasks:
+            with Pool(processes=processes, initializer=_init_worker) as pool:
+                for metrics, signature in pool.imap_unordered(_process_file, tasks, chunksize=chunk_size):
+                    writer.writerow(metrics)
+                    out.flush()
+                    entry = {"article": metrics["article"], **signature}
+                    manifest[metrics["article"]] = entry
+                    log.write(json.dumps(entry) + "\n")
+                    log.flush()
+                    processed += 1
+
+    if deleted:
+        article_metrics = load_article_metrics(output_csv)
+        article_metrics = article_metrics[~article_metrics["article"].isin(deleted)]
+        article_metrics.to_csv(output_csv + ".tmp", index=False)
+        os.replace(output_csv + ".tmp", output_csv)
+
+    # rewrite the manifest compactly, including refreshed signatures of touched files
+    with open(manifest_path + ".tmp", "w") as log:
+        for entry in manifest.values():
+            log.write(json.dumps(entry) + "\n")
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return processed
+
+
+def load_article_metrics(output_csv, compact=False):
+    """
+    Function to load the metrics written by 'extract_article_metrics', keeping the latest row of every article.
+    :param output_csv: CSV file written by 'extract_article_metrics'.
+    :param compact: Whether to rewrite the file without the outdated rows.
+    :return article_metrics: Dataframe with one row per article.
+    """
+    article_metrics = pd.read_csv(output_csv, on_bad_lines="skip")
+    article_metrics = article_metrics.drop_duplicates(subset="article", keep="last").reset_index(drop=True)
+    if compact:
+        article_metrics.to_csv(output_csv + ".tmp", index=False)
+        os.replace(output_csv + ".tmp", output_csv)
+    return article_metrics
+
+
+def merge_metrics_categories(metrics_file, categories_file):
+    """
+    Function to merge the article metrics with the categories of every article (one row per
+    (article, category) pair), with the percentages scaled to 0-100.
+    :param metrics_file: CSV file written by 'extract_article_metrics'.
+    :param categories_file: Raw categories.tsv file.
+    :return article_metrics: Dataframe of the metrics with 'category' and 'broad_category' columns.
+    """
+    article_metrics = load_article_metrics(metrics_file)
+    for column in ("non_stopword_percentage", "stopword_percentage"):
+        article_metrics[column] = article_metrics[column] * 100
+    categories = pd.read_csv(categories_file, sep="\t", comment="#", names=["article", "category"])
+    categories["article"] = categories["article"].map(unquote)
+    categories["broad_category"] = categories["category"].str.split(".").str[1]
+    return article_metrics.merge(categories, on="article", how="inner")
+
+
+def article_metrics_with_categories(
+    metrics_file=ARTICLE_METRICS_FILE,
+    categories_file=CATEGORIES_FILE,
+    output_file=ARTICLE_METRICS_WITH_CATEGORIES_FILE,
+    cache=None,
+):
+    """
+    Function to build article_metrics_with_categories.pkl through the artifact cache: the merge
+    only reruns when the metrics file, the categories file or the code changed.
+    :param metrics_file: CSV file written by 'extract_article_metrics'.
+    :param categories_file: Raw categories.tsv file.
+    :param output_file: Pickle the merged dataframe is written to (None to skip writing it).
+    :param cache: ArtifactCache, defaults to the one under GENERATED_METRICS.
+    :return article_metrics: Dataframe returned by 'merge_metrics_categories'.
+    """
+    cache = cache or ArtifactCache()
+    result = cache.stage(
+        "article_metrics_with_categories",
+        merge_metrics_categories,
+        files=(metrics_file, categories_file),
+        params={"metrics_file": metrics_file, "categories_file": categories_file},
+    )
+    if output_file is not None and (not result.hit or not os.path.exists(output_file)):
+        result.value.to_pickle(output_file + ".tmp")
+        os.replace(output_file + ".tmp", output_file)
+    return result.value
@@ -0,0 +1,355 @@
+""" Module to benchmark the preprocessing and analysis functions on synthetic data of growing size
+
+Usage: python -m utils.benchmark --sizes 10000 100000 1000000 --baseline old.json
+       python -m utils.benchmark --imports --functions
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from config import GENERATED_METRICS
+
+from .analysis import bootstrap_CI_prob_cat, shortest_path_find
+from .preprocessing import (
+    backclick_summary,
+    create_category_dictionaries,
+    filter_games,
+    get_backclicked_pages,
+    merge_articles_categories,
+)
+from .synthetic import synthetic_articles, synthetic_distance_matrix, synthetic_games, synthetic_links
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+DEFAULT_OUTPUT = os.path.join(GENERATED_METRICS, "benchmarks", "latest.json")
+# modules loaded by headless workers (batch jobs, scoring), which should import in well under a second
+HEADLESS_MODULES = ("utils.preprocessing", "utils.analysis", "utils.path_store", "utils.scoring")
+IMPORT_BUDGET = 0.75
+# from this many games on, the synthetic paths are generated as PathStores: a 'path' column of
+# Python lists would need tens of GB at 10M games before anything is measured
+PATH_STORE_SIZE = 1_000_000
+
+
+class SyntheticData:
+    """
+    Lazily generated synthetic inputs shared by the benchmarks of one size. With use_path_store, the
+    games have no 'path' column and their paths are the (finished, unfinished) PathStores of 'paths'.
+    """
+
+    def __init__(self, size, articles, categories, links, distances, seed=0, use_path_store=False):
+        self.size = size
+        self.articles = articles
+        self.categories = categories
+        self.links = links
+        self.distances = distances
+        self.seed = seed
+        self.use_path_store = use_path_store
+        self._games = None
+        self._paths = None
+        self._broad_categories = None
+
+    def _generate(self):
+        finished, unfinished, paths = synthetic_games(
+            self.size, self.articles, self.links, seed=self.seed, as_path_store=self.use_path_store
+        )
+        self._games, self._paths = (finished, unfinished), paths
+
+    @property
+    def games(self):
+        if self._games is None:
+            self._generate()
+        return self._games
+
+    @property
+    def paths(self):
+        if self._games is None:
+            self._generate()
+        return self._paths
+
+    @property
+    def broad_categories(self):
+        if self._broad_categories is None:
+            self._broad_categories = create_category_dictionaries(self.categories)[1]
+        return self._broad_categories
+
+
+# every benchmark prepares its inputs from the data (untimed) and returns the call to time
+def _filter_games(data):
+    finished, unfinished = data.games
+    return lambda: filter_games(finished, unfinished, verbose=False, paths=data.paths)
+
+
+def _shortest_path_find(data):
+    _, unfinished = data.games
+    paths = data.paths[1] if data.paths else None
+    return lambda: shortest_path_find(unfinished, data.articles, data.distances, paths=paths)
+
+
+def _bootstrap_CI_prob_cat(data):
+    finished, unfinished = data.games
+    category = data.categories["broad_category"].mode()[0]
+    return lambda: bootstrap_CI_prob_cat(
+        finished["target"], unfinished["target"], category, data.broad_categories, seed=data.seed
+    )
+
+
+def _create_category_dictionaries(data):
+    # article-level input: one category table row per game
+    _, categories = synthetic_articles(data.size, seed=data.seed)
+    return lambda: create_category_dictionaries(categories)
+
+
+def _decode_and_apply(func, stores):
+    """Applies func to every path of the stores, decoding one path at a time and dropping the results."""
+    for store in stores:
+        for path in store:
+            func(path)
+
+
+def _get_backclicked_pages(data):
+    if data.paths:
+        return lambda: _decode_and_apply(get_backclicked_pages, data.paths)
+    finished, unfinished = data.games
+    paths = pd.concat([finished["path"], unfinished["path"]], ignore_index=True)
+    return lambda: paths.apply(get_backclicked_pages)
+
+
+def _backclick_summary(data):
+    if data.paths:
+        return lambda: [store.backclicks() for store in data.paths]
+    finished, unfinished = data.games
+    paths = pd.concat([finished["path"], unfinished["path"]], ignore_index=True)
+    return lambda: backclick_summary(paths)
+
+
+def _merge_articles_categories(data):
+    finished, _ = data.games
+    return lambda: merge_articles_categories(finished, ["start", "target"], data.categories)
+
+
+BENCHMARKS = {
+    "filter_games": _filter_games,
+    "shortest_path_find": _shortest_path_find,
+    "bootstrap_CI_prob_cat": _bootstrap_CI_prob_cat,
+    "create_category_dictionaries": _create_category_dictionaries,
+    "get_backclicked_pages": _get_backclicked_pages,
+    "backclick_summary": _backclick_summary,
+    "merge_articles_categories": _merge_articles_categories,
+}
+
+
+def measure(func, repeat=3):
+    """
+    Function to measure the run time and the peak memory of a call.
+    The memory is traced on a separate first run, so tracing does not slow down the timed runs.
+    Tracing started by the caller (e.g. an instrumentation session) is left running.
+    :param func: Callable without arguments.
+    :param repeat: Number of timed runs.
+    :return seconds: Best wall time of the timed runs.
+    :return peak_mb: Peak memory allocated during the call, in MB.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    if started:
+        tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times), peak / 1024**2
+
+
+def run_benchmarks(
+    sizes=DEFAULT_SIZES,
+    functions=None,
+    n_articles=4604,
+    repeat=3,
+    seed=0,
+    verbose=True,
+    path_store_size=PATH_STORE_SIZE,
+):
+    """
+    Function to run the benchmarks on synthetic data of every size.
+    :param sizes: Numbers of games to generate.
+    :param functions: Names of the benchmarks to run, defaults to all of BENCHMARKS.
+    :param n_articles: Number of articles of the synthetic graph.
+    :param repeat: Number of timed runs per measurement.
+    :param seed: Seed of the synthetic data.
+    :param verbose: Whether to print each measurement.
+    :param path_store_size: Sizes from which the paths are generated and passed as PathStores.
+    :return results: Dataframe with function, size, seconds and peak_mb columns.
+    """
+    functions = list(BENCHMARKS) if functions is None else list(functions)
+    unknown = set(functions) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError("Unknown benchmarks: {}".format(sorted(unknown)))
+
+    articles, categories = synthetic_articles(n_articles, seed=seed)
+    links = synthetic_links(articles, seed=seed)
+    distances = synthetic_distance_matrix(articles, links) if "shortest_path_find" in functions else None
+
+    rows = []
+    for size in sizes:
+        data = SyntheticData(
+            size, articles, categories, links, distances, seed=seed, use_path_store=size >= path_store_size
+        )
+        for name in functions:
+            seconds, peak_mb = measure(BENCHMARKS[name](data), repeat=repeat)
+            rows.append({"function": name, "size": int(size), "seconds": seconds, "peak_mb": peak_mb})
+            if verbose:
+                print("{:<30} {:>10} {:>10.3f} s {:>10.1f} MB".format(name, size, seconds, peak_mb))
+    return pd.DataFrame(rows)
+
+
+def import_times(modules=HEADLESS_MODULES, repeat=5):
+    """
+    Function to measure the import time of modules, each in a fresh interpreter so nothing is already loaded.
+    :param modules: Names of the modules to import.
+    :param repeat: Number of interpreters started per module, the best time is kept.
+    :return results: Dataframe with function ('import <module>'), size (0), seconds and peak_mb columns.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = "\n".join(
+        [
+            "import time",
+            "start = time.perf_counter()",
+            "import {}",
+            "seconds = time.perf_counter() - start",
+            "from utils.instrumentation import _max_rss_mb",
+            "print(seconds, _max_rss_mb())",
+        ]
+    )
+    rows = []
+    for module in modules:
+        measures = []
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", code.format(module)], cwd=root, check=True, capture_output=True, text=True
+            ).stdout.split()
+            measures.append((float(output[0]), float(output[1])))
+        seconds, rss_mb = min(measures)
+        rows.append({"function": "import " + module, "size": 0, "seconds": seconds, "peak_mb": rss_mb})
+    return pd.DataFrame(rows)
+
+
+def save_results(results, output_file):
+    """
+    Function to save benchmark results as JSON, along with the environment they were measured in.
+    :param results: Dataframe returned by 'run_benchmarks'.
+    :param output_file: Path of the JSON file.
+    """
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    payload = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results.to_dict(orient="records"),
+    }
+    with open(output_file, "w") as f:
+        json.dump(payload, f, indent=2)
+
+
+def load_results(input_file):
+    """
+    Function to load benchmark results saved by 'save_results'.
+    :param input_file: Path of the JSON file.
+    :return results: Dataframe with function, size, seconds and peak_mb columns.
+    """
+    with open(input_file) as f:
+        return pd.DataFrame(json.load(f)["results"])
+
+
+def compare_results(results, baseline, threshold=0.25, min_seconds=0.01, min_mb=1.0):
+    """
+    Function to compare benchmark results against a baseline.
+    A measurement regresses when it is more than 'threshold' slower (or bigger) than the baseline, and
+    the absolute difference exceeds the noise floor given by min_seconds (or min_mb).
+    :param results: Dataframe returned by 'run_benchmarks'.
+    :param baseline: Dataframe of baseline results.
+    :param threshold: Allowed relative increase, 0.25 allows 25%.
+    :param min_seconds: Time differences below this are ignored.
+    :param min_mb: Memory differences below this are ignored.
+    :return comparison: Dataframe of the measurements present in both, with the time and memory ratios
+    and a 'regression' flag.
+    """
+    comparison = results.merge(baseline, on=["function", "size"], suffixes=("", "_baseline"))
+    comparison["time_ratio"] = comparison["seconds"] / comparison["seconds_baseline"]
+    comparison["memory_ratio"] = comparison["peak_mb"] / comparison["peak_mb_baseline"]
+    slower = (comparison["time_ratio"] > 1 + threshold) & (
+        comparison["seconds"] - comparison["seconds_baseline"] > min_seconds
+    )
+    bigger = (comparison["memory_ratio"] > 1 + threshold) & (
+        comparison["peak_mb"] - comparison["peak_mb_baseline"] > min_mb
+    )
+    comparison["regression"] = slower | bigger
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing and analysis functions.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="numbers of games")
+    parser.add_argument(
+        "--functions", nargs="*", choices=list(BENCHMARKS), default=None, help="benchmarks to run, none with an empty list"
+    )
+    parser.add_argument("--imports", action="store_true", help="also measure the import time of the headless modules")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET, help="maximum import time in seconds")
+    parser.add_argument("--articles", type=int, default=4604, help="number of articles of the synthetic graph")
+    parser.add_argument(
+        "--path-store-size", type=int, default=PATH_STORE_SIZE, help="sizes from which paths are PathStores"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    results = pd.DataFrame(columns=["function", "size", "seconds", "peak_mb"])
+    if args.functions is None or args.functions:
+        results = run_benchmarks(
+            args.sizes, args.functions, args.articles, args.repeat, args.seed, path_store_size=args.path_store_size
+        )
+    status = 0
+    if args.imports:
+        imports = import_times(repeat=args.repeat)
+        print(imports.to_string(index=False))
+        slow = imports[imports["seconds"] > args.import_budget]
+        if len(slow):
+            print("{} module(s) import slower than {:.2f} s".format(len(slow), args.import_budget))
+            status = 1
+        results = pd.concat([results, imports], ignore_index=True)
+    save_results(results, args.output)
+    print("Results saved to {}".format(args.output))
+
+    if args.baseline is None:
+        return status
+    comparison = compare_results(results, load_results(args.baseline), threshold=args.threshold)
+    print(comparison[["function", "size", "seconds", "seconds_baseline", "time_ratio", "memory_ratio", "regression"]])
+    regressions = comparison[comparison["regression"]]
+    if len(regressions):
+        print("{} regression(s) beyond {:.0%}".format(len(regressions), args.threshold))
+        return 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+""" Module to store all functions related to caching generated data artifacts """
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+from typing import Any, NamedTuple
+
+from config import GENERATED_METRICS
+
+from .instrumentation import count
+
+DEFAULT_CACHE_FOLDER = os.path.join(GENERATED_METRICS, "cache")
+DEFAULT_MAX_BYTES = 2 * 1024**3
+INDEX_FILE = "index.json"
+
+
+class StageResult(NamedTuple):
+    """Value of a cached stage, with the key it was stored under and whether it was a cache hit."""
+
+    value: Any
+    key: str
+    hit: bool
+
+
+def code_version(func):
+    """
+    Function to derive a version string from the source code of a function.
+    :param func: Function whose code the artifact depends on.
+    :return version: Hash of the source code (of the qualified name if the source is unavailable).
+    """
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = getattr(func, "__module__", "") + "." + getattr(func, "__qualname__", repr(func))
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+
+def hash_value(value):
+    """
+    Function to hash a parameter value (numbers, strings, containers, dataframes, arrays...).
+    :param value: Any picklable object.
+    :return digest: Hex digest of the value.
+    """
+    if isinstance(value, (str, int, float, bool, type(None))):
+        data = repr(value).encode()
+    elif isinstance(value, dict):
+        data = repr(sorted((str(k), hash_value(v)) for k, v in value.items())).encode()
+    elif isinstance(value, (list, tuple)):
+        data = repr([hash_value(v) for v in value]).encode()
+    else:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    return hashlib.sha256(data).hexdigest()
+
+
+class ArtifactCache:
+    """
+    Content-addressed cache of pickled artifacts. An artifact is keyed by the hash of its stage
+    name, input files, parameters, code version and upstream stage keys, so a change to any of
+    them is a miss while unchanged stages are loaded from disk. The least recently used
+    artifacts are evicted when the cache grows beyond max_bytes.
+    Hits only update the access times in memory: the index is written on put, evict and close
+    (or when leaving a 'with' block), so reads cost no disk write.
+    """
+
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+        self._index_path = os.path.join(folder, INDEX_FILE)
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as f:
+                self._index = json.load(f)
+        else:
+            self._index = {"artifacts": {}, "files": {}}
+        self._dirty = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _save_index(self):
+        tmp = "{}.{}.tmp".format(self._index_path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self._index_path)
+        self._dirty = False
+
+    def close(self):
+        """
+        Function to write the pending access times (and file hashes) to the index.
+        """
+        if self._dirty:
+            self._save_index()
+
+    def _artifact_path(self, key):
+        return os.path.join(self.folder, key + ".pkl")
+
+    def hash_file(self, path):
+        """
+        Function to hash the content of a file, reusing the previous hash while its size and mtime are unchanged.
+        :param path: Path to the file.
+        :return digest: Hex digest of the file content.
+        """
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        known = self._index["files"].get(os.path.abspath(path))
+        if known is not None and known["signature"] == signature:
+            return known["digest"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self._index["files"][os.path.abspath(path)] = {
+            "signature": signature,
+            "digest": digest.hexdigest(),
+        }
+        self._dirty = True
+        return digest.hexdigest()
+
+    def hash_inputs(self, files):
+        """
+        Function to hash input files and folders (all files below a folder are hashed).
+        :param files: Iterable of file or folder paths.
+        :return digest: Hex digest of all the inputs.
+        """
+        digest = hashlib.sha256()
+        for path in sorted(files):
+            if os.path.isdir(path):
+                for root, dirs, names in os.walk(path):
+                    dirs.sort()
+                    for name in sorted(names):
+                        file_path = os.path.join(root, name)
+                        digest.update(os.path.relpath(file_path, path).encode())
+                        digest.update(self.hash_file(file_path).encode())
+            else:
+                digest.update(os.path.basename(path).encode())
+                digest.update(self.hash_file(path).encode())
+        return digest.hexdigest()
+
+    def key(self, name, files=(), params=None, version=None, depends=()):
+        """
+        Function to compute the cache key of a stage.
+        :param name: Name of the stage.
+        :param files: Raw input files or folders the stage reads.
+        :param params: Dictionary of parameters of the stage.
+        :param version: Code version of the stage (see 'code_version').
+        :param depends: Keys of the upstream stages whose artifacts the stage consumes.
+        :return key: Hex digest identifying the artifact.
+        """
+        parts = [name, self.hash_inputs(files), hash_value(params or {}), str(version), *depends]
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def get(self, key):
+        """
+        Function to load an artifact.
+        :param key: Key of the artifact.
+        :return hit: Whether the artifact was in the cache.
+        :return value: The artifact, None on a miss.
+        """
+        entry = self._index["artifacts"].get(key)
+        if entry is None or not os.path.exists(self._artifact_path(key)):
+            count("cache_misses")
+            return False, None
+        with open(self._artifact_path(key), "rb") as f:
+            value = pickle.load(f)
+        entry["last_access"] = time.time()
+        self._dirty = True
+        count("cache_hits")
+        return True, value
+
+    def put(self, key, value, name=""):
+        """
+        Function to store an artifact and evict the least recently used ones beyond the size budget.
+        :param key: Key of the artifact.
+        :param value: Picklable artifact.
+        :param name: Name of the stage, kept for inspection.
+        """
+        path = self._artifact_path(key)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        now = time.time()
+        self._index["artifacts"][key] = {
+            "name": name,
+            "size": os.path.getsize(path),
+            "created": now,
+            "last_access": now,
+        }
+        self.evict()
+
+    def evict(self, max_bytes=None):
+        """
+        Function to remove the least recently used artifacts until the cache fits in max_bytes.
+        :param max_bytes: Size budget, defaults to the one of the cache.
+        :return removed: List of the keys that were evicted.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        artifacts = self._index["artifacts"]
+        total = sum(entry["size"] for entry in artifacts.values())
+        removed = []
+        for key in sorted(artifacts, key=lambda k: artifacts[k]["last_access"]):
+            if total <= max_bytes:
+                break
+            total -= artifacts[key]["size"]
+            if os.path.exists(self._artifact_path(key)):
+                os.remove(self._artifact_path(key))
+            del artifacts[key]
+            removed.append(key)
+        self._save_index()
+        return removed
+
+    def stage(self, name, func, files=(), params=None, version=None, depends=()):
+        """
+        Function to run a stage through the cache: load its artifact on a hit, compute and store it on a miss.
+        :param name: Name of the stage.
+        :param func: Function computing the artifact, called with **params.
+        :param files: Raw input files or folders the stage reads.
+        :param params: Dictionary of keyword arguments of func.
+        :param version: Code version, defaults to the hash of func's source.
+        :param depends: Keys of upstream stages (StageResult.key), so a stale upstream makes this stage stale.
+        :return result: StageResult with the artifact, its key and whether it was a hit.
+        """
+        params = params or {}
+        version = code_version(func) if version is None else version
+        key = self.key(name, files=files, params=params, version=version, depends=depends)
+        hit, value = self.get(key)
+        if not hit:
+            value = func(**params)
+            self.put(key, value, name=name)
+        return StageResult(value, key, hit)
+
+
+def cached(cache, name=None, files=(), version=None):
+    """
+    Decorator to route every call of a function through an ArtifactCache, keyed on its arguments.
+    :param cache: ArtifactCache to store the results in.
+    :param name: Name of the stage, defaults to the function name.
+    :param files: Raw input files or folders the function reads.
+    :param version: Code version, defaults to the hash of the function's source.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        stage = name or func.__name__
+        func_version = code_version(func) if version is None else version
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            # keyed on the arguments by parameter name (so f(1, b=2) and f(1, 2) share a key), with
+            # *args as a tuple and **kwargs as a dict, but called with the bound positional/keyword split
+            key = cache.key(stage, files=files, params=dict(bound.arguments), version=func_version)
+            hit, value = cache.get(key)
+            if not hit:
+                value = func(*bound.args, **bound.kwargs)
+                cache.put(key, value, name=stage)
+            return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,212 @@
+""" Module to store all functions related to article embeddings and semantic similarity """
+
+import os
+import re
+import zlib
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+EMBEDDINGS_FILE = "embeddings.npy"
+ARTICLES_FILE = "articles.npy"
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def sentence_transformer_encoder(model_name="all-MiniLM-L6-v2", batch_size=64, device=None):
+    """
+    Function to create an encoder backed by a sentence-transformers model (loaded on first use).
+    :param model_name: Name or local path of the model.
+    :param batch_size: Batch size used by the model.
+    :param device: Device to run the model on, chosen by sentence-transformers if None.
+    :return encode: Function mapping a list of texts to a (texts x dimension) array.
+    """
+    model = None
+
+    def encode(texts):
+        nonlocal model
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+
+            model = SentenceTransformer(model_name, device=device)
+        return model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+
+    return encode
+
+
+class HashingTfidfEncoder:
+    """
+    Offline encoder: TF-IDF over hashed word features, for when no model weights are available.
+    Words are the lowercased runs of letters and digits ('war,' and '(1945)' give 'war' and '1945').
+    The document frequencies are accumulated batch by batch with 'fit' before encoding.
+    """
+
+    def __init__(self, n_features=1024):
+        self.n_features = n_features
+        self.document_frequency = np.zeros(n_features, dtype=np.int64)
+        self.documents = 0
+
+    def _term_counts(self, texts):
+        counts = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for i, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text.lower())
+            buckets = [zlib.crc32(word.encode()) % self.n_features for word in words]
+            np.add.at(counts[i], buckets, 1)
+        return counts
+
+    def fit(self, texts):
+        """
+        Function to add a batch of texts to the document frequencies.
+        :param texts: List of texts.
+        :return self: The encoder.
+        """
+        self.document_frequency += (self._term_counts(texts) > 0).sum(axis=0)
+        self.documents += len(texts)
+        return self
+
+    def __call__(self, texts):
+        counts = self._term_counts(list(texts))
+        idf = np.log((1 + self.documents) / (1 + self.document_frequency)) + 1
+        return np.log1p(counts) * idf.astype(np.float32)
+
+
+def _read_articles(article_folder):
+    """Returns the decoded names and paths of the articles of a folder, in a stable order."""
+    files = sorted(name for name in os.listdir(article_folder) if name.endswith(".txt"))
+    names = [unquote(name[: -len(".txt")]) for name in files]
+    return names, [os.path.join(article_folder, name) for name in files]
+
+
+def _read_batch(paths):
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            texts.append(f.read())
+    return texts
+
+
+def build_embedding_store(article_folder, output_folder, encoder, batch_size=64, dtype=np.float16):
+    """
+    Function to encode every article of a folder once, in batches, into a memory-mappable matrix
+    of unit-norm embeddings.
+    :param article_folder: Folder of plaintext articles (URL-encoded names with a .txt extension).
+    :param output_folder: Folder the store is written to.
+    :param encoder: Function mapping a list of texts to a (texts x dimension) array. If it has a
+    'fit' method (e.g. HashingTfidfEncoder) it is first fitted on all the articles, batch by batch.
+    :param batch_size: Number of articles read and encoded at a time.
+    :param dtype: Storage type of the embeddings (float16 or float32).
+    :return store: EmbeddingStore of the articles.
+    """
+    names, paths = _read_articles(article_folder)
+    batches = [paths[start : start + batch_size] for start in range(0, len(paths), batch_size)]
+    if hasattr(encoder, "fit"):
+        for batch in batches:
+            encoder.fit(_read_batch(batch))
+
+    os.makedirs(output_folder, exist_ok=True)
+    np.save(os.path.join(output_folder, ARTICLES_FILE), np.asarray(names, dtype=str))
+
+    embeddings = None
+    for i, batch in enumerate(batches):
+        vectors = np.asarray(encoder(_read_batch(batch)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1)
+        if embeddings is None:
+            embeddings = np.lib.format.open_memmap(
+                os.path.join(output_folder, EMBEDDINGS_FILE),
+                mode="w+",
+                dtype=dtype,
+                shape=(len(names), vectors.shape[1]),
+            )
+        start = i * batch_size
+        embeddings[start : start + len(vectors)] = vectors
+    if embeddings is not None:
+        embeddings.flush()
+        del embeddings
+    return EmbeddingStore.load(output_folder)
+
+
+class EmbeddingStore:
+    """
+    Unit-norm article embeddings, row i belonging to articles[i], so cosine similarities are
+    plain dot products. Ids of -1 (unknown articles) give NaN similarities.
+    """
+
+    def __init__(self, articles, embeddings):
+        self.articles = pd.Index(articles)
+        self.embeddings = embeddings
+
+    @classmethod
+    def load(cls, folder, mmap_mode="r"):
+        """
+        Function to load a store written by 'build_embedding_store', memory-mapping the embeddings by default.
+        :param folder: Folder of the store.
+        :param mmap_mode: Memory-map mode passed to np.load (None reads everything into RAM).
+        :return store: EmbeddingStore, empty if the folder holds no embeddings (e.g. no articles were encoded).
+        """
+        if not os.path.exists(os.path.join(folder, EMBEDDINGS_FILE)):
+            return cls(np.array([], dtype=str), np.zeros((0, 0), dtype=np.float32))
+        return cls(
+            np.load(os.path.join(folder, ARTICLES_FILE)),
+            np.load(os.path.join(folder, EMBEDDINGS_FILE), mmap_mode=mmap_mode),
+        )
+
+    def ids(self, names):
+        """
+        Function to translate article names to rows of the store.
+        :param names: Array-like of article names.
+        :return ids: Integer array of rows, -1 for unknown articles.
+        """
+        return self.articles.get_indexer(pd.Index(names))
+
+    def remap(self, vocabulary):
+        """
+        Function to map the ids of another vocabulary (e.g. PathStore.vocabulary) to rows of the store.
+        :param vocabulary: Array of article names indexed by the other ids.
+        :return mapping: Integer array, mapping[other_id] being the row of the store (-1 if unknown).
+        """
+        return self.ids(vocabulary)
+
+    def similarity(self, source_ids, target_ids, chunk_size=1_000_000):
+        """
+        Function to compute the cosine similarity of many (source, target) pairs.
+        :param source_ids: Integer array of rows of the store.
+        :param target_ids: Integer array of rows of the store, same length as source_ids.
+        :param chunk_size: Number of pairs gathered at a time, bounding the memory used.
+        :return similarities: float32 array, NaN where one of the articles is unknown.
+        """
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        target_ids = np.asarray(target_ids, dtype=np.int64)
+        similarities = np.full(len(source_ids), np.nan, dtype=np.float32)
+        known = np.flatnonzero((source_ids >= 0) & (target_ids >= 0))
+        for start in range(0, len(known), chunk_size):
+            rows = known[start : start + chunk_size]
+            sources = np.asarray(self.embeddings[source_ids[rows]], dtype=np.float32)
+            targets = np.asarray(self.embeddings[target_ids[rows]], dtype=np.float32)
+            similarities[rows] = np.einsum("ij,ij->i", sources, targets)
+        return similarities
+
+    def similarity_matrix(self, ids_a, ids_b):
+        """
+        Function to compute the cosine similarity between every article of ids_a and every article of ids_b.
+        :param ids_a: Integer array of known rows of the store.
+        :param ids_b: Integer array of known rows of the store.
+        :return similarities: float32 matrix (len(ids_a) x len(ids_b)).
+        """
+        a = np.asarray(self.embeddings[np.asarray(ids_a)], dtype=np.float32)
+        b = np.asarray(self.embeddings[np.asarray(ids_b)], dtype=np.float32)
+        return a @ b.T
+
+    def path_similarity(self, tokens, offsets, target_ids, chunk_size=1_000_000):
+        """
+        Function to compute the similarity of every step of every path to the target of its game.
+        :param tokens: Flat integer array of rows of the store (see PathStore and 'remap'), -1 for
+        back-clicks and unknown articles.
+        :param offsets: Integer array delimiting the paths in 'tokens'.
+        :param target_ids: Integer array with the row of the target of every path.
+        :param chunk_size: Number of steps gathered at a time, bounding the memory used.
+        :return similarities: float32 array aligned with 'tokens'.
+        """
+        lengths = np.diff(np.asarray(offsets, dtype=np.int64))
+        targets = np.repeat(np.asarray(target_ids, dtype=np.int64), lengths)
+        return self.similarity(tokens, targets, chunk_size=chunk_size)
@@ -0,0 +1,229 @@
+""" Module to store all functions related to SHAP explanations of the tree models """
+
+import hashlib
+import os
+import pickle
+import shutil
+import uuid
+from multiprocessing import Pool
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+VALUES_FILE = "shap_values.npy"
+GAME_IDS_FILE = "game_ids.npy"
+ROW_HASHES_FILE = "row_hashes.npy"
+META_FILE = "meta.npz"
+CURRENT_FILE = "CURRENT"  # name of the generation folder holding the complete files of a store
+
+
+class ShapValues(NamedTuple):
+    """SHAP values of the positive class, row i explaining game game_ids[i]."""
+
+    game_ids: np.ndarray
+    values: np.ndarray
+    base_value: float
+    feature_names: np.ndarray
+    model_version: str
+
+
+def model_version(model):
+    """
+    Function to identify a fitted model by the hash of its pickled state.
+    :param model: Fitted model.
+    :return version: Hex string identifying the model.
+    """
+    return hashlib.sha256(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()[:16]
+
+
+def row_hashes(X):
+    """
+    Function to hash every row of a feature matrix, to detect games whose features changed.
+    :param X: Dense array or scipy.sparse matrix of features.
+    :return hashes: Array of hex digests, one per row.
+    """
+    X = np.ascontiguousarray(X.toarray() if sparse.issparse(X) else X, dtype=np.float64)
+    return np.array([hashlib.sha1(row.tobytes()).hexdigest() for row in X], dtype="U40")
+
+
+def _positive_class(values, expected_value):
+    """Picks the positive class out of the output of TreeExplainer for classifiers."""
+    if isinstance(values, list):
+        values = values[1]
+    elif values.ndim == 3:
+        values = values[:, :, 1]
+    expected_value = np.atleast_1d(expected_value)
+    return values, float(expected_value[-1])
+
+
+_WORKER = {}
+
+
+def _init_worker(model_bytes):
+    import shap
+
+    _WORKER["explainer"] = shap.TreeExplainer(pickle.loads(model_bytes))
+
+
+def _explain_chunk(X):
+    explainer = _WORKER["explainer"]
+    values, base_value = _positive_class(explainer.shap_values(X), explainer.expected_value)
+    return values.astype(np.float32), base_value
+
+
+def _load(folder):
+    current = os.path.join(folder, CURRENT_FILE)
+    if not os.path.exists(current):
+        return None
+    with open(current) as f:
+        folder = os.path.join(folder, f.read().strip())
+    with np.load(os.path.join(folder, META_FILE)) as meta:
+        base_value, feature_names = float(meta["base_value"]), meta["feature_names"]
+    return (
+        np.load(os.path.join(folder, GAME_IDS_FILE), allow_pickle=True),
+        np.load(os.path.join(folder, VALUES_FILE), mmap_mode="r"),
+        np.load(os.path.join(folder, ROW_HASHES_FILE)),
+        base_value,
+        feature_names,
+    )
+
+
+def _save(store, game_ids, values, hashes, base_value, feature_names):
+    """
+    Writes the files of a store into a new generation folder, then points CURRENT at it with an
+    atomic rename, so an interrupted run leaves the previous generation in place.
+    """
+    generation = "generation-{}".format(uuid.uuid4().hex)
+    folder = os.path.join(store, generation)
+    os.makedirs(folder)
+    np.save(os.path.join(folder, VALUES_FILE), values)
+    np.save(os.path.join(folder, GAME_IDS_FILE), game_ids)
+    np.save(os.path.join(folder, ROW_HASHES_FILE), hashes)
+    np.savez(
+        os.path.join(folder, META_FILE),
+        base_value=base_value,
+        feature_names=np.asarray(feature_names, dtype=str),
+    )
+    current = os.path.join(store, CURRENT_FILE)
+    with open(current + ".tmp", "w") as f:
+        f.write(generation)
+    os.replace(current + ".tmp", current)
+
+    # older generations (possibly still memory-mapped by readers on Windows) are removed when possible
+    for name in os.listdir(store):
+        if name.startswith("generation-") and name != generation:
+            shutil.rmtree(os.path.join(store, name), ignore_errors=True)
+
+
+def explain_games(model, X, game_ids, feature_names, folder, chunk_size=500, processes=None):
+    """
+    Function to compute the SHAP values of games with TreeExplainer, in chunks spread over a process
+    pool, and persist them under folder/<model version>. Games already explained by the same model
+    with the same features are not recomputed.
+    :param model: Fitted tree model (e.g. the random forest).
+    :param X: Dense array or scipy.sparse matrix of the features of the games.
+    :param game_ids: Array of unique identifiers of the games (rows of X).
+    :param feature_names: Names of the columns of X.
+    :param folder: Folder of the SHAP stores, one subfolder per model version.
+    :param chunk_size: Number of games explained per task.
+    :param processes: Number of worker processes, defaults to the number of CPUs.
+    :return shap_values: ShapValues of all the games of the store (previous and new).
+    """
+    version = model_version(model)
+    store = os.path.join(folder, version)
+    os.makedirs(store, exist_ok=True)
+
+    game_ids = np.asarray(game_ids)
+    hashes = row_hashes(X)
+    previous = _load(store)
+    if previous is None:
+        old_ids, old_values, old_hashes = np.array([], dtype=game_ids.dtype), None, np.array([], dtype="U40")
+        base_value = None
+    else:
+        old_ids, old_values, old_hashes, base_value, _ = previous
+
+    # games that are new, or whose features changed since they were explained
+    known = pd.Series(old_hashes, index=pd.Index(old_ids))
+    stale = known.reindex(game_ids).to_numpy(dtype=object) != hashes
+    pending = np.flatnonzero(stale)
+
+    new_values = np.zeros((0, len(feature_names)), dtype=np.float32)
+    if len(pending):
+        X_dense = X.toarray() if sparse.issparse(X) else np.asarray(X)
+        chunks = [X_dense[pending[start : start + chunk_size]] for start in range(0, len(pending), chunk_size)]
+        with Pool(processes=processes, initializer=_init_worker, initargs=(pickle.dumps(model),)) as pool:
+            results = pool.map(_explain_chunk, chunks)
+        new_values = np.vstack([values for values, _ in results])
+        base_value = results[0][1]
+
+    # keep the previous games that were not recomputed
+    keep = ~pd.Index(old_ids).isin(game_ids[pending])
+    all_ids = np.concatenate([old_ids[keep], game_ids[pending]])
+    all_hashes = np.concatenate([old_hashes[keep], hashes[pending]])
+    all_values = np.vstack(
+        [np.asarray(old_values)[keep] if old_values is not None else new_values[:0], new_values]
+    )
+
+    if len(pending):
+        _save(store, all_ids, all_values, all_hashes, base_value, feature_names)
+    return ShapValues(all_ids, all_values, base_value, np.asarray(feature_names, dtype=str), version)
+
+
+def load_shap_values(model, folder):
+    """
+    Function to load the stored SHAP values of a model, without computing anything.
+    :param model: Fitted model the values were computed for.
+    :param folder: Folder of the SHAP stores.
+    :return shap_values: ShapValues, None if the model has no stored values.
+    """
+    version = model_version(model)
+    previous = _load(os.path.join(folder, version))
+    if previous is None:
+        return None
+    game_ids, values, _, base_value, feature_names = previous
+    return ShapValues(game_ids, values, base_value, feature_names, version)
+
+
+def game_explanation(shap_values, game_id):
+    """
+    Function to look up the SHAP values of one game.
+    :param shap_values: ShapValues.
+    :param game_id: Identifier of the game.
+    :return explanation: Series of SHAP values indexed by feature name, sorted by absolute value.
+    """
+    row = pd.Index(shap_values.game_ids).get_loc(game_id)
+    explanation = pd.Series(np.asarray(shap_values.values[row]), index=shap_values.feature_names)
+    return explanation.reindex(explanation.abs().sort_values(ascending=False).index)
+
+
+def global_importance(shap_values):
+    """
+    Function to summarize SHAP values into a global feature importance.
+    :param shap_values: ShapValues.
+    :return importance: Series of the mean absolute SHAP value per feature, sorted decreasingly.
+    """
+    importance = np.abs(np.asarray(shap_values.values)).mean(axis=0)
+    return pd.Series(importance, index=shap_values.feature_names).sort_values(ascending=False)
+
+
+def force_plot(shap_values, game_id, features=None):
+    """
+    Function to draw the SHAP force plot of one game from the stored values.
+    :param shap_values: ShapValues.
+    :param game_id: Identifier of the game.
+    :param features: Optional feature values of the game, shown next to the names.
+    :return: The matplotlib figure of the plot.
+    """
+    import shap
+
+    row = pd.Index(shap_values.game_ids).get_loc(game_id)
+    return shap.force_plot(
+        shap_values.base_value,
+        np.asarray(shap_values.values[row]),
+        features=features,
+        feature_names=list(shap_values.feature_names),
+        matplotlib=True,
+        show=False,
+    )
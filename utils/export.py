@@ -0,0 +1,373 @@
+""" Module to store all functions related to exporting pre-aggregated data for the datastory plots
+
+Each plot is described by a PlotSpec whose build function returns a small JSON payload (binned,
+summarized or sparse data) instead of the raw per-game rows. Payloads are only rebuilt when the
+input files, parameters or build code changed.
+
+Usage: python -m utils.export [--output FOLDER] [--budget BYTES] [--force]
+"""
+
+import argparse
+import json
+import os
+from multiprocessing import Pool
+from typing import Any, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from config import DATASTORY_PLOTS, GENERATED_METRICS
+
+from .cache import ArtifactCache, code_version
+from .ingest import DEFAULT_DATASET, GAME_TABLES, load_games, load_vocabulary
+from .preprocessing import build_category_index, merge_category_codes
+from .shortest_paths import UNREACHABLE
+
+DEFAULT_OUTPUT = os.path.join(DATASTORY_PLOTS, "data")
+DEFAULT_BUDGET = 50_000  # bytes per plot payload
+MANIFEST_FILE = "manifest.json"
+DEFAULT_EMBEDDINGS = os.path.join(GENERATED_METRICS, "embeddings")
+PRECISIONS = (6, 4, 3, 2)  # significant float digits tried until a payload fits its budget
+
+
+class PlotSpec(NamedTuple):
+    """
+    A plot payload: build(**params) returns a JSON-serializable dict, read from the 'inputs' files/folders.
+    params defaults to None (no parameters) rather than a dict shared by every spec.
+    """
+
+    name: str
+    build: Any
+    inputs: tuple = ()
+    params: dict = None
+    budget: int = None
+
+
+# -- vectorized aggregations --------------------------------------------------------------------
+
+
+def histogram_payload(samples, bins=60, value_range=None, density=False):
+    """
+    Function to bin several samples on shared edges.
+    :param samples: Dictionary mapping series names to arrays of values (NaNs are dropped).
+    :param bins: Number of bins (or array of edges).
+    :param value_range: Optional (min, max) of the bins, defaults to the range of all the samples.
+    :param density: Whether to normalize every series to a probability density.
+    :return payload: Dictionary with the bin 'edges' and the counts (or densities) of every series.
+    """
+    arrays = {name: np.asarray(values, dtype=np.float64) for name, values in samples.items()}
+    arrays = {name: values[np.isfinite(values)] for name, values in arrays.items()}
+    pooled = np.concatenate(list(arrays.values())) if arrays else np.array([])
+    edges = np.histogram_bin_edges(pooled, bins=bins, range=value_range)
+    series = {name: np.histogram(values, bins=edges, density=density)[0] for name, values in arrays.items()}
+    return {"type": "histogram", "edges": edges, "series": series, "density": density}
+
+
+def quantile_payload(samples, quantiles=(0.0, 0.05, 0.25, 0.5, 0.75, 0.95, 1.0)):
+    """
+    Function to summarize several samples by their quantiles (e.g. to draw box plots).
+    :param samples: Dictionary mapping series names to arrays of values (NaNs are dropped).
+    :param quantiles: Quantiles to compute.
+    :return payload: Dictionary with the quantile levels and, per series, the quantiles, mean and count.
+    """
+    series = {}
+    for name, values in samples.items():
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        series[name] = {
+            "quantiles": np.quantile(values, quantiles) if len(values) else np.full(len(quantiles), np.nan),
+            "mean": values.mean() if len(values) else np.nan,
+            "count": len(values),
+        }
+    return {"type": "quantiles", "levels": np.asarray(quantiles), "series": series}
+
+
+def time_bucket_payload(samples, freq="MS"):
+    """
+    Function to count events per time bucket.
+    :param samples: Dictionary mapping series names to arrays of datetimes (or Unix timestamps in seconds).
+    :param freq: Pandas frequency of the buckets, 'MS' for months.
+    :return payload: Dictionary with the bucket starts (ISO dates) and the counts of every series.
+    """
+    times = {}
+    for name, values in samples.items():
+        values = pd.Series(values)
+        if not pd.api.types.is_datetime64_any_dtype(values):
+            values = pd.to_datetime(values, unit="s")
+        times[name] = values.dropna()
+    pooled = pd.concat(list(times.values()), ignore_index=True)
+    if pooled.empty:
+        return {"type": "time_buckets", "buckets": [], "series": {name: [] for name in times}}
+
+    start = pd.tseries.frequencies.to_offset(freq).rollback(pooled.min().normalize())
+    buckets = pd.date_range(start, pooled.max(), freq=freq)
+    series = {}
+    for name, values in times.items():
+        positions = np.searchsorted(buckets.values, values.values, side="right") - 1
+        series[name] = np.bincount(positions, minlength=len(buckets))
+    return {"type": "time_buckets", "buckets": buckets.strftime("%Y-%m-%d").tolist(), "series": series}
+
+
+def category_matrix_payload(matrices, labels):
+    """
+    Function to export category matrices as sparse triplets.
+    :param matrices: Dictionary mapping series names to scipy.sparse matrices (e.g. from 'category_transition_matrix').
+    :param labels: Category names indexing the rows and columns.
+    :return payload: Dictionary with the labels and, per series, the row, col and value arrays of the nonzero entries.
+    """
+    series = {}
+    for name, matrix in matrices.items():
+        matrix = matrix.tocoo()
+        series[name] = {"row": matrix.row, "col": matrix.col, "value": matrix.data}
+    return {"type": "category_matrix", "labels": list(map(str, labels)), "series": series}
+
+
+def round_significant(values, digits):
+    """
+    Function to round floats to a number of significant digits.
+    :param values: Array-like of floats.
+    :param digits: Number of significant digits.
+    :return rounded: float64 array.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        magnitude = np.floor(np.log10(np.abs(values)))
+    scale = 10.0 ** (digits - 1 - np.where(np.isfinite(magnitude), magnitude, 0))
+    return np.round(values * scale) / scale
+
+
+def _to_builtin(value, digits):
+    """Converts a payload to JSON types, rounding floats to 'digits' significant digits (NaN becomes null)."""
+    if isinstance(value, dict):
+        return {str(key): _to_builtin(item, digits) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_builtin(item, digits) for item in value]
+    if isinstance(value, (float, np.floating)) or (
+        isinstance(value, np.ndarray) and np.issubdtype(value.dtype, np.floating)
+    ):
+        rounded = round_significant(value, digits)
+        return np.where(np.isfinite(rounded), rounded, None).tolist()
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
+
+def encode_payload(payload, budget=DEFAULT_BUDGET):
+    """
+    Function to serialize a payload as compact JSON, lowering the float precision until it fits the budget.
+    :param payload: Dictionary returned by a build function.
+    :param budget: Maximum size in bytes.
+    :return data: Encoded JSON bytes.
+    :return fits: Whether the payload fits the budget at the lowest precision.
+    """
+    for digits in PRECISIONS:
+        data = json.dumps(_to_builtin(payload, digits), separators=(",", ":")).encode()
+        if len(data) <= budget:
+            return data, True
+    return data, False
+
+
+# -- datastory plots built from the ingested dataset (see ingest.ingest_all) -----------------------
+
+
+def _games(dataset):
+    """Returns the timestamps, start ids, target ids and paths of the finished and unfinished games."""
+    games = {}
+    for name, table in (("finished", "paths_finished"), ("unfinished", "paths_unfinished")):
+        df, paths = load_games(table, columns=["timestamp", "target", "path"], dataset=dataset, decode=False)
+        targets = df["target"].to_numpy(dtype=np.int64)
+        games[name] = (df["timestamp"].to_numpy(), paths.first_pages().astype(np.int64), targets, paths)
+    return games
+
+
+def data_availability(dataset, freq="MS"):
+    """Number of finished and unfinished games per month."""
+    games = _games(dataset)
+    return time_bucket_payload({name: timestamps for name, (timestamps, _, _, _) in games.items()}, freq=freq)
+
+
+def shortest_path(dataset):
+    """Distribution of the shortest possible path length of finished and unfinished games."""
+    games = _games(dataset)
+    folder = os.path.join(dataset, "shortest_paths")
+    matrix_articles = np.load(os.path.join(folder, "article.npy")).astype(np.int64)
+    distances = np.load(os.path.join(folder, "distances.npy"), mmap_mode="r")
+    rows = np.full(len(load_vocabulary(dataset)), -1, dtype=np.int64)
+    rows[matrix_articles] = np.arange(len(matrix_articles))
+
+    samples = {}
+    for name, (_, starts, targets, _) in games.items():
+        source, target = rows[starts], rows[targets]
+        found = (source >= 0) & (target >= 0)
+        lengths = distances[source[found], target[found]]
+        samples[name] = lengths[lengths != UNREACHABLE]
+    return histogram_payload(samples, bins=np.arange(0.5, 10.5), density=True)
+
+
+def in_degrees(dataset):
+    """Quantiles of the in-degree of the targets of finished and unfinished games."""
+    games = _games(dataset)
+    link_targets = np.load(os.path.join(dataset, "links", "target.npy")).astype(np.int64)
+    degree = np.bincount(link_targets, minlength=len(load_vocabulary(dataset)))
+    return quantile_payload({name: degree[targets] for name, (_, _, targets, _) in games.items()})
+
+
+def category_strength(dataset):
+    """Sparse start -> target broad category matrices of finished and unfinished games."""
+    from scipy.sparse import coo_matrix
+
+    games = _games(dataset)
+    names = load_vocabulary(dataset)
+    folder = os.path.join(dataset, "categories")
+    categories = pd.DataFrame(
+        {
+            "article": names[np.load(os.path.join(folder, "article.npy"))],
+            "broad_category": pd.Series(np.load(os.path.join(folder, "category.npy"))).str.split(".").str[1],
+        }
+    )
+    index = build_category_index(categories)
+    size = len(index.labels)
+    matrices = {}
+    for name, (_, starts, targets, _) in games.items():
+        pairs = merge_category_codes(
+            pd.DataFrame({"start": names[starts], "target": names[targets]}), ["start", "target"], index
+        )
+        weights = np.ones(len(pairs), dtype=np.int64)
+        matrices[name] = coo_matrix((weights, (pairs["start_code"], pairs["end_code"])), shape=(size, size)).tocsr()
+    return category_matrix_payload(matrices, index.labels)
+
+
+def avg_semantic_sim_distr(dataset, embeddings, bins=60):
+    """Distribution of the average semantic similarity of the pages of a game to its target."""
+    from .embeddings import EmbeddingStore
+
+    games = _games(dataset)
+    store = EmbeddingStore.load(embeddings)
+    # back-clicks are not in the store, so they map to -1 and are skipped
+    mapping = store.remap(load_vocabulary(dataset))
+    samples = {}
+    for name, (_, _, targets, paths) in games.items():
+        similarities = store.path_similarity(mapping[paths.tokens], paths.offsets, mapping[targets])
+        game = np.repeat(np.arange(len(paths)), paths.lengths())
+        known = ~np.isnan(similarities)
+        totals = np.bincount(game[known], weights=similarities[known], minlength=len(paths))
+        steps = np.bincount(game[known], minlength=len(paths))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            samples[name] = totals / steps
+    return histogram_payload(samples, bins=bins, value_range=(0.0, 1.0))
+
+
+def datastory_specs(dataset=DEFAULT_DATASET, embeddings=DEFAULT_EMBEDDINGS):
+    """
+    Function to list the datastory plots that are exported from the ingested dataset.
+    :param dataset: Folder of the dataset written by 'ingest.ingest_all'.
+    :param embeddings: Folder of the EmbeddingStore used for the semantic similarity plot.
+    :return specs: List of PlotSpec.
+    """
+    games = tuple(os.path.join(dataset, table) for table in GAME_TABLES)
+    return [
+        PlotSpec("data_availability", data_availability, games, {"dataset": dataset}),
+        PlotSpec(
+            "shortest_path", shortest_path, games + (os.path.join(dataset, "shortest_paths"),), {"dataset": dataset}
+        ),
+        PlotSpec("in-degrees", in_degrees, games + (os.path.join(dataset, "links"),), {"dataset": dataset}),
+        PlotSpec(
+            "finish-unfinish_category_strength",
+            category_strength,
+            games + (os.path.join(dataset, "categories"),),
+            {"dataset": dataset},
+        ),
+        PlotSpec(
+            "avg_semantic_sim_distr",
+            avg_semantic_sim_distr,
+            games + (embeddings,),
+            {"dataset": dataset, "embeddings": embeddings},
+        ),
+    ]
+
+
+# -- export stage --------------------------------------------------------------------------------
+
+
+def _build(task):
+    name, build, params, budget = task
+    try:
+        data, fits = encode_payload(build(**params), budget)
+        return name, data, fits, None
+    except Exception as error:  # reported per plot, the other plots are still exported
+        return name, None, False, "{}: {}".format(type(error).__name__, error)
+
+
+def export_plots(specs, output_folder=DEFAULT_OUTPUT, budget=DEFAULT_BUDGET, processes=None, force=False, cache=None):
+    """
+    Function to write the payload of every plot to output_folder/<name>.json, rebuilding in parallel
+    only the plots whose inputs, parameters or build code changed since the last export.
+    :param specs: Iterable of PlotSpec.
+    :param output_folder: Folder of the payloads.
+    :param budget: Default maximum payload size in bytes (PlotSpec.budget overrides it).
+    :param processes: Number of worker processes, defaults to the number of CPUs.
+    :param force: Whether to rebuild every plot.
+    :param cache: ArtifactCache used to hash the input files (its file hashes are reused across runs).
+    :return report: Dataframe with the status ('built', 'unchanged', 'missing inputs', 'over budget',
+    'failed'), size and error of every plot.
+    """
+    cache = cache or ArtifactCache()
+    os.makedirs(output_folder, exist_ok=True)
+    manifest_path = os.path.join(output_folder, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    rows, tasks, keys = [], [], {}
+    for spec in specs:
+        params = spec.params or {}
+        if not all(os.path.exists(path) for path in spec.inputs):
+            rows.append({"plot": spec.name, "status": "missing inputs", "bytes": None, "error": None})
+            continue
+        key = cache.key(spec.name, spec.inputs, params, code_version(spec.build))
+        output = os.path.join(output_folder, spec.name + ".json")
+        if not force and manifest.get(spec.name, {}).get("key") == key and os.path.exists(output):
+            rows.append({"plot": spec.name, "status": "unchanged", "bytes": os.path.getsize(output), "error": None})
+            continue
+        keys[spec.name] = key
+        tasks.append((spec.name, spec.build, params, spec.budget or budget))
+
+    if tasks:
+        with Pool(processes=min(processes or os.cpu_count(), len(tasks))) as pool:
+            results = pool.map(_build, tasks, chunksize=1)
+        for name, data, fits, error in results:
+            if error is not None:
+                rows.append({"plot": name, "status": "failed", "bytes": None, "error": error})
+            elif not fits:
+                rows.append({"plot": name, "status": "over budget", "bytes": len(data), "error": None})
+            else:
+                output = os.path.join(output_folder, name + ".json")
+                with open(output + ".tmp", "wb") as f:
+                    f.write(data)
+                os.replace(output + ".tmp", output)
+                manifest[name] = {"key": keys[name], "bytes": len(data)}
+                rows.append({"plot": name, "status": "built", "bytes": len(data), "error": None})
+
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return pd.DataFrame(rows, columns=["plot", "status", "bytes", "error"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the pre-aggregated datastory plot data.")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="folder of the ingested dataset")
+    parser.add_argument("--embeddings", default=DEFAULT_EMBEDDINGS, help="folder of the embedding store")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="maximum payload size in bytes")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="rebuild every plot")
+    args = parser.parse_args()
+
+    report = export_plots(
+        datastory_specs(args.dataset, args.embeddings), args.output, args.budget, args.processes, args.force
+    )
+    print(report.to_string(index=False))
+    if report["status"].isin(["over budget", "failed"]).any():
+        raise SystemExit(1)
@@ -0,0 +1,218 @@
+""" Module to store all functions related to building the feature matrix of the quit-prediction models """
+
+import hashlib
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .analysis import build_article_index, distance_matrix, lookup_article_indices, lookup_shortest_paths
+from .preprocessing import build_category_index
+
+METRICS = [
+    "avg_sent_length",
+    "avg_word_length",
+    "paragraph_count",
+    "readability_score",
+    "stopword_percentage",
+]
+
+
+class ArticleFeatures(NamedTuple):
+    """
+    Per-article lookup arrays, row i belonging to articles[i]: the categories as a CategoryIndex
+    over the same articles, the article metrics and the link degrees.
+    """
+
+    articles: pd.Index
+    categories: object
+    metrics: np.ndarray
+    metric_names: list
+    out_degree: np.ndarray
+    in_degree: np.ndarray
+
+
+class DesignMatrix(NamedTuple):
+    """Feature matrix of a set of games, built for the games at positions 'rows' (the others miss features)."""
+
+    X: sparse.csr_matrix
+    feature_names: list
+    rows: np.ndarray
+
+
+def build_article_features(article_metrics, categories, links=None, metric_names=METRICS):
+    """
+    Function to precompute the per-article lookup arrays used by the feature matrix.
+    :param article_metrics: Dataframe of article metrics with an 'article' column (article_metrics.csv).
+    :param categories: Dataframe containing the categories & broad categories of articles.
+    :param links: Optional dataframe of links ('linkSource', 'linkTarget') for the degrees.
+    :param metric_names: Metric columns to use.
+    :return article_features: ArticleFeatures of the articles of 'article_metrics'.
+    """
+    articles = pd.Index(article_metrics["article"])
+    category_index = build_category_index(categories, column="broad_category")
+    # align the category index with the articles
+    positions = category_index.articles.get_indexer(articles)
+    starts = np.where(positions >= 0, category_index.offsets[positions], 0)
+    lengths = np.where(positions >= 0, category_index.offsets[positions + 1] - starts, 0)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    within = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    category_index = category_index._replace(
+        articles=articles,
+        offsets=offsets,
+        codes=category_index.codes[np.repeat(starts, lengths) + within],
+    )
+
+    out_degree = np.zeros(len(articles), dtype=np.int64)
+    in_degree = np.zeros(len(articles), dtype=np.int64)
+    if links is not None:
+        sources = articles.get_indexer(links["linkSource"])
+        targets = articles.get_indexer(links["linkTarget"])
+        out_degree = np.bincount(sources[sources >= 0], minlength=len(articles))
+        in_degree = np.bincount(targets[targets >= 0], minlength=len(articles))
+
+    return ArticleFeatures(
+        articles=articles,
+        categories=category_index,
+        metrics=article_metrics[metric_names].to_numpy(dtype=np.float64),
+        metric_names=list(metric_names),
+        out_degree=out_degree,
+        in_degree=in_degree,
+    )
+
+
+def _one_hot(ids, category_index, prefix):
+    """Returns the category indicators of the articles 'ids' without the reference (first) category."""
+    lengths = category_index.offsets[ids + 1] - category_index.offsets[ids]
+    rows = np.repeat(np.arange(len(ids)), lengths)
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    codes = category_index.codes[np.repeat(category_index.offsets[ids], lengths) + within]
+    n_labels = len(category_index.labels)
+    matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, codes)), shape=(len(ids), n_labels))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1  # duplicated categories count once
+    matrix = matrix[:, 1:]
+    names = ["{}[T.{}]".format(prefix, label) for label in category_index.labels[1:]]
+    return matrix, names
+
+
+class GameFeatureBuilder:
+    """
+    Builds the feature matrix of games (start/target categories, start/target article metrics,
+    links from source, links to target, shortest path length and start/target similarity) by
+    gathering from the per-article arrays with integer article ids. Column names follow the
+    formula names used by analysis.create_coefplot, categories are one-hot encoded (all the
+    broad categories of an article) against the alphabetically first category.
+    Matrices are kept per dataset version, in memory and in the optional ArtifactCache.
+    """
+
+    def __init__(self, article_features, article_index=None, shortest_paths=None, embeddings=None, cache=None):
+        if shortest_paths is not None and article_index is None:
+            if not hasattr(shortest_paths, "graph"):
+                raise ValueError(
+                    "article_index (see analysis.build_article_index) is required to map article names "
+                    "to the rows of a shortest path matrix."
+                )
+            # node ids of a ShortestPathOracle are the positions in its graph's articles
+            article_index = build_article_index(pd.DataFrame({"article": shortest_paths.graph.articles}))
+        self.article_features = article_features
+        self.article_index = article_index
+        # rows of digit strings are parsed here, once
+        self.shortest_paths = None if shortest_paths is None else distance_matrix(shortest_paths)
+        self.embeddings = embeddings
+        self.cache = cache
+        self._matrices = {}
+
+    def feature_names(self):
+        """Returns the names of the columns of the feature matrix."""
+        labels = self.article_features.categories.labels[1:]
+        names = ["start_broad_category[T.{}]".format(label) for label in labels]
+        names += ["target_broad_category[T.{}]".format(label) for label in labels]
+        names += ["start_" + metric for metric in self.article_features.metric_names]
+        names += ["target_" + metric for metric in self.article_features.metric_names]
+        names += ["links_from_source", "links_to_target"]
+        if self.shortest_paths is not None:
+            names.append("shortest_path_length")
+        if self.embeddings is not None:
+            names.append("sims_start_target")
+        return names
+
+    def _build(self, starts, targets):
+        features = self.article_features
+        start_ids = features.articles.get_indexer(pd.Index(starts))
+        target_ids = features.articles.get_indexer(pd.Index(targets))
+        valid = (start_ids >= 0) & (target_ids >= 0)
+
+        numeric = [
+            features.metrics[start_ids],
+            features.metrics[target_ids],
+            features.out_degree[start_ids][:, None],
+            features.in_degree[target_ids][:, None],
+        ]
+        if self.shortest_paths is not None:
+            lengths = lookup_shortest_paths(
+                lookup_article_indices(starts, self.article_index),
+                lookup_article_indices(targets, self.article_index),
+                self.shortest_paths,
+            )
+            valid &= lengths >= 0
+            numeric.append(lengths[:, None])
+        if self.embeddings is not None:
+            sims = self.embeddings.similarity(self.embeddings.ids(starts), self.embeddings.ids(targets))
+            valid &= ~np.isnan(sims)
+            numeric.append(sims[:, None])
+        numeric = np.hstack(numeric).astype(np.float64)
+        valid &= ~np.isnan(numeric).any(axis=1)
+
+        rows = np.flatnonzero(valid)
+        start_categories, _ = _one_hot(start_ids[rows], features.categories, "start_broad_category")
+        target_categories, _ = _one_hot(target_ids[rows], features.categories, "target_broad_category")
+        X = sparse.hstack(
+            [start_categories, target_categories, sparse.csr_matrix(numeric[rows])], format="csr"
+        )
+        return DesignMatrix(X, self.feature_names(), rows)
+
+    def transform(self, starts, targets, dataset_version=None):
+        """
+        Function to build (or fetch) the feature matrix of a set of games.
+        :param starts: Array of the start article names of the games.
+        :param targets: Array of the target article names of the games.
+        :param dataset_version: Identifier of the set of games, defaults to a hash of the names.
+        :return design_matrix: DesignMatrix of the games with all their features.
+        """
+        starts = np.asarray(starts, dtype=str)
+        targets = np.asarray(targets, dtype=str)
+        if dataset_version is None:
+            digest = hashlib.sha256(starts.tobytes())
+            digest.update(targets.tobytes())
+            dataset_version = digest.hexdigest()
+
+        if dataset_version in self._matrices:
+            return self._matrices[dataset_version]
+        if self.cache is None:
+            design_matrix = self._build(starts, targets)
+        else:
+            key = self.cache.key(
+                "design_matrix", params={"dataset_version": dataset_version}, version=self.version()
+            )
+            hit, design_matrix = self.cache.get(key)
+            if not hit:
+                design_matrix = self._build(starts, targets)
+                self.cache.put(key, design_matrix, name="design_matrix")
+        self._matrices[dataset_version] = design_matrix
+        return design_matrix
+
+    def version(self):
+        """Returns a hash of the per-article arrays the matrices are built from."""
+        features = self.article_features
+        digest = hashlib.sha256()
+        for array in (features.metrics, features.out_degree, features.in_degree, features.categories.codes):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(repr(features.articles.tolist()).encode())
+        if isinstance(self.shortest_paths, np.ndarray):
+            digest.update(np.ascontiguousarray(self.shortest_paths).tobytes())
+        if self.embeddings is not None:
+            digest.update(np.ascontiguousarray(self.embeddings.embeddings).tobytes())
+        digest.update(repr(self.feature_names()).encode())
+        return digest.hexdigest()
@@ -0,0 +1,347 @@
+""" Module to store all functions related to running many hypothesis tests at once
+
+All tests compare two classes (e.g. finished / unfinished games) of every metric within every group
+(e.g. the broad category of the target), from per-(group, class) sufficient statistics instead of a
+scipy call per test. NaNs are ignored per metric, like nan_policy="omit".
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import special
+
+TESTS = ("welch", "pointbiserial", "mannwhitney")
+OVERALL = "all"
+
+
+class GroupedData:
+    """
+    Metric values with integer group codes and binary class labels, sorted by group so that
+    group g is the block of rows offsets[g]:offsets[g + 1].
+    """
+
+    def __init__(self, values, labels, groups=None, group_names=None, metric_names=None):
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        labels = np.asarray(labels).astype(bool)
+        if groups is None:
+            groups = np.zeros(len(labels), dtype=np.int64)
+            group_names = [OVERALL]
+        groups = np.asarray(groups, dtype=np.int64)
+        n_groups = len(group_names) if group_names is not None else int(groups.max()) + 1
+
+        order = np.argsort(groups, kind="stable")
+        self.values = values[order]
+        self.labels = labels[order]
+        self.groups = groups[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(groups, minlength=n_groups))])
+        self.group_names = np.asarray(group_names if group_names is not None else np.arange(n_groups), dtype=object)
+        self.metric_names = np.asarray(
+            metric_names if metric_names is not None else np.arange(values.shape[1]), dtype=object
+        )
+
+    @classmethod
+    def from_frame(cls, df, metrics, label, by=None, overall=True):
+        """
+        Function to build GroupedData from a dataframe.
+        :param df: Dataframe with one row per observation.
+        :param metrics: Columns of the metrics to test.
+        :param label: Boolean column (or Series) splitting the observations in two classes.
+        :param by: Optional column (or Series) of groups, each tested separately.
+        :param overall: Whether to also test all observations together, as group OVERALL.
+        :return data: GroupedData.
+        """
+        labels = df[label] if isinstance(label, str) else label
+        values = df[list(metrics)].to_numpy(dtype=np.float64)
+        if by is None:
+            return cls(values, labels.to_numpy(), metric_names=list(metrics))
+
+        groups, names = pd.factorize(df[by] if isinstance(by, str) else by, sort=True)
+        keep = groups >= 0
+        values, labels, groups, names = values[keep], labels.to_numpy()[keep], groups[keep], list(names)
+        if overall:
+            # the overall group is a copy of every row under an extra code
+            values = np.concatenate([values, values])
+            labels = np.concatenate([labels, labels])
+            groups = np.concatenate([groups, np.full(len(groups), len(names))])
+            names.append(OVERALL)
+        return cls(values, labels, groups, names, list(metrics))
+
+    def moments(self):
+        """
+        Function to compute the sufficient statistics of every (group, class, metric). The squared
+        deviations are summed around the cell means (two passes), so metrics with a large offset
+        (e.g. timestamps) keep their precision.
+        :return counts, means, squared_deviations: Arrays of shape (groups, 2, metrics), class 1 at index 1.
+        """
+        valid = ~np.isnan(self.values)
+        # the sums run on values shifted by the overall mean of every metric
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shift = np.nan_to_num(np.nansum(self.values, axis=0) / valid.sum(axis=0))
+        values = np.where(valid, self.values - shift, 0.0)
+        cell = self.groups * 2 + self.labels
+        n_cells = 2 * len(self.group_names)
+
+        counts = np.empty((n_cells, values.shape[1]))
+        means = np.empty_like(counts)
+        deviations = np.empty_like(counts)
+        for metric in range(values.shape[1]):
+            counts[:, metric] = np.bincount(cell, weights=valid[:, metric], minlength=n_cells)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means[:, metric] = np.bincount(cell, weights=values[:, metric], minlength=n_cells) / counts[:, metric]
+            centered = np.where(valid[:, metric], values[:, metric] - means[cell, metric], 0.0)
+            deviations[:, metric] = np.bincount(cell, weights=centered**2, minlength=n_cells)
+        shape = (len(self.group_names), 2, values.shape[1])
+        return counts.reshape(shape), (means + shift).reshape(shape), deviations.reshape(shape)
+
+
+def _student_t_pvalue(t, df):
+    """Two-sided p-value of a Student t statistic."""
+    return special.stdtr(df, -np.abs(t)) * 2
+
+
+def _normal_pvalue(z):
+    """Two-sided p-value of a standard normal statistic."""
+    return special.erfc(np.abs(z) / np.sqrt(2))
+
+
+def welch_t(counts, means, squared_deviations):
+    """
+    Function to compute Welch's t-test from sufficient statistics, as scipy.stats.ttest_ind(equal_var=False).
+    :param counts, means, squared_deviations: Arrays of shape (..., 2, metrics) returned by GroupedData.moments.
+    :return statistic: t statistics of class 1 against class 0.
+    :return pvalue: Two-sided p-values.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variances = squared_deviations / (counts - 1)
+        errors = variances / counts
+        statistic = (means[..., 1, :] - means[..., 0, :]) / np.sqrt(errors[..., 0, :] + errors[..., 1, :])
+        df = (errors[..., 0, :] + errors[..., 1, :]) ** 2 / (
+            errors[..., 0, :] ** 2 / (counts[..., 0, :] - 1) + errors[..., 1, :] ** 2 / (counts[..., 1, :] - 1)
+        )
+    return statistic, _student_t_pvalue(statistic, df)
+
+
+def point_biserial(counts, means, squared_deviations):
+    """
+    Function to compute the point-biserial correlation between the class and every metric from
+    sufficient statistics, as scipy.stats.pointbiserialr.
+    :param counts, means, squared_deviations: Arrays of shape (..., 2, metrics) returned by GroupedData.moments.
+    :return statistic: Correlation coefficients (positive when class 1 has larger values).
+    :return pvalue: Two-sided p-values.
+    """
+    n = counts.sum(axis=-2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # empty classes contribute nothing to the pooled mean and spread
+        weighted = np.where(counts > 0, counts * means, 0.0)
+        overall = weighted.sum(axis=-2) / n
+        between = np.where(counts > 0, counts * (means - overall[..., None, :]) ** 2, 0.0).sum(axis=-2)
+        std = np.sqrt((squared_deviations.sum(axis=-2) + between) / n)
+        r = (means[..., 1, :] - means[..., 0, :]) / std * np.sqrt(counts[..., 0, :] * counts[..., 1, :]) / n
+        r = np.clip(r, -1, 1)
+        t = r * np.sqrt((n - 2) / (1 - r**2))
+    return r, _student_t_pvalue(t, n - 2)
+
+
+def mann_whitney(data):
+    """
+    Function to compute the Mann-Whitney U test of every (group, metric), with average ranks within
+    each group and the tie-corrected normal approximation with continuity correction, as
+    scipy.stats.mannwhitneyu(method="asymptotic").
+    :param data: GroupedData.
+    :return statistic: U statistics of class 1, of shape (groups, metrics).
+    :return pvalue: Two-sided p-values.
+    """
+    n_groups, n_metrics = len(data.group_names), data.values.shape[1]
+    statistic = np.full((n_groups, n_metrics), np.nan)
+    pvalue = np.full((n_groups, n_metrics), np.nan)
+
+    for metric in range(n_metrics):
+        values = data.values[:, metric]
+        valid = ~np.isnan(values)
+        groups, labels, values = data.groups[valid], data.labels[valid], values[valid]
+        # ranks within groups: sort by (group, value) and average the positions of ties
+        order = np.lexsort((values, groups))
+        groups, labels, values = groups[order], labels[order], values[order]
+        new_run = np.concatenate([[True], (groups[1:] != groups[:-1]) | (values[1:] != values[:-1])])
+        run = np.cumsum(new_run) - 1
+        run_starts = np.flatnonzero(new_run)
+        run_sizes = np.diff(np.append(run_starts, len(values)))
+        group_starts = np.searchsorted(groups, groups[run_starts])
+        # 1-based rank of the first element of each run within its group, averaged over the run
+        run_ranks = run_starts - group_starts + (run_sizes + 1) / 2
+
+        n = np.bincount(groups, minlength=n_groups).astype(np.float64)
+        n1 = np.bincount(groups, weights=labels, minlength=n_groups)
+        n0 = n - n1
+        rank_sums = np.bincount(groups, weights=run_ranks[run] * labels, minlength=n_groups)
+        ties = np.bincount(groups[run_starts], weights=run_sizes.astype(np.float64) ** 3 - run_sizes, minlength=n_groups)
+
+        u1 = rank_sums - n1 * (n1 + 1) / 2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sigma = np.sqrt(n1 * n0 / 12 * ((n + 1) - ties / (n * (n - 1))))
+            z = (np.abs(u1 - n1 * n0 / 2) - 0.5) / sigma
+        statistic[:, metric] = u1
+        pvalue[:, metric] = np.minimum(_normal_pvalue(z), 1.0)
+    return statistic, pvalue
+
+
+def permutation_pvalues(data, n_permutations=10_000, batch_size=None, seed=None, memory_budget=2**25):
+    """
+    Function to test the difference of means of every (group, metric) by shuffling the class labels
+    within each group. A batch of shuffles is a (batch, rows) matrix of 0/1 codes, so the class sums
+    of every shuffle and metric come out of one matrix product per group. The products run in
+    float32 on values centered on their group mean, which keeps metrics with a large offset precise.
+    :param data: GroupedData.
+    :param n_permutations: Number of label shuffles.
+    :param batch_size: Number of shuffles per batch, defaults to what fits in memory_budget.
+    :param seed: Seed (or np.random.Generator) of the shuffles.
+    :param memory_budget: Approximate number of label codes held at a time, when batch_size is not given.
+    :return pvalue: Two-sided p-values of shape (groups, metrics), (1 + extreme shuffles) / (1 + n_permutations).
+    """
+    rng = np.random.default_rng(seed)
+    n_groups, n_metrics = len(data.group_names), data.values.shape[1]
+    valid = ~np.isnan(data.values)
+    pvalue = np.full((n_groups, n_metrics), np.nan)
+
+    def absolute_difference(codes, block_values, block_valid, totals, total_counts):
+        sums = codes @ block_values
+        # without NaNs, the class counts are the same for every metric
+        counts = codes.sum(axis=1, keepdims=True) if block_valid is None else codes @ block_valid
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.abs(sums / counts - (totals - sums) / (total_counts - counts))
+
+    for group in range(n_groups):
+        rows = slice(data.offsets[group], data.offsets[group + 1])
+        labels = data.labels[rows]
+        n, n_1 = len(labels), int(labels.sum())
+        # the absolute difference is symmetric, so shuffles only draw the rows of the smaller class
+        drawn = min(n_1, n - n_1)
+        if drawn == 0:
+            continue
+        block_valid = valid[rows]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            centers = np.nansum(data.values[rows], axis=0) / block_valid.sum(axis=0)
+        block_values = np.where(block_valid, data.values[rows] - centers, 0.0).astype(np.float32)
+        block_valid = None if block_valid.all() else block_valid.astype(np.float32)
+        totals = block_values.sum(axis=0)
+        total_counts = n if block_valid is None else block_valid.sum(axis=0)
+        observed = absolute_difference(
+            labels[None, :].astype(np.float32), block_values, block_valid, totals, total_counts
+        )[0]
+
+        batch = batch_size or max(1, min(n_permutations, memory_budget // n))
+        extreme = np.zeros(n_metrics)
+        for start in range(0, n_permutations, batch):
+            size = min(batch, n_permutations - start)
+            # a uniform random subset of 'drawn' rows per shuffle: the smallest of random keys
+            keys = rng.random((size, n), dtype=np.float32)
+            chosen = np.argpartition(keys, drawn - 1, axis=1)[:, :drawn]
+            codes = np.zeros((size, n), dtype=np.float32)
+            np.put_along_axis(codes, chosen, 1.0, axis=1)
+            differences = absolute_difference(codes, block_values, block_valid, totals, total_counts)
+            # tolerance for the float32 sums of shuffles equal to the observed split
+            extreme += (differences >= observed * (1 - 1e-6)).sum(axis=0)
+        pvalue[group] = np.where(np.isnan(observed), np.nan, (1 + extreme) / (1 + n_permutations))
+    return pvalue
+
+
+def adjust_pvalues(pvalues, method="fdr_bh"):
+    """
+    Function to correct p-values for multiple testing.
+    :param pvalues: Array of p-values, NaNs are left out of the correction.
+    :param method: 'bonferroni', 'holm' or 'fdr_bh' (Benjamini-Hochberg).
+    :return adjusted: Array of adjusted p-values.
+    """
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    adjusted = np.full(pvalues.shape, np.nan)
+    tested = ~np.isnan(pvalues)
+    p = pvalues[tested]
+    m = len(p)
+    order = np.argsort(p)
+    ranked = p[order]
+
+    if method == "bonferroni":
+        result = np.minimum(p * m, 1.0)
+    elif method == "holm":
+        stepped = np.maximum.accumulate(ranked * (m - np.arange(m)))
+        result = np.empty(m)
+        result[order] = np.minimum(stepped, 1.0)
+    elif method == "fdr_bh":
+        stepped = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+        result = np.empty(m)
+        result[order] = np.minimum(stepped, 1.0)
+    else:
+        raise ValueError("method must be either 'bonferroni', 'holm' or 'fdr_bh'.")
+    adjusted[tested] = result
+    return adjusted
+
+
+def compare_groups(
+    df,
+    metrics,
+    label,
+    by=None,
+    tests=TESTS,
+    overall=True,
+    n_permutations=0,
+    correction="fdr_bh",
+    seed=None,
+):
+    """
+    Function to test the difference between two classes of observations (e.g. finished and unfinished
+    games) for every metric within every group, in one vectorized pass.
+    :param df: Dataframe with one row per observation.
+    :param metrics: Columns of the metrics to test.
+    :param label: Boolean column (or Series), True for class 1.
+    :param by: Optional column (or Series) of groups, e.g. the broad category of the target.
+    :param tests: Tests to run, among 'welch', 'pointbiserial' and 'mannwhitney'.
+    :param overall: Whether to also test all observations together, as group 'all'.
+    :param n_permutations: Number of label shuffles of the permutation test of the difference of means
+    (adds a 'permutation' test), 0 to skip it.
+    :param correction: Multiple-testing correction over all the rows ('bonferroni', 'holm', 'fdr_bh'), None to skip it.
+    :param seed: Seed of the permutations.
+    :return results: Tidy dataframe with one row per (group, metric, test): the class sizes and means,
+    statistic, pvalue and pvalue_adjusted.
+    """
+    unknown = set(tests) - set(TESTS)
+    if unknown:
+        raise ValueError("Unknown tests: {}".format(sorted(unknown)))
+    data = GroupedData.from_frame(df, metrics, label, by=by, overall=overall)
+    counts, means, squared_deviations = data.moments()
+
+    computed = {}
+    if "welch" in tests:
+        computed["welch"] = welch_t(counts, means, squared_deviations)
+    if "pointbiserial" in tests:
+        computed["pointbiserial"] = point_biserial(counts, means, squared_deviations)
+    if "mannwhitney" in tests:
+        computed["mannwhitney"] = mann_whitney(data)
+    if n_permutations:
+        observed = means[:, 1, :] - means[:, 0, :]
+        computed["permutation"] = observed, permutation_pvalues(data, n_permutations, seed=seed)
+
+    n_groups, n_metrics = len(data.group_names), len(data.metric_names)
+    frames = []
+    for test, (statistic, pvalue) in computed.items():
+        frames.append(
+            pd.DataFrame(
+                {
+                    "group": np.repeat(data.group_names, n_metrics),
+                    "metric": np.tile(data.metric_names, n_groups),
+                    "test": test,
+                    "n_1": counts[:, 1, :].ravel().astype(np.int64),
+                    "n_0": counts[:, 0, :].ravel().astype(np.int64),
+                    "mean_1": means[:, 1, :].ravel(),
+                    "mean_0": means[:, 0, :].ravel(),
+                    "statistic": statistic.ravel(),
+                    "pvalue": pvalue.ravel(),
+                }
+            )
+        )
+    results = pd.concat(frames, ignore_index=True)
+    if by is None:
+        results = results.drop(columns="group")
+    if correction is not None:
+        results["pvalue_adjusted"] = adjust_pvalues(results["pvalue"].to_numpy(), method=correction)
+    return results
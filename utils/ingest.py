@@ -0,0 +1,402 @@
+""" Module to store all functions related to ingesting the raw Wikispeedia files into a columnar dataset """
+
+import json
+import os
+import shutil
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+from config import GENERATED_METRICS, PATH_GRAPH_FOLDER, PATH_TO_DATA
+from .path_store import BACK_ID, PathStore
+from .preprocessing import BACKCLICK
+from .shortest_paths import DIGIT_DISTANCES
+
+RAW_FOLDER = os.path.join(PATH_TO_DATA, PATH_GRAPH_FOLDER)
+DEFAULT_DATASET = os.path.join(GENERATED_METRICS, "dataset")
+VOCABULARY_FILE = "vocabulary.npy"
+MANIFEST_FILE = "manifest.json"
+
+GAME_TABLES = {
+    "paths_finished": ["hashedIpAddress", "timestamp", "durationInSec", "path", "rating"],
+    "paths_unfinished": ["hashedIpAddress", "timestamp", "durationInSec", "path", "target", "type"],
+}
+
+
+class Vocabulary:
+    """
+    Article names decoded once and numbered in order of appearance, id BACK_ID being the back-click.
+    Ids never change once given, so partitions written earlier stay valid as the vocabulary grows.
+    """
+
+    def __init__(self, names=(BACKCLICK,)):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self._raw = {BACKCLICK: BACK_ID}
+
+    def encode(self, raw_names):
+        """
+        Function to translate raw (URL-encoded) names to ids, decoding every distinct name only once.
+        :param raw_names: Iterable of raw names.
+        :return ids: int32 array of ids.
+        """
+        inverse, unique = pd.factorize(np.asarray(raw_names, dtype=object).reshape(-1))
+        unique_ids = np.empty(len(unique), dtype=np.int32)
+        for i, raw in enumerate(unique):
+            if raw not in self._raw:
+                name = unquote(raw)
+                if name not in self.ids:
+                    self.ids[name] = len(self.names)
+                    self.names.append(name)
+                self._raw[raw] = self.ids[name]
+            unique_ids[i] = self._raw[raw]
+        return unique_ids[inverse]
+
+    def array(self):
+        """Returns the names as an array indexed by id."""
+        return np.asarray(self.names, dtype=str)
+
+
+def _read_manifest(dataset):
+    path = os.path.join(dataset, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"sources": {}, "partitions": {}}
+
+
+def _write_manifest(dataset, manifest):
+    path = os.path.join(dataset, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _load_vocabulary(dataset):
+    path = os.path.join(dataset, VOCABULARY_FILE)
+    if os.path.exists(path):
+        return Vocabulary(np.load(path).tolist())
+    return Vocabulary()
+
+
+def _iter_rows(path, offset, chunk_rows):
+    """Yields (rows, end offset) for chunks of the data lines of a raw tsv file, starting at a byte offset."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        rows = []
+        for line in f:
+            if not line.endswith(b"\n"):
+                # incomplete last line, left for the next ingestion
+                break
+            offset += len(line)
+            text = line.decode("utf-8").rstrip("\n")
+            if not text or text.startswith("#"):
+                continue
+            rows.append(text.split("\t"))
+            if len(rows) == chunk_rows:
+                yield rows, offset
+                rows = []
+        if rows:
+            yield rows, offset
+
+
+def _write_partition(folder, columns, paths):
+    os.makedirs(folder, exist_ok=True)
+    for name, values in columns.items():
+        np.save(os.path.join(folder, name + ".npy"), values)
+    np.save(os.path.join(folder, "path_tokens.npy"), paths.tokens)
+    np.save(os.path.join(folder, "path_offsets.npy"), paths.offsets)
+
+
+def _encode_paths(raw_paths, vocabulary):
+    pages = [path.split(";") for path in raw_paths]
+    lengths = np.fromiter((len(path) for path in pages), dtype=np.int64, count=len(pages))
+    offsets = np.zeros(len(pages) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    tokens = vocabulary.encode([page for path in pages for page in path])
+    return PathStore(tokens.astype(np.int32), offsets, None)
+
+
+def ingest_games(table, raw_file=None, dataset=DEFAULT_DATASET, chunk_rows=100_000, compact=True):
+    """
+    Function to ingest a raw game log (paths_finished.tsv or paths_unfinished.tsv) chunk by chunk into
+    partitions of the dataset. Every partition stores one .npy file per column: the player hash,
+    timestamp, datetime, duration, path length, target id and type (unfinished games) or rating
+    (finished games), plus the path as PathStore tokens/offsets of article ids. Rerunning after the
+    raw file grew only ingests the new lines, into new partitions.
+    :param table: Name of the table, 'paths_finished' or 'paths_unfinished'.
+    :param raw_file: Path to the raw file, defaults to the file of the table in the raw data folder.
+    :param dataset: Folder of the dataset.
+    :param chunk_rows: Number of games per partition (bounding the memory used while ingesting).
+    :param compact: Whether to merge the partitions into one afterwards (see 'compact_games'), so
+    that 'load_games' can memory-map every column instead of concatenating the partitions.
+    :return partitions: List of the partitions written by this run (before compaction).
+    """
+    if table not in GAME_TABLES:
+        raise ValueError("table must be either 'paths_finished' or 'paths_unfinished'.")
+    raw_file = raw_file or os.path.join(RAW_FOLDER, table + ".tsv")
+    os.makedirs(dataset, exist_ok=True)
+    manifest = _read_manifest(dataset)
+    vocabulary = _load_vocabulary(dataset)
+    source = manifest["sources"].setdefault(table, {"file": os.path.abspath(raw_file), "offset": 0})
+    partitions = manifest["partitions"].setdefault(table, [])
+
+    written = []
+    for rows, offset in _iter_rows(raw_file, source["offset"], chunk_rows):
+        chunk = pd.DataFrame(rows, columns=GAME_TABLES[table])
+        paths = _encode_paths(chunk["path"], vocabulary)
+        timestamp = chunk["timestamp"].to_numpy(dtype=np.int64)
+        columns = {
+            "hashedIpAddress": chunk["hashedIpAddress"].to_numpy(dtype=str),
+            "timestamp": timestamp,
+            "datetime": timestamp.astype("datetime64[s]"),
+            "durationInSec": chunk["durationInSec"].to_numpy(dtype=np.int64),
+            "path_length": np.diff(paths.offsets),
+        }
+        if table == "paths_unfinished":
+            columns["target"] = vocabulary.encode(chunk["target"])
+            columns["type"] = chunk["type"].to_numpy(dtype=str)
+        else:
+            columns["target"] = paths.tokens[paths.offsets[1:] - 1]
+            columns["rating"] = pd.to_numeric(chunk["rating"], errors="coerce").to_numpy(dtype=np.float64)
+
+        name = "part-{:05d}".format(len(partitions))
+        _write_partition(os.path.join(dataset, table, name), columns, paths)
+        # the vocabulary is saved before the manifest points at partitions using it
+        np.save(os.path.join(dataset, VOCABULARY_FILE), vocabulary.array())
+        partitions.append(name)
+        source["offset"] = offset
+        _write_manifest(dataset, manifest)
+        written.append(name)
+    if compact and written:
+        compact_games(table, dataset)
+    return written
+
+
+def compact_games(table, dataset=DEFAULT_DATASET):
+    """
+    Function to merge the partitions of a table into a single partition, streaming every column
+    into a memory-mapped file so the table is never held in memory. The manifest switches to the
+    merged partition before the old ones are removed.
+    :param table: Name of the table, 'paths_finished' or 'paths_unfinished'.
+    :param dataset: Folder of the dataset.
+    :return partition: Name of the single partition of the table, None if it has none.
+    """
+    manifest = _read_manifest(dataset)
+    partitions = manifest["partitions"].get(table, [])
+    if len(partitions) <= 1:
+        return partitions[0] if partitions else None
+
+    folders = [os.path.join(dataset, table, name) for name in partitions]
+    compactions = manifest.setdefault("compactions", {})
+    compactions[table] = compactions.get(table, 0) + 1
+    name = "compact-{:05d}".format(compactions[table])
+    output = os.path.join(dataset, table, name)
+    os.makedirs(output, exist_ok=True)
+    for file in sorted(os.listdir(folders[0])):
+        parts = [np.load(os.path.join(folder, file), mmap_mode="r") for folder in folders]
+        if file == "path_offsets.npy":
+            # offsets restart at 0 in every partition
+            merged = np.lib.format.open_memmap(
+                os.path.join(output, file), mode="w+", dtype=np.int64, shape=(sum(len(part) - 1 for part in parts) + 1,)
+            )
+            merged[0] = position = shift = 0
+            for part in parts:
+                merged[position + 1 : position + len(part)] = part[1:] + shift
+                position, shift = position + len(part) - 1, shift + int(part[-1])
+        else:
+            merged = np.lib.format.open_memmap(
+                os.path.join(output, file),
+                mode="w+",
+                dtype=np.result_type(*[part.dtype for part in parts]),
+                shape=(sum(len(part) for part in parts),),
+            )
+            position = 0
+            for part in parts:
+                merged[position : position + len(part)] = part
+                position += len(part)
+        merged.flush()
+        del merged
+
+    manifest["partitions"][table] = [name]
+    _write_manifest(dataset, manifest)
+    for folder in folders:
+        shutil.rmtree(folder, ignore_errors=True)
+    return name
+
+
+def ingest_categories(raw_file=None, dataset=DEFAULT_DATASET):
+    """
+    Function to ingest categories.tsv as integer article ids plus category names.
+    :param raw_file: Path to the raw file, defaults to the one in the raw data folder.
+    :param dataset: Folder of the dataset.
+    :return categories: Dataframe with 'article', 'category' and 'broad_category' columns (decoded names).
+    """
+    raw_file = raw_file or os.path.join(RAW_FOLDER, "categories.tsv")
+    vocabulary = _load_vocabulary(dataset)
+    rows = [row for rows, _ in _iter_rows(raw_file, 0, 1_000_000) for row in rows]
+    raw = pd.DataFrame(rows, columns=["article", "category"])
+    folder = os.path.join(dataset, "categories")
+    os.makedirs(folder, exist_ok=True)
+    ids = vocabulary.encode(raw["article"])
+    np.save(os.path.join(folder, "article.npy"), ids)
+    np.save(os.path.join(folder, "category.npy"), raw["category"].to_numpy(dtype=str))
+    np.save(os.path.join(dataset, VOCABULARY_FILE), vocabulary.array())
+    return pd.DataFrame(
+        {
+            "article": vocabulary.array()[ids],
+            "category": raw["category"].to_numpy(),
+            "broad_category": raw["category"].str.split(".").str[1].to_numpy(),
+        }
+    )
+
+
+def ingest_links(raw_file=None, dataset=DEFAULT_DATASET):
+    """
+    Function to ingest links.tsv as two arrays of article ids.
+    :param raw_file: Path to the raw file, defaults to the one in the raw data folder.
+    :param dataset: Folder of the dataset.
+    :return links: Dataframe with 'linkSource' and 'linkTarget' columns (decoded names).
+    """
+    raw_file = raw_file or os.path.join(RAW_FOLDER, "links.tsv")
+    vocabulary = _load_vocabulary(dataset)
+    rows = [row for rows, _ in _iter_rows(raw_file, 0, 1_000_000) for row in rows]
+    ids = vocabulary.encode(np.asarray(rows, dtype=object).reshape(-1)).reshape(-1, 2)
+    folder = os.path.join(dataset, "links")
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, "source.npy"), ids[:, 0])
+    np.save(os.path.join(folder, "target.npy"), ids[:, 1])
+    np.save(os.path.join(dataset, VOCABULARY_FILE), vocabulary.array())
+    names = vocabulary.array()
+    return pd.DataFrame({"linkSource": names[ids[:, 0]], "linkTarget": names[ids[:, 1]]})
+
+
+def ingest_shortest_paths(raw_file=None, articles_file=None, dataset=DEFAULT_DATASET):
+    """
+    Function to stream the raw distance matrix into a uint8 memory-mapped matrix (UNREACHABLE for '_').
+    Row/column i is the i-th article of articles.tsv, whose ids are saved next to the matrix.
+    :param raw_file: Path to shortest-path-distance-matrix.txt, defaults to the one in the raw data folder.
+    :param articles_file: Path to articles.tsv, defaults to the one in the raw data folder.
+    :param dataset: Folder of the dataset.
+    :return distances: Read-only memory-mapped matrix.
+    :raises ValueError: If the matrix does not have one row of one digit per article.
+    """
+    raw_file = raw_file or os.path.join(RAW_FOLDER, "shortest-path-distance-matrix.txt")
+    articles_file = articles_file or os.path.join(RAW_FOLDER, "articles.tsv")
+    vocabulary = _load_vocabulary(dataset)
+    articles = [row[0] for rows, _ in _iter_rows(articles_file, 0, 1_000_000) for row in rows]
+    ids = vocabulary.encode(articles)
+
+    folder = os.path.join(dataset, "shortest_paths")
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, "article.npy"), ids)
+    np.save(os.path.join(dataset, VOCABULARY_FILE), vocabulary.array())
+
+    # written aside and renamed once complete, so a short or malformed file leaves no matrix
+    matrix_file = os.path.join(folder, "distances.npy")
+    matrix = np.lib.format.open_memmap(matrix_file + ".tmp", mode="w+", dtype=np.uint8, shape=(len(ids), len(ids)))
+    row = 0
+    with open(raw_file, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(b"#"):
+                continue
+            if row == len(ids) or len(line) != len(ids):
+                raise ValueError(
+                    "{} does not match the {} articles of {}: row {} has {} distances.".format(
+                        raw_file, len(ids), articles_file, row, len(line)
+                    )
+                )
+            matrix[row] = DIGIT_DISTANCES[np.frombuffer(line, dtype=np.uint8)]
+            row += 1
+    matrix.flush()
+    del matrix
+    if row != len(ids):
+        os.remove(matrix_file + ".tmp")
+        raise ValueError(
+            "{} has {} rows for the {} articles of {}.".format(raw_file, row, len(ids), articles_file)
+        )
+    os.replace(matrix_file + ".tmp", matrix_file)
+    return np.load(matrix_file, mmap_mode="r")
+
+
+def ingest_all(dataset=DEFAULT_DATASET, raw_folder=RAW_FOLDER, chunk_rows=100_000):
+    """
+    Function to ingest all the raw files of the raw data folder (games are appended incrementally).
+    :param dataset: Folder of the dataset.
+    :param raw_folder: Folder of the raw Wikispeedia files.
+    :param chunk_rows: Number of games per partition.
+    """
+    ingest_shortest_paths(
+        os.path.join(raw_folder, "shortest-path-distance-matrix.txt"),
+        os.path.join(raw_folder, "articles.tsv"),
+        dataset,
+    )
+    ingest_categories(os.path.join(raw_folder, "categories.tsv"), dataset)
+    ingest_links(os.path.join(raw_folder, "links.tsv"), dataset)
+    for table in GAME_TABLES:
+        ingest_games(table, os.path.join(raw_folder, table + ".tsv"), dataset, chunk_rows)
+
+
+def load_vocabulary(dataset=DEFAULT_DATASET):
+    """
+    Function to load the article names of the dataset.
+    :param dataset: Folder of the dataset.
+    :return names: Array of article names indexed by id.
+    """
+    return np.load(os.path.join(dataset, VOCABULARY_FILE))
+
+
+def load_games(table, columns=None, dataset=DEFAULT_DATASET, decode=True, mmap_mode="r"):
+    """
+    Function to load only the requested columns of an ingested table, across all its partitions.
+    The columns of a table with a single partition (see 'compact_games') are memory-mapped as they
+    are; those of several partitions are concatenated in memory.
+    :param table: Name of the table, 'paths_finished' or 'paths_unfinished'.
+    :param columns: Columns to load (all scalar columns if None). 'path' loads the paths as a PathStore.
+    :param dataset: Folder of the dataset.
+    :param decode: Whether to return the 'target' column as article names instead of ids.
+    :param mmap_mode: Memory-map mode of the partition files.
+    :return games: Dataframe of the scalar columns.
+    :return paths: PathStore of the paths if 'path' was requested, else None.
+    """
+    manifest = _read_manifest(dataset)
+    partitions = [os.path.join(dataset, table, name) for name in manifest["partitions"].get(table, [])]
+    if columns is None:
+        columns = [
+            name[: -len(".npy")]
+            for name in sorted(os.listdir(partitions[0]))
+            if name not in ("path_tokens.npy", "path_offsets.npy")
+        ] if partitions else []
+    vocabulary = load_vocabulary(dataset) if os.path.exists(os.path.join(dataset, VOCABULARY_FILE)) else None
+
+    def load(file):
+        parts = [np.load(os.path.join(folder, file), mmap_mode=mmap_mode) for folder in partitions]
+        return parts[0] if len(parts) == 1 else parts
+
+    data = {}
+    for column in columns:
+        if column == "path":
+            continue
+        parts = load(column + ".npy")
+        # plain ndarray views of the memory maps, so the frame holds no np.memmap subclass
+        data[column] = np.asarray(parts) if isinstance(parts, np.ndarray) else np.concatenate(parts) if parts else np.array([])
+    if decode and "target" in data and vocabulary is not None:
+        data["target"] = vocabulary[data["target"].astype(np.int64)]
+    # copy=False keeps the memory-mapped columns as they are
+    games = pd.DataFrame(data, copy=False)
+
+    paths = None
+    if "path" in columns:
+        tokens, offsets = load("path_tokens.npy"), load("path_offsets.npy")
+        if isinstance(tokens, np.ndarray):
+            paths = PathStore(tokens, offsets, vocabulary)
+        else:
+            shifts = np.cumsum([0] + [len(part) for part in tokens[:-1]])
+            all_offsets = np.concatenate(
+                [[0]] + [np.asarray(part[1:]) + shift for part, shift in zip(offsets, shifts)]
+            ).astype(np.int64)
+            all_tokens = np.concatenate(tokens) if tokens else np.array([], dtype=np.int32)
+            paths = PathStore(all_tokens, all_offsets, vocabulary)
+    return games, paths
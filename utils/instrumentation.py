@@ -0,0 +1,321 @@
+""" Module to store all functions related to profiling the analysis pipeline
+
+Instrumentation is off by default: instrumented functions then only pay for one flag check.
+Enable it around a run to record a span per call of every instrumented function:
+
+    with profiling(trace_memory=True) as profile:
+        filter_games(df_finished, df_unfinished)
+    print(profile.summary())
+    profile.save_chrome_trace("trace.json")  # open in chrome://tracing or https://ui.perfetto.dev
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_ENABLED = False
+
+
+def _max_rss_mb():
+    if resource is None:
+        return float("nan")
+    # kilobytes on Linux, bytes on macOS
+    scale = 1024**2 if os.uname().sysname == "Darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def count_rows(value):
+    """
+    Function to count the rows of a function input or output.
+    :param value: Dataframe, series, array, or tuple/list of those (rows are summed).
+    :return rows: Number of rows, None if value has no rows (or is a NamedTuple of unrelated arrays).
+    """
+    if hasattr(value, "shape") and getattr(value, "ndim", 0) >= 1:
+        return int(value.shape[0])
+    if isinstance(value, (tuple, list)) and not hasattr(value, "_fields"):
+        counts = [count_rows(item) for item in value if hasattr(item, "shape")]
+        counts = [rows for rows in counts if rows is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+class Span:
+    """Record of one timed stage: timings, memory, row counts and free-form counters."""
+
+    __slots__ = (
+        "name",
+        "depth",
+        "parent",
+        "start",
+        "wall",
+        "cpu",
+        "peak_mb",
+        "rss_mb",
+        "rows_in",
+        "rows_out",
+        "counters",
+        "thread",
+        "_cpu_start",
+        "_memory_start",
+        "_memory_peak",
+    )
+
+    def __init__(self, name, depth, parent, rows_in=None):
+        self.name = name
+        self.depth = depth
+        self.parent = parent
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.counters = {}
+        self.thread = threading.get_ident()
+        self.wall = self.cpu = self.peak_mb = self.rss_mb = None
+        self._memory_start = self._memory_peak = 0
+
+    def count(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "parent": self.parent,
+            "start": self.start,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "peak_mb": self.peak_mb,
+            "rss_mb": self.rss_mb,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "thread": self.thread,
+            **self.counters,
+        }
+
+
+class Profile:
+    """Spans recorded while instrumentation is enabled."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self):
+        stack = self._stack
+        return stack[-1] if stack else None
+
+    def _open(self, name, rows_in=None):
+        stack = self._stack
+        parent = stack[-1] if stack else None
+        span = Span(name, len(stack), parent.name if parent else None, rows_in)
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # keep the peak reached so far by the parent before resetting it for the child
+            if parent is not None:
+                parent._memory_peak = max(parent._memory_peak, peak)
+            tracemalloc.reset_peak()
+            span._memory_start = span._memory_peak = current
+        stack.append(span)
+        span._cpu_start = time.process_time()
+        span.start = time.perf_counter() - self.origin
+        return span
+
+    def _close(self, span):
+        span.wall = time.perf_counter() - self.origin - span.start
+        span.cpu = time.process_time() - span._cpu_start
+        stack = self._stack
+        stack.pop()
+        if self.trace_memory and tracemalloc.is_tracing():
+            span._memory_peak = max(span._memory_peak, tracemalloc.get_traced_memory()[1])
+            span.peak_mb = (span._memory_peak - span._memory_start) / 1024**2
+            if stack:
+                stack[-1]._memory_peak = max(stack[-1]._memory_peak, span._memory_peak)
+        span.rss_mb = _max_rss_mb()
+        self.spans.append(span)
+
+    def to_frame(self):
+        """
+        Function to list the recorded spans.
+        :return spans: Dataframe with one row per span, in order of completion.
+        """
+        return pd.DataFrame([span.to_dict() for span in self.spans])
+
+    def summary(self):
+        """
+        Function to aggregate the spans per stage.
+        :return summary: Dataframe indexed by stage name with the number of calls, total and mean wall
+        time, total CPU time, largest peak memory and RSS, total rows in/out and summed counters,
+        sorted by total wall time.
+        """
+        spans = self.to_frame()
+        if spans.empty:
+            return spans
+        counters = [column for column in spans.columns if column not in Span.__slots__ and column != "thread"]
+        aggregations = {
+            "calls": ("wall", "size"),
+            "wall": ("wall", "sum"),
+            "mean_wall": ("wall", "mean"),
+            "cpu": ("cpu", "sum"),
+            "peak_mb": ("peak_mb", "max"),
+            "rss_mb": ("rss_mb", "max"),
+            "rows_in": ("rows_in", "sum"),
+            "rows_out": ("rows_out", "sum"),
+        }
+        aggregations.update({counter: (counter, "sum") for counter in counters})
+        return spans.groupby("name").agg(**aggregations).sort_values("wall", ascending=False)
+
+    def save_json(self, output_file):
+        """
+        Function to save the recorded spans as a JSON list.
+        :param output_file: Path of the JSON file.
+        """
+        with open(output_file, "w") as f:
+            json.dump([span.to_dict() for span in self.spans], f, indent=1, default=str)
+
+    def save_chrome_trace(self, output_file):
+        """
+        Function to save the recorded spans in the Chrome trace event format.
+        :param output_file: Path of the JSON file, to open in chrome://tracing or Perfetto.
+        """
+        events = []
+        for span in self.spans:
+            args = {
+                key: value
+                for key, value in span.to_dict().items()
+                if key not in ("name", "start", "wall", "thread", "depth") and value is not None
+            }
+            events.append(
+                {
+                    "name": span.name,
+                    "ph": "X",
+                    "ts": span.start * 1e6,
+                    "dur": span.wall * 1e6,
+                    "pid": os.getpid(),
+                    "tid": span.thread,
+                    "args": args,
+                }
+            )
+        with open(output_file, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+
+_PROFILE = None
+_STARTED_TRACEMALLOC = False  # whether enable() started tracemalloc, so disable() only stops its own tracing
+
+
+def enable(trace_memory=False):
+    """
+    Function to start recording spans.
+    :param trace_memory: Whether to measure the peak memory of every span with tracemalloc
+    (which slows down allocation-heavy code).
+    :return profile: The Profile the spans are recorded into.
+    """
+    global _ENABLED, _PROFILE, _STARTED_TRACEMALLOC
+    _PROFILE = Profile(trace_memory=trace_memory)
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _STARTED_TRACEMALLOC = True
+    _ENABLED = True
+    return _PROFILE
+
+
+def disable():
+    """
+    Function to stop recording spans. tracemalloc is only stopped if enable() started it.
+    :return profile: The Profile the spans were recorded into.
+    """
+    global _ENABLED, _STARTED_TRACEMALLOC
+    _ENABLED = False
+    if _STARTED_TRACEMALLOC:
+        tracemalloc.stop()
+        _STARTED_TRACEMALLOC = False
+    return _PROFILE
+
+
+@contextmanager
+def profiling(trace_memory=False):
+    """
+    Context manager recording the spans of the instrumented functions called in its body.
+    :param trace_memory: Whether to measure the peak memory of every span.
+    :return profile: The Profile the spans are recorded into.
+    """
+    profile = enable(trace_memory=trace_memory)
+    try:
+        yield profile
+    finally:
+        disable()
+
+
+@contextmanager
+def span(name, rows_in=None):
+    """
+    Context manager recording a (possibly nested) span around a block of code.
+    :param name: Name of the stage.
+    :param rows_in: Optional number of input rows.
+    :return span: The Span being recorded (set its rows_out or call its count method), None when disabled.
+    """
+    if not _ENABLED:
+        yield None
+        return
+    profile = _PROFILE
+    current = profile._open(name, rows_in)
+    try:
+        yield current
+    finally:
+        profile._close(current)
+
+
+def count(counter, value=1):
+    """
+    Function to add to a counter (e.g. cache_hits) of the innermost open span. Does nothing when disabled.
+    :param counter: Name of the counter.
+    :param value: Increment.
+    """
+    if _ENABLED:
+        current = _PROFILE.current()
+        if current is not None:
+            current.count(counter, value)
+
+
+def instrument(func=None, name=None):
+    """
+    Decorator recording a span per call of a function, with the rows of its dataframe/series/array
+    arguments and of its result. When instrumentation is disabled the call goes straight through.
+    :param func: Function to instrument.
+    :param name: Name of the stage, defaults to module.function.
+    """
+    if func is None:
+        return functools.partial(instrument, name=name)
+    stage = name or "{}.{}".format(func.__module__.rsplit(".", 1)[-1], func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _ENABLED:
+            return func(*args, **kwargs)
+        profile = _PROFILE
+        current = profile._open(stage, count_rows(list(args) + list(kwargs.values())))
+        try:
+            result = func(*args, **kwargs)
+            current.rows_out = count_rows(result)
+            return result
+        finally:
+            profile._close(current)
+
+    return wrapper
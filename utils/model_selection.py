@@ -0,0 +1,152 @@
+""" Module to store all functions related to evaluating and tuning the quit-prediction models """
+
+import itertools
+import time
+import tracemalloc
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.model_selection import StratifiedKFold
+
+from .analysis import classification_metrics
+
+
+def parameter_grid(grid):
+    """
+    Function to expand a parameter grid into the list of its configurations.
+    :param grid: Dictionary mapping parameter names to lists of values.
+    :return configs: List of parameter dictionaries.
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _share(array, blocks):
+    """Copies an array into a new shared memory block and returns its (name, shape, dtype) descriptor."""
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    blocks.append(block)
+    return block.name, array.shape, array.dtype.str
+
+
+def _attach(descriptor, blocks):
+    name, shape, dtype = descriptor
+    block = shared_memory.SharedMemory(name=name)
+    blocks.append(block)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+_WORKER = {}
+
+
+def _init_worker(X_descriptor, y_descriptor, estimator, configs, n_splits, seed, trace_memory):
+    # a worker forked from a tracing parent inherits its tracing, which would slow down the timed fits
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    blocks = []
+    kind, descriptors, shape = X_descriptor
+    if kind == "csr":
+        data, indices, indptr = (_attach(descriptor, blocks) for descriptor in descriptors)
+        X = sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+    else:
+        X = _attach(descriptors[0], blocks)
+    y = _attach(y_descriptor, blocks)
+
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    _WORKER.update(
+        blocks=blocks,
+        X=X,
+        y=y,
+        estimator=estimator,
+        configs=configs,
+        folds=list(folds.split(np.zeros(len(y)), y)),
+        trace_memory=trace_memory,
+    )
+
+
+def _fit_fold(task):
+    config_id, fold = task
+    params = _WORKER["configs"][config_id]
+    train, test = _WORKER["folds"][fold]
+    X, y = _WORKER["X"], _WORKER["y"]
+    model = clone(_WORKER["estimator"]).set_params(**params)
+
+    # tracing slows down allocation-heavy fits, so the memory is measured on a separate untimed fit
+    peak = np.nan
+    if _WORKER["trace_memory"]:
+        tracemalloc.start()
+        clone(model).fit(X[train], y[train])
+        peak = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+    start = time.perf_counter()
+    model.fit(X[train], y[train])
+    fit_time = time.perf_counter() - start
+
+    row = {"config_id": config_id, "config": repr(params), **params, "fold": fold}
+    row.update(classification_metrics(y[test], model.predict(X[test])))
+    row.update(fit_time=fit_time, peak_memory_mb=peak)
+    return row
+
+
+def cross_validate_grid(
+    estimator, param_grid, X, y, n_splits=5, processes=None, seed=0, trace_memory=True
+):
+    """
+    Function to run stratified k-fold cross-validation of every configuration of a parameter grid
+    over a process pool. X and y are copied once into shared memory that every worker maps,
+    so they are not pickled per task.
+    :param estimator: scikit-learn estimator, cloned and configured for every fit.
+    :param param_grid: Dictionary mapping parameter names to lists of values (or a list of configurations).
+    :param X: Dense array or scipy.sparse matrix of features (e.g. features.DesignMatrix.X).
+    :param y: Array of class labels.
+    :param n_splits: Number of folds.
+    :param processes: Number of worker processes, defaults to the number of CPUs.
+    :param seed: Seed of the fold shuffling, so every configuration sees the same folds.
+    :param trace_memory: Whether to measure the peak (Python-allocated) memory of each fit, on an
+    extra untimed fit so that fit_time is not inflated by tracing.
+    :return results: Dataframe with one row per (configuration, fold): the parameters, accuracy,
+    f1, precision, recall, fit_time (seconds) and peak_memory_mb.
+    """
+    configs = param_grid if isinstance(param_grid, list) else parameter_grid(param_grid)
+    blocks = []
+    try:
+        if sparse.issparse(X):
+            X = sparse.csr_matrix(X)
+            X_descriptor = (
+                "csr",
+                [_share(X.data, blocks), _share(X.indices, blocks), _share(X.indptr, blocks)],
+                X.shape,
+            )
+        else:
+            X_descriptor = ("dense", [_share(np.asarray(X), blocks)], np.shape(X))
+        y_descriptor = _share(np.asarray(y), blocks)
+
+        tasks = [(config_id, fold) for config_id in range(len(configs)) for fold in range(n_splits)]
+        with Pool(
+            processes=processes,
+            initializer=_init_worker,
+            initargs=(X_descriptor, y_descriptor, estimator, configs, n_splits, seed, trace_memory),
+        ) as pool:
+            rows = pool.map(_fit_fold, tasks, chunksize=1)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return pd.DataFrame(rows).sort_values(["config_id", "fold"], ignore_index=True)
+
+
+def summarize_cv_results(results, metrics=("accuracy", "f1", "precision", "recall", "fit_time", "peak_memory_mb")):
+    """
+    Function to aggregate the per-fold results of 'cross_validate_grid' per configuration.
+    :param results: Dataframe returned by 'cross_validate_grid'.
+    :param metrics: Columns to aggregate.
+    :return summary: Dataframe of the mean and standard deviation of every metric per configuration,
+    sorted by mean F1-score.
+    """
+    summary = results.groupby("config")[list(metrics)].agg(["mean", "std"])
+    return summary.sort_values(("f1", "mean"), ascending=False)
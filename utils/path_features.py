@@ -0,0 +1,100 @@
+""" Module to store all functions related to per-step features of game paths """
+
+import numpy as np
+import pandas as pd
+
+from .analysis import MISSING_PATH, distance_matrix, lookup_article_indices, lookup_shortest_paths
+from .path_store import BACK_ID
+from .preprocessing import batch_backclicks
+
+
+def iter_path_progress(
+    paths,
+    targets,
+    article_index=None,
+    shortest_paths=None,
+    out_degree=None,
+    embeddings=None,
+    game_ids=None,
+    chunk_size=100_000,
+):
+    """
+    Function to compute features of every click of every game, on the effective paths (after
+    undoing back-clicks), a chunk of games at a time.
+    :param paths: PathStore of the games.
+    :param targets: Array of the target article names of the games.
+    :param article_index: Series mapping article names to the indices of 'shortest_paths' and
+    'out_degree' (see analysis.build_article_index), required by those two features.
+    :param shortest_paths: Optional shortest path matrix (or ShortestPathOracle) giving 'distance_to_target'.
+    :param out_degree: Optional array of out-degrees by article index giving 'out_degree'.
+    :param embeddings: Optional EmbeddingStore giving 'similarity_to_target'.
+    :param game_ids: Optional array of game identifiers, defaults to the positions of the games.
+    :param chunk_size: Number of games processed at a time, bounding the memory used.
+    :return: Generator of long-format dataframes with one row per (game_id, step), the 'progress'
+    of the step in [0, 1] and the requested features (MISSING_PATH / NaN where unknown).
+    """
+    if article_index is None and (shortest_paths is not None or out_degree is not None):
+        raise ValueError("article_index is required to compute distance_to_target and out_degree.")
+
+    targets = np.asarray(targets)
+    if shortest_paths is not None:
+        # rows of digit strings are parsed once, not per chunk
+        shortest_paths = distance_matrix(shortest_paths)
+    game_ids = np.arange(len(paths)) if game_ids is None else np.asarray(game_ids)
+
+    if article_index is not None:
+        node_of_token = lookup_article_indices(paths.vocabulary, article_index)
+        node_of_token[BACK_ID] = MISSING_PATH
+        node_of_target = lookup_article_indices(targets, article_index)
+    if embeddings is not None:
+        row_of_token = embeddings.remap(paths.vocabulary)
+        row_of_token[BACK_ID] = -1
+        row_of_target = embeddings.ids(targets)
+
+    for start in range(0, len(paths), chunk_size):
+        end = min(start + chunk_size, len(paths))
+        offsets = np.asarray(paths.offsets[start : end + 1])
+        tokens = np.asarray(paths.tokens[offsets[0] : offsets[-1]])
+        summary = batch_backclicks(tokens, offsets - offsets[0], back=BACK_ID)
+
+        lengths = summary.effective_length
+        game = np.repeat(np.arange(start, end), lengths)
+        steps = np.arange(len(summary.effective)) - np.repeat(summary.effective_offsets[:-1], lengths)
+        last_step = np.repeat(lengths - 1, lengths)
+        effective = summary.effective.astype(np.int64)
+
+        chunk = {
+            "game_id": game_ids[game],
+            "step": steps,
+            "progress": np.divide(
+                steps, last_step, out=np.ones(len(steps)), where=last_step > 0
+            ),
+        }
+        if shortest_paths is not None:
+            chunk["distance_to_target"] = lookup_shortest_paths(
+                node_of_token[effective], node_of_target[game], shortest_paths
+            )
+        if out_degree is not None:
+            nodes = node_of_token[effective]
+            chunk["out_degree"] = np.where(
+                nodes != MISSING_PATH, np.asarray(out_degree)[nodes], MISSING_PATH
+            )
+        if embeddings is not None:
+            chunk["similarity_to_target"] = embeddings.similarity(
+                row_of_token[effective], row_of_target[game]
+            )
+        yield pd.DataFrame(chunk)
+
+
+def path_progress_features(paths, targets, **kwargs):
+    """
+    Function to compute the per-step features of all games in one long-format dataframe.
+    :param paths: PathStore of the games.
+    :param targets: Array of the target article names of the games.
+    :param kwargs: Feature sources and chunk size, see 'iter_path_progress'.
+    :return features: Dataframe with one row per (game_id, step).
+    """
+    chunks = list(iter_path_progress(paths, targets, **kwargs))
+    if not chunks:
+        return pd.DataFrame(columns=["game_id", "step", "progress"])
+    return pd.concat(chunks, ignore_index=True)
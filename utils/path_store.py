@@ -0,0 +1,167 @@
+""" Module to store all functions related to the compact, memory-mappable storage of game paths """
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .preprocessing import BACKCLICK, batch_backclicks, flatten_paths
+
+BACK_ID = 0  # reserved article id of the back-click token
+TOKENS_FILE = "tokens.npy"
+OFFSETS_FILE = "offsets.npy"
+VOCABULARY_FILE = "vocabulary.npy"
+
+
+class PathStore:
+    """
+    Paths stored as article ids in one flat int32 token array plus an int64 offsets array:
+    path i is vocabulary[tokens[offsets[i]:offsets[i + 1]]], back-clicks having id BACK_ID.
+    Indexing a store with an integer returns the path as a list of article names, so it can stand
+    in for a 'path' column of lists wherever paths are only read one by one. Indexing with a slice,
+    boolean mask or integer array returns a sub-store of the selected paths (see 'take').
+    """
+
+    def __init__(self, tokens, offsets, vocabulary):
+        self.tokens = tokens
+        self.offsets = offsets
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def from_paths(cls, paths, vocabulary=None):
+        """
+        Function to build a store from a column of paths.
+        :param paths: Pandas Series (or iterable) of paths, each a list of article names.
+        :param vocabulary: Optional array of article names to encode against, BACKCLICK first.
+        Unknown articles are appended to it.
+        :return store: PathStore of the paths, in the same order.
+        """
+        names, offsets = flatten_paths(paths)
+        if vocabulary is None:
+            vocabulary = np.array([BACKCLICK], dtype=str)
+        vocabulary = pd.Index(np.asarray(vocabulary, dtype=str))
+
+        unknown = pd.unique(names[vocabulary.get_indexer(names) < 0])
+        if len(unknown):
+            vocabulary = vocabulary.append(pd.Index(np.asarray(unknown, dtype=str)))
+
+        tokens = vocabulary.get_indexer(names).astype(np.int32)
+        return cls(tokens, offsets, vocabulary.to_numpy(dtype=str))
+
+    @classmethod
+    def load(cls, folder, mmap_mode="r"):
+        """
+        Function to load a store saved with 'save', memory-mapping the arrays by default.
+        :param folder: Folder containing the store.
+        :param mmap_mode: Memory-map mode passed to np.load (None reads everything into RAM).
+        :return store: PathStore backed by the files in 'folder'.
+        """
+        return cls(
+            np.load(os.path.join(folder, TOKENS_FILE), mmap_mode=mmap_mode),
+            np.load(os.path.join(folder, OFFSETS_FILE), mmap_mode=mmap_mode),
+            np.load(os.path.join(folder, VOCABULARY_FILE)),
+        )
+
+    def save(self, folder):
+        """
+        Function to save the store as uncompressed .npy files that can be memory-mapped.
+        :param folder: Folder to write the store to (created if needed).
+        """
+        os.makedirs(folder, exist_ok=True)
+        np.save(os.path.join(folder, TOKENS_FILE), np.asarray(self.tokens, dtype=np.int32))
+        np.save(os.path.join(folder, OFFSETS_FILE), np.asarray(self.offsets, dtype=np.int64))
+        np.save(os.path.join(folder, VOCABULARY_FILE), np.asarray(self.vocabulary, dtype=str))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, (slice, np.ndarray, list, pd.Series)):
+            return self.take(i)
+        if i < 0:
+            i += len(self)
+        return list(self.vocabulary[self.tokens[self.offsets[i] : self.offsets[i + 1]]])
+
+    def take(self, selection):
+        """
+        Function to select some paths without decoding them.
+        :param selection: Slice, boolean mask or integer array of paths.
+        :return store: PathStore of the selected paths, sharing the vocabulary. A slice with step 1
+        gives views of the token array (still memory-mapped), other selections gather the tokens.
+        """
+        if isinstance(selection, slice):
+            start, stop, step = selection.indices(len(self))
+            if step == 1:
+                stop = max(start, stop)
+                begin = self.offsets[start]
+                offsets = np.asarray(self.offsets[start : stop + 1], dtype=np.int64) - begin
+                return PathStore(self.tokens[begin : self.offsets[stop]], offsets, self.vocabulary)
+            selection = np.arange(start, stop, step)
+        selection = np.asarray(selection)
+        if selection.dtype == bool:
+            if len(selection) != len(self):
+                raise IndexError("boolean mask of length {} for {} paths".format(len(selection), len(self)))
+            selection = np.flatnonzero(selection)
+        selection = np.where(selection < 0, selection + len(self), selection).astype(np.int64)
+
+        starts = np.asarray(self.offsets[:-1])[selection]
+        lengths = np.asarray(self.offsets[1:])[selection] - starts
+        offsets = np.zeros(len(selection) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return PathStore(np.asarray(self.tokens[positions]), offsets, self.vocabulary)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def lengths(self):
+        """
+        Function to get the number of tokens (pages and back-clicks) of every path.
+        :return lengths: Integer array of path lengths.
+        """
+        return np.diff(self.offsets)
+
+    def first_pages(self):
+        """
+        Function to get the article id of the first page of every path (BACK_ID for empty paths).
+        :return ids: Integer array of article ids.
+        """
+        lengths = self.lengths()
+        ids = np.full(len(self), BACK_ID, dtype=np.int32)
+        ids[lengths > 0] = self.tokens[self.offsets[:-1][lengths > 0]]
+        return ids
+
+    def encode(self, names):
+        """
+        Function to translate article names to the ids of the store.
+        :param names: Array-like of article names.
+        :return ids: Integer array of article ids, -1 for articles not in the vocabulary.
+        """
+        return pd.Index(self.vocabulary).get_indexer(pd.Index(names))
+
+    def decode(self, ids):
+        """
+        Function to translate article ids of the store back to names.
+        :param ids: Array-like of article ids.
+        :return names: Array of article names.
+        """
+        return self.vocabulary[np.asarray(ids)]
+
+    def backclicks(self):
+        """
+        Function to resolve the back-clicks of every path, see 'batch_backclicks'.
+        :return summary: BackclickSummary with article ids instead of names (quit_page is
+        None for paths without any page left).
+        """
+        return batch_backclicks(self.tokens, self.offsets, back=BACK_ID)
+
+    def to_series(self, index=None):
+        """
+        Function to decode the store into a 'path' column of lists, for code that needs one.
+        :param index: Optional index of the resulting series.
+        :return paths: Pandas Series of paths as lists of article names.
+        """
+        names = self.vocabulary[self.tokens]
+        paths = [list(names[start:end]) for start, end in zip(self.offsets[:-1], self.offsets[1:])]
+        return pd.Series(paths, index=index, dtype=object)
@@ -0,0 +1,219 @@
+""" Module to store all functions related to incrementally aggregated per-player behaviour """
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .preprocessing import BACKCLICK, backclick_summary, category_index_codes, game_lengths
+
+GAME_KINDS = ("finished", "restart", "timeout")
+MAX_TRACKED_LENGTH = 32  # games are counted per length up to this, longer ones share the last bin
+SNAPSHOT_FILE = "players.npz"
+
+
+class PlayerStore:
+    """
+    Running per-player aggregates keyed by hashedIpAddress, held in arrays indexed by player id.
+    Game counts are kept per kind (finished, restart, timeout) and path length, so the number of
+    games of every player for any min_length up to MAX_TRACKED_LENGTH and any type is a lookup.
+    Updating with a batch of games costs O(batch); arrays grow by doubling.
+    Games without a hashedIpAddress belong to no player and are left out, as in 'filter_games'.
+    """
+
+    max_tracked_length = MAX_TRACKED_LENGTH
+
+    def __init__(self, category_labels=(), capacity=1024):
+        self.category_labels = np.asarray(category_labels, dtype=str)
+        self.n_players = 0
+        self.last_timestamp = None
+        self._ids = {}
+        self.game_counts = np.zeros((capacity, len(GAME_KINDS), MAX_TRACKED_LENGTH + 1), dtype=np.int32)
+        self.clicks = np.zeros(capacity, dtype=np.int64)
+        self.backclicks = np.zeros(capacity, dtype=np.int64)
+        self.category_backclicks = np.zeros((capacity, len(self.category_labels)), dtype=np.int32)
+        self.players = np.empty(capacity, dtype=object)
+
+    def _grow(self, size):
+        capacity = len(self.clicks)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for name in ("game_counts", "clicks", "backclicks", "category_backclicks", "players"):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[: self.n_players] = array[: self.n_players]
+            setattr(self, name, grown)
+
+    def player_ids(self, players, create=False):
+        """
+        Function to look up the ids of players.
+        :param players: Array-like of hashedIpAddress values.
+        :param create: Whether to register the unknown players (otherwise their id is -1).
+        :return ids: Integer array of player ids, -1 for missing players.
+        """
+        # missing players get the code -1, which must not index the last unique player
+        codes, uniques = pd.factorize(np.asarray(players, dtype=object))
+        ids = np.fromiter((self._ids.get(player, -1) for player in uniques), dtype=np.int64, count=len(uniques))
+        if create:
+            new = np.flatnonzero(ids < 0)
+            self._grow(self.n_players + len(new))
+            ids[new] = np.arange(self.n_players, self.n_players + len(new))
+            self.players[ids[new]] = uniques[new]
+            self._ids.update(zip(uniques[new], ids[new].tolist()))
+            self.n_players += len(new)
+        player_ids = np.full(len(codes), -1, dtype=np.int64)
+        known = codes >= 0
+        player_ids[known] = ids[codes[known]]
+        return player_ids
+
+    def update(self, games, kind, paths=None, category_index=None):
+        """
+        Function to add a batch of new games to the aggregates.
+        :param games: Dataframe of the games, with 'hashedIpAddress' and 'path' (or 'path_length') columns,
+        and a 'type' column for unfinished games ('timestamp' is used as a watermark when present).
+        :param kind: 'finished' or 'unfinished'.
+        :param paths: Optional PathStore of the paths of the games, used instead of the 'path' column.
+        :param category_index: Optional CategoryIndex (labels matching category_labels) to count back-clicks per category.
+        """
+        if kind not in ("finished", "unfinished"):
+            raise ValueError("kind must be either 'finished' or 'unfinished'.")
+        if len(games) == 0:
+            return
+        ids = self.player_ids(games["hashedIpAddress"].to_numpy(), create=True)
+
+        if paths is not None:
+            lengths = paths.lengths()
+            summary = paths.backclicks()
+            backclicked = paths.vocabulary[summary.backclicked]
+        else:
+            lengths = game_lengths(games)
+            summary = backclick_summary(games["path"], back=BACKCLICK)
+            backclicked = summary.backclicked
+
+        if kind == "finished":
+            kinds = np.zeros(len(games), dtype=np.int64)
+        else:
+            kinds = pd.Index(GAME_KINDS).get_indexer(games["type"])
+            if (kinds <= 0).any():
+                raise ValueError("type of unfinished games must be either 'restart' or 'timeout'.")
+        games_kept = ids >= 0
+        ids_kept = ids[games_kept]
+        np.add.at(
+            self.game_counts,
+            (ids_kept, kinds[games_kept], np.minimum(lengths[games_kept], MAX_TRACKED_LENGTH)),
+            1,
+        )
+        np.add.at(self.clicks, ids_kept, lengths[games_kept])
+        np.add.at(self.backclicks, ids_kept, summary.n_backclicks[games_kept])
+
+        if category_index is not None and len(self.category_labels) and len(backclicked):
+            rows, codes = category_index_codes(backclicked, category_index)
+            # codes follow category_index.labels, mapped onto the store's labels
+            columns = pd.Index(self.category_labels).get_indexer(category_index.labels[codes])
+            backclick_ids = ids[np.repeat(np.arange(len(games)), np.diff(summary.backclicked_offsets))][rows]
+            known = (columns >= 0) & (backclick_ids >= 0)
+            np.add.at(self.category_backclicks, (backclick_ids[known], columns[known]), 1)
+
+        if "timestamp" in games.columns:
+            latest = games["timestamp"].max()
+            self.last_timestamp = latest if self.last_timestamp is None else max(self.last_timestamp, latest)
+
+    def num_games(self, min_length=2, type="restart"):
+        """
+        Function to count the games of every player the way 'filter_games' does.
+        :param min_length: Minimum path length of the games (at most MAX_TRACKED_LENGTH).
+        :param type: Type of unfinished games to count (restart, timeout or all).
+        :return num_games: Series of game counts indexed by hashedIpAddress.
+        """
+        if not 0 <= min_length <= MAX_TRACKED_LENGTH:
+            raise ValueError("min_length must be between 0 and {}.".format(MAX_TRACKED_LENGTH))
+        if type not in ("restart", "timeout", "all"):
+            raise ValueError("type must be either 'restart', 'timeout' or 'all'.")
+        kinds = [0, 1, 2] if type == "all" else [0, GAME_KINDS.index(type)]
+        counts = self.game_counts[: self.n_players][:, kinds, min_length:].sum(axis=(1, 2))
+        return pd.Series(counts, index=pd.Index(self.players[: self.n_players], name="hashedIpAddress"), name="count")
+
+    def players_with(self, min_games=10, min_length=2, type="restart"):
+        """
+        Function to select the players that played at least min_games games, as in 'filter_games'.
+        :param min_games: Minimum number of games.
+        :param min_length: Minimum path length of the games.
+        :param type: Type of unfinished games to count (restart, timeout or all).
+        :return num_games: Series of the game counts of the selected players, indexed by hashedIpAddress.
+        """
+        num_games = self.num_games(min_length, type)
+        return num_games[(num_games >= min_games) & (num_games > 0)]
+
+    def backclick_rate(self):
+        """
+        Function to compute the back-click frequency of every player over all their games.
+        :return rate: Series of back-clicks per click, indexed by hashedIpAddress.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rate = self.backclicks[: self.n_players] / self.clicks[: self.n_players]
+        return pd.Series(rate, index=pd.Index(self.players[: self.n_players], name="hashedIpAddress"))
+
+    def to_frame(self):
+        """
+        Function to list the aggregates of every player.
+        :return players: Dataframe indexed by hashedIpAddress with the finished/restart/timeout game counts,
+        clicks, back-clicks, back-click rate and one back-click count column per category.
+        """
+        n = self.n_players
+        frame = pd.DataFrame(
+            self.game_counts[:n].sum(axis=2),
+            columns=list(GAME_KINDS),
+            index=pd.Index(self.players[:n], name="hashedIpAddress"),
+        )
+        frame["unfinished"] = frame["restart"] + frame["timeout"]
+        frame["games"] = frame["finished"] + frame["unfinished"]
+        frame["clicks"] = self.clicks[:n]
+        frame["backclicks"] = self.backclicks[:n]
+        frame["backclick_rate"] = self.backclick_rate().to_numpy()
+        for column, label in enumerate(self.category_labels):
+            frame["backclicks_" + label] = self.category_backclicks[:n, column]
+        return frame
+
+    def save(self, folder):
+        """
+        Function to snapshot the store to disk (written to a temporary file first, then renamed).
+        :param folder: Folder of the snapshot (created if needed).
+        """
+        os.makedirs(folder, exist_ok=True)
+        n = self.n_players
+        path = os.path.join(folder, SNAPSHOT_FILE)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                players=self.players[:n].astype(str),
+                category_labels=self.category_labels,
+                game_counts=self.game_counts[:n],
+                clicks=self.clicks[:n],
+                backclicks=self.backclicks[:n],
+                category_backclicks=self.category_backclicks[:n],
+                last_timestamp=np.array(np.nan if self.last_timestamp is None else self.last_timestamp),
+            )
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, folder):
+        """
+        Function to load a snapshot saved with 'save'.
+        :param folder: Folder of the snapshot.
+        :return store: PlayerStore.
+        """
+        with np.load(os.path.join(folder, SNAPSHOT_FILE)) as snapshot:
+            players = snapshot["players"].astype(object)
+            store = cls(snapshot["category_labels"], capacity=max(len(players), 1))
+            n = len(players)
+            store.players[:n] = players
+            store.n_players = n
+            store._ids = dict(zip(players, range(n)))
+            store.game_counts[:n] = snapshot["game_counts"]
+            store.clicks[:n] = snapshot["clicks"]
+            store.backclicks[:n] = snapshot["backclicks"]
+            store.category_backclicks[:n] = snapshot["category_backclicks"]
+            last_timestamp = snapshot["last_timestamp"].item()
+            store.last_timestamp = None if np.isnan(last_timestamp) else last_timestamp
+        return store
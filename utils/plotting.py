@@ -0,0 +1,267 @@
+""" Module to store all functions related to plotting the analysis results """
+
+import networkx as nx
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from sklearn.metrics import ConfusionMatrixDisplay
+import matplotlib.colors as colors
+
+from .analysis import category_transition_matrix, classification_metrics
+
+
+def visualize_article_connections_per_category(connections, nodes, description, edge_widths=None):
+    """
+    Function to plot a network (vertices: article categories, edges: strength of connection)
+    :param connections: Edges.
+    :param nodes: Vertices.
+    """
+    weights, labels = category_transition_matrix(connections, labels=pd.unique(nodes["broad_category"]))
+    return draw_category_transitions(weights, labels, description, edge_widths=edge_widths)
+
+
+def draw_category_transitions(weights, labels, description, edge_widths=None):
+    """
+    Function to plot a category transition matrix as a network (vertices: categories, edges: strength of connection)
+    :param weights: Sparse matrix returned by 'category_transition_matrix'.
+    :param labels: Category names indexing the matrix.
+    :param description: Title of the plot.
+    :param edge_widths: Optional edge widths, computed from the weights if not given.
+    :return graph: Networkx graph that was drawn, with the weights in the 'size' edge attribute.
+    :return edge_widths: Edge widths used.
+    """
+    graph = nx.DiGraph()
+    graph.add_nodes_from(labels)
+    weights = weights.tocoo()
+    graph.add_weighted_edges_from(
+        zip(labels[weights.row], labels[weights.col], weights.data.tolist()), weight="size"
+    )
+
+    if edge_widths is None:
+        edge_weights = np.array([graph[u][v]["size"] for u, v in graph.edges()])
+        weight_range = edge_weights.max() - edge_weights.min()
+        normalized_edge_weights = (edge_weights - edge_weights.min()) / weight_range
+        edge_widths = list(normalized_edge_weights * 5)
+
+    plt.figure(figsize=(10, 10))
+    nx.draw(
+        graph,
+        pos=nx.shell_layout(graph),
+        with_labels=True,
+        width=edge_widths,
+        edge_color="gray",
+        arrows=True,
+    )
+    plt.title(description)
+    plt.show()
+
+    return graph, edge_widths
+
+
+def create_coefplot(model_summary, figsize=(14, 18), height_ratios=[0.7, 2.0, 2.5, 2.5]):
+    """
+    Function to plot the coefficient of a statsmodel regression summary, including confidence intervals in the defined variable groups.
+    :param model_summary: a statsmodel summary object
+    :return: A tuple of plt figure and axes
+    """
+    err_series = model_summary.params - model_summary.conf_int()[0]
+    temp_df = pd.DataFrame({"coef": model_summary.params.values[1:],
+                            "error": err_series.values[1:], 
+                            "variable": err_series.index.values[1:]})
+    
+
+    CATEGORIES = {'Start Category: Business_Studies': 'Start Categories',
+    'Start Category: Citizenship': 'Start Categories',
+    'Start Category: Countries': 'Start Categories',
+    'Start Category: Design_and_Technology': 'Start Categories',
+    'Start Category: Everyday_life': 'Start Categories',
+    'Start Category: Geography': 'Start Categories',
+    'Start Category: History': 'Start Categories',
+    'Start Category: IT': 'Start Categories',
+    'Start Category: Language_and_literature': 'Start Categories',
+    'Start Category: Mathematics': 'Start Categories',
+    'Start Category: Music': 'Start Categories',
+    'Start Category: People': 'Start Categories',
+    'Start Category: Religion': 'Start Categories',
+    'Start Category: Science': 'Start Categories',
+    'Target Category: Business_Studies': 'Target Categories',
+    'Target Category: Citizenship': 'Target Categories',
+    'Target Category: Countries': 'Target Categories',
+    'Target Category: Design_and_Technology': 'Target Categories',
+    'Target Category: Everyday_life': 'Target Categories',
+    'Target Category: Geography': 'Target Categories',
+    'Target Category: History': 'Target Categories',
+    'Target Category: IT': 'Target Categories',
+    'Target Category: Language_and_literature': 'Target Categories',
+    'Target Category: Mathematics': 'Target Categories',
+    'Target Category: Music': 'Target Categories',
+    'Target Category: People': 'Target Categories',
+    'Target Category: Religion': 'Target Categories',
+    'Target Category: Science': 'Target Categories',
+    'Start Article: Avg. Sentence Length': 'Article Metrics',
+    'Start Article: Avg. Word Length': 'Article Metrics',
+    'Start Article: Paragraph Count': 'Article Metrics',
+    'Start Article: Readability Score': 'Article Metrics',
+    'Start Article: Stopword Percentage': 'Article Metrics',
+    'Target Article: Avg. Sentence Length': 'Article Metrics',
+    'Target Article: Avg. Word Length': 'Article Metrics',
+    'Target Article: Paragraph Count': 'Article Metrics',
+    'Target Article: Readability Score': 'Article Metrics',
+    'Target Article: Stopword Percentage': 'Article Metrics',
+    'Links from Source': 'Game Difficulty',
+    'Links to Target': 'Game Difficulty',
+    'Shortest Possible Path': 'Game Difficulty',
+    'Semantic Similarity Start Target': 'Game Difficulty'}
+    MAPPING = {
+    # Starting Categories    
+    'start_broad_category[T.Business_Studies]': 'Start Category: Business_Studies',
+    'start_broad_category[T.Citizenship]': 'Start Category: Citizenship',
+    'start_broad_category[T.Countries]': 'Start Category: Countries',
+    'start_broad_category[T.Design_and_Technology]': 'Start Category: Design_and_Technology',
+    'start_broad_category[T.Everyday_life]': 'Start Category: Everyday_life',
+    'start_broad_category[T.Geography]': 'Start Category: Geography',
+    'start_broad_category[T.History]': 'Start Category: History',
+    'start_broad_category[T.IT]': 'Start Category: IT',
+    'start_broad_category[T.Language_and_literature]': 'Start Category: Language_and_literature',
+    'start_broad_category[T.Mathematics]': 'Start Category: Mathematics',
+    'start_broad_category[T.Music]': 'Start Category: Music',
+    'start_broad_category[T.People]': 'Start Category: People',
+    'start_broad_category[T.Religion]': 'Start Category: Religion',
+    'start_broad_category[T.Science]': 'Start Category: Science',
+
+    # Ending Categories
+    'target_broad_category[T.Business_Studies]': 'Target Category: Business_Studies',
+    'target_broad_category[T.Citizenship]': 'Target Category: Citizenship',
+    'target_broad_category[T.Countries]': 'Target Category: Countries',
+    'target_broad_category[T.Design_and_Technology]': 'Target Category: Design_and_Technology',
+    'target_broad_category[T.Everyday_life]': 'Target Category: Everyday_life',
+    'target_broad_category[T.Geography]': 'Target Category: Geography',
+    'target_broad_category[T.History]': 'Target Category: History',
+    'target_broad_category[T.IT]': 'Target Category: IT',
+    'target_broad_category[T.Language_and_literature]': 'Target Category: Language_and_literature',
+    'target_broad_category[T.Mathematics]': 'Target Category: Mathematics',
+    'target_broad_category[T.Music]': 'Target Category: Music',
+    'target_broad_category[T.People]': 'Target Category: People',
+    'target_broad_category[T.Religion]': 'Target Category: Religion',
+    'target_broad_category[T.Science]': 'Target Category: Science',
+
+    # article metrics
+    'start_avg_sent_length': 'Start Article: Avg. Sentence Length',
+    'start_avg_word_length': 'Start Article: Avg. Word Length',
+    'start_paragraph_count': 'Start Article: Paragraph Count',
+    'start_readability_score': 'Start Article: Readability Score',
+    'start_stopword_percentage': 'Start Article: Stopword Percentage',
+
+    'target_avg_sent_length': 'Target Article: Avg. Sentence Length',
+    'target_avg_word_length': 'Target Article: Avg. Word Length',
+    'target_paragraph_count': 'Target Article: Paragraph Count',
+    'target_readability_score': 'Target Article: Readability Score',
+    'target_stopword_percentage': 'Target Article: Stopword Percentage',
+
+    # game difficulty
+    'links_from_source': 'Links from Source',
+    'links_to_target': 'Links to Target',
+    'shortest_path_length': 'Shortest Possible Path',
+    'sims_start_target': 'Semantic Similarity Start Target'}
+    TITLE_SIZE = 14
+    AXIS_SIZE = 12
+
+    temp_df["clean_name"] = temp_df.variable.map(MAPPING)
+    temp_df["group"] = temp_df.clean_name.map(CATEGORIES)
+
+    # sort by coefficent
+    temp_df = temp_df.sort_values(by="coef")
+
+    # make individual dfs for plotting
+    diff = temp_df[temp_df.group == "Game Difficulty"]
+    start = temp_df[temp_df.group == "Start Categories"]
+    target = temp_df[temp_df.group == "Target Categories"]
+    metrics = temp_df[temp_df.group == "Article Metrics"]
+
+    fig, ax = plt.subplots(4, 1, figsize=figsize, gridspec_kw={'height_ratios': height_ratios}, sharex=True)
+
+    ax[0].axvline(0, c="darkgrey", linestyle="--")
+    ax[0].scatter(y="clean_name", x="coef", data=diff, s=120, marker="s", c="coef", norm=colors.CenteredNorm(), cmap="RdYlGn_r")
+    ax[0].errorbar(y="clean_name", x="coef", xerr="error", c="white", data=diff, ecolor="grey", fmt="none" )
+    ax[0].xaxis.set_tick_params(which='both', labelbottom=True)
+    ax[0].set_title("Game Difficulty", fontsize=TITLE_SIZE, fontweight="bold")
+    ax[0].tick_params(axis='both', which='major', labelsize=AXIS_SIZE)
+
+    ax[1].axvline(0, c="darkgrey", linestyle="--")
+    ax[1].errorbar(y="clean_name", x="coef", xerr="error", c="white", data=metrics, ecolor="grey", fmt="none" )
+    ax[1].scatter(y="clean_name", x="coef", data=metrics, s=120, marker="s", c="coef", norm=colors.CenteredNorm(), cmap="RdYlGn_r")
+    ax[1].xaxis.set_tick_params(which='both', labelbottom=True)
+    ax[1].set_title("Article Metrics", fontsize=TITLE_SIZE, fontweight="bold")
+    ax[1].tick_params(axis='both', which='major', labelsize=AXIS_SIZE)
+
+    ax[2].axvline(0, c="darkgrey", linestyle="--")
+    ax[2].errorbar(y="clean_name", x="coef", xerr="error", c="white", data=start, ecolor="grey", fmt="none" )
+    ax[2].scatter(y="clean_name", x="coef", data=start, s=120, marker="s", c="coef", norm=colors.CenteredNorm(), cmap="RdYlGn_r")
+    ax[2].xaxis.set_tick_params(which='both', labelbottom=True)
+    ax[2].set_title("Starting Categories", fontsize=TITLE_SIZE, fontweight="bold")
+    ax[2].tick_params(axis='both', which='major', labelsize=AXIS_SIZE)
+
+    ax[3].axvline(0, c="darkgrey", linestyle="--")
+    ax[3].scatter(y="clean_name", x="coef", data=target, s=120, marker="s", c="coef", norm=colors.CenteredNorm(), cmap="RdYlGn_r")
+    ax[3].errorbar(y="clean_name", x="coef", xerr="error", c="white", data=target, ecolor="grey", fmt="none" )
+    ax[3].xaxis.set_tick_params(which='both', labelbottom=True)
+    ax[3].set_title("Target Categories", fontsize=TITLE_SIZE, fontweight="bold")
+    ax[3].tick_params(axis='both', which='major', labelsize=AXIS_SIZE)
+
+    plt.tight_layout()
+
+    return fig, ax
+
+
+def plot_confusion_matrices(y_test, y_pred):
+    """
+    Function to display the raw and normalized confusion matrices of a set of predictions.
+    :param y_test: array of ground truths
+    :param y_pred: array of predicted class labels
+    :return: A tuple of plt figure and axes
+    """
+    fig, axes = plt.subplots(1, 3, figsize=(14, 8))
+    ConfusionMatrixDisplay.from_predictions(y_test, y_pred, ax=axes[0])
+    axes[0].set_title("Raw Counts")
+    ConfusionMatrixDisplay.from_predictions(y_test, y_pred, normalize="true", ax=axes[1])
+    axes[1].set_title("Normalized by True Values (Per Class Recall)")
+    ConfusionMatrixDisplay.from_predictions(y_test, y_pred, normalize="pred", ax=axes[2])
+    axes[2].set_title("Normalized by Predicted Values (Per Class Precision)")
+    return fig, axes
+
+
+def plot_cv_results(results, metrics=("accuracy", "f1", "precision", "recall")):
+    """
+    Function to plot the per-fold metrics of a cross-validation sweep (see model_selection.cross_validate_grid).
+    :param results: Dataframe with one row per (config, fold).
+    :param metrics: Metric columns to plot.
+    :return: A tuple of plt figure and axes
+    """
+    configs = results["config"].unique()
+    fig, axes = plt.subplots(1, len(metrics), figsize=(4 * len(metrics), 0.5 * len(configs) + 2), sharey=True)
+    for ax, metric in zip(np.atleast_1d(axes), metrics):
+        ax.boxplot([results.loc[results["config"] == config, metric] for config in configs], vert=False)
+        ax.set_yticks(np.arange(1, len(configs) + 1), configs)
+        ax.set_title(metric)
+    plt.tight_layout()
+    return fig, axes
+
+
+def evaluate_predictions(y_test, y_pred, plot=True):
+    """
+    Function to print out classification metrics and display confusion matrices.
+    :param y_test: array of ground truths
+    :param y_pred: array of predicted class labels
+    :param plot: Whether to display the confusion matrices.
+    :return: Dictionary of the metrics (see 'classification_metrics').
+    """
+    metrics = classification_metrics(y_test, y_pred)
+    print(" Accuracy: {:.4f} \n F1-Score: {:.4f} \n Precision: {:.4f}\n Recall: {:.4f}".format(
+            metrics["accuracy"], metrics["f1"], metrics["precision"], metrics["recall"]
+        )  
+    )
+
+    if plot:
+        fig, _ = plot_confusion_matrices(y_test, y_pred)
+        fig.show()
+    return metrics
@@ -1,8 +1,14 @@
 """ Module to store all functions related to data preprocessing """
 
+from itertools import chain
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
-import pycountry
 
+from .instrumentation import count, instrument
+
+@instrument
 def merge_articles_categories(df, left_on, articles_categories):
     """
     Function to merge article categories.
@@ -37,6 +43,7 @@ def merge_articles_categories(df, left_on, articles_categories):
     return merged_df
 
 
+@instrument
 def create_category_dictionaries(categories):
     """
     Function to create dictionaries of categories & broad categories of articles.
@@ -46,29 +53,108 @@ def create_category_dictionaries(categories):
     """
     article_to_category = {}
     article_to_broad_category = {}
-    for i in range(len(categories)):
-        if categories.iloc[i]["article"] in article_to_category:
-            article_to_category[categories.iloc[i]["article"]].append(
-                categories.iloc[i]["category"]
-            )
-            article_to_broad_category[categories.iloc[i]["article"]].append(
-                categories.iloc[i]["broad_category"]
-            )
-        else:
-            article_to_category[categories.iloc[i]["article"]] = [
-                categories.iloc[i]["category"]
-            ]
-            article_to_broad_category[categories.iloc[i]["article"]] = [
-                categories.iloc[i]["broad_category"]
-            ]
+    for article, category, broad_category in zip(
+        categories["article"], categories["category"], categories["broad_category"]
+    ):
+        article_to_category.setdefault(article, []).append(category)
+        article_to_broad_category.setdefault(article, []).append(broad_category)
     return article_to_category, article_to_broad_category
 
 
+class CategoryIndex(NamedTuple):
+    """
+    Compact (CSR-style) mapping of articles to categories: the categories of articles[i]
+    are labels[codes[offsets[i]:offsets[i + 1]]].
+    """
+
+    articles: pd.Index
+    offsets: np.ndarray
+    codes: np.ndarray
+    labels: np.ndarray
+
+
+@instrument
+def build_category_index(categories, column="broad_category"):
+    """
+    Function to create a compact index of the categories of articles, with categories as integer codes.
+    :param categories: Dataframe containing the categories & broad categories of articles.
+    :param column: Column of 'categories' to index (category/broad_category).
+    :return category_index: CategoryIndex of the articles, labels sorted alphabetically.
+    """
+    article_codes, articles = pd.factorize(categories["article"], sort=False)
+    labels, codes = np.unique(categories[column].to_numpy(dtype=str), return_inverse=True)
+
+    # stable sort keeps the row order of the categories of each article
+    order = np.argsort(article_codes, kind="stable")
+    counts = np.bincount(article_codes[article_codes >= 0], minlength=len(articles))
+    offsets = np.zeros(len(articles) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    order = order[article_codes[order] >= 0]
+    return CategoryIndex(
+        articles=pd.Index(articles),
+        offsets=offsets,
+        codes=codes[order].astype(np.int32),
+        labels=labels,
+    )
+
+
+def category_index_codes(names, category_index):
+    """
+    Function to look up the categories of many articles at once.
+    :param names: Array-like of article names.
+    :param category_index: CategoryIndex returned by 'build_category_index'.
+    :return rows: Integer array with the position in 'names' of each (article, category) pair.
+    :return codes: Integer array with the category code of each (article, category) pair.
+    """
+    positions = category_index.articles.get_indexer(pd.Index(names))
+    found = np.flatnonzero(positions >= 0)
+    starts = category_index.offsets[positions[found]]
+    lengths = category_index.offsets[positions[found] + 1] - starts
+
+    rows = np.repeat(found, lengths)
+    # position of every pair inside its article's slice of 'codes'
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    codes = category_index.codes[np.repeat(starts, lengths) + within]
+    return rows, codes.astype(np.int64)
+
+
+@instrument
+def merge_category_codes(df, left_on, category_index):
+    """
+    Function to merge article categories as integer codes, the counterpart of 'merge_articles_categories'
+    working on a CategoryIndex instead of string merges.
+    :param df: Dataframe to be merged on.
+    :param left_on: Specifying the columns containing the start and end article names.
+    :param category_index: CategoryIndex returned by 'build_category_index'.
+    :return merged_df: Dataframe with one row per (start category, end category) pair of each row of df,
+    with the codes in the 'start_code' and 'end_code' columns (labels in category_index.labels).
+    """
+    rows_start, codes_start = category_index_codes(df[left_on[0]], category_index)
+    rows_end, codes_end = category_index_codes(df[left_on[1]], category_index)
+
+    # pair every start category of a row with every end category of the same row
+    end_counts = np.bincount(rows_end, minlength=len(df))
+    end_offsets = np.concatenate([[0], np.cumsum(end_counts)])
+    repeats = end_counts[rows_start]
+    pair_start = np.repeat(np.arange(len(rows_start)), repeats)
+    pair_end = np.repeat(end_offsets[rows_start], repeats) + (
+        np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    )
+
+    merged_df = df.iloc[rows_start[pair_start]].copy()
+    merged_df["start_code"] = codes_start[pair_start]
+    merged_df["end_code"] = codes_end[pair_end]
+    return merged_df
+
+
 def country_codes_dict():
     """
     Function to create a dictionary of country codes.
     :return country_codes: Dictionary mapping country names to iso-alpha-3 codes.
     """
+    import pycountry
+
     country_codes = {}
     for country in pycountry.countries:
         country_codes[country.name] = country.alpha_3
@@ -150,78 +236,326 @@ def get_quitted_page(path):
             return clean_path[-1]
 
 
+BACKCLICK = "<"
+
+
+class BackclickSummary(NamedTuple):
+    """
+    Columnar result of 'batch_backclicks'. Per-game lists are stored flat, the entries of game i
+    being tokens[offsets[i]:offsets[i + 1]].
+    """
+
+    backclicked: np.ndarray
+    backclicked_offsets: np.ndarray
+    effective: np.ndarray
+    effective_offsets: np.ndarray
+    quit_page: np.ndarray
+    n_backclicks: np.ndarray
+    effective_length: np.ndarray
+
+
+@instrument
+def flatten_paths(paths):
+    """
+    Function to flatten a column of paths into one token array plus offsets.
+    :param paths: Pandas Series (or iterable) of paths, each a list of pages (None counts as empty).
+    :return tokens: Object array with the pages of all paths, one after the other.
+    :return offsets: Integer array of length len(paths) + 1, path i being tokens[offsets[i]:offsets[i + 1]].
+    """
+    paths = [path if path is not None else [] for path in paths]
+    lengths = np.fromiter((len(path) for path in paths), dtype=np.int64, count=len(paths))
+    offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    tokens = np.empty(offsets[-1], dtype=object)
+    tokens[:] = list(chain.from_iterable(paths))
+    return tokens, offsets
+
+
+@instrument
+def batch_backclicks(tokens, offsets, back=BACKCLICK):
+    """
+    Function to resolve the back-clicks of many paths at once, without walking each path with a stack.
+    Every page fills the stack slot of its depth and every back-click pops the slot above its depth,
+    so the page popped by a back-click is the latest page that filled the same slot before it.
+    Paths are assumed to be valid (never going back from an empty stack).
+    :param tokens: Flat array of pages and back-clicks (see 'flatten_paths').
+    :param offsets: Integer array delimiting the paths in 'tokens'.
+    :param back: Token used for back-clicks.
+    :return summary: BackclickSummary with the back-clicked pages, the effective (post-undo) paths,
+    the quit page, the back-click count and the effective length of every path.
+    """
+    tokens = np.asarray(tokens)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.diff(offsets)
+    n_games = len(lengths)
+    game = np.repeat(np.arange(n_games), lengths)
+    position = np.arange(len(tokens))
+
+    is_back = tokens == back
+    steps = np.where(is_back, -1, 1)
+    depth = np.cumsum(steps)
+    depth_before_game = np.concatenate([[0], depth])[offsets[:-1]]
+    depth = depth - np.repeat(depth_before_game, lengths)
+
+    # match every back-click with the page it pops: same game, same slot, latest before it
+    slot = np.where(is_back, depth + 1, depth)
+    order = np.lexsort((position, slot, game))
+    rank = np.empty_like(order)
+    rank[order] = position
+    back_positions = np.flatnonzero(is_back)
+    popped_positions = order[rank[back_positions] - 1]
+
+    # a page survives if the depth never drops below its own depth afterwards in the same game;
+    # shifting each game's depths above the previous game's keeps the suffix minimum per game
+    shift = 2 * (lengths.max() if n_games else 0) + 1
+    shifted = depth + game * shift
+    suffix_min = np.minimum.accumulate(shifted[::-1])[::-1]
+    survives = ~is_back & (suffix_min >= shifted)
+
+    n_backclicks = np.bincount(game[is_back], minlength=n_games)
+    effective_length = np.bincount(game[survives], minlength=n_games)
+    backclicked_offsets = np.concatenate([[0], np.cumsum(n_backclicks)])
+    effective_offsets = np.concatenate([[0], np.cumsum(effective_length)])
+
+    effective = tokens[survives]
+    quit_page = np.full(n_games, None, dtype=object)
+    has_page = effective_length > 0
+    quit_page[has_page] = effective[effective_offsets[1:][has_page] - 1]
+
+    return BackclickSummary(
+        backclicked=tokens[popped_positions],
+        backclicked_offsets=backclicked_offsets,
+        effective=effective,
+        effective_offsets=effective_offsets,
+        quit_page=quit_page,
+        n_backclicks=n_backclicks,
+        effective_length=effective_length,
+    )
+
+
+@instrument
+def backclick_summary(paths, back=BACKCLICK):
+    """
+    Function to compute the back-click statistics of a whole column of paths in a single pass,
+    the batched counterpart of 'get_backclicked_pages' and 'get_quitted_page'.
+    :param paths: Pandas Series (or iterable) of paths, each a list of pages.
+    :param back: Token used for back-clicks.
+    :return summary: BackclickSummary of the paths, in the same order.
+    """
+    tokens, offsets = flatten_paths(paths)
+    return batch_backclicks(tokens, offsets, back=back)
+
+
+LENGTH_COLUMN = "path_length"
+
+
+class FilterStats(NamedTuple):
+    """Statistics of one run of 'filter_games'."""
+
+    min_length: int
+    min_games: int
+    type: str
+    players: int
+    finished_games: int
+    unfinished_games: int
+
+
+class FilterResult(NamedTuple):
+    """
+    Result of 'filter_games'. The filtered PathStores are None unless the paths were given as PathStores.
+    """
+
+    finished: pd.DataFrame
+    unfinished: pd.DataFrame
+    paths_finished: object
+    paths_unfinished: object
+    stats: FilterStats
+
+
+def _check_filter_parameters(min_length, min_games, type):
+    if min_length < 0 or min_games < 0:
+        raise ValueError("min_length and min_games must be positive integers.")
+    if type not in ("restart", "timeout", "all"):
+        raise ValueError("type must be either 'restart', 'timeout' or 'all'.")
+
+
+def game_lengths(df, paths=None):
+    """
+    Function to get the length of every path, from the precomputed LENGTH_COLUMN when there is one.
+    :param df: Dataframe of games with a 'path' column.
+    :param paths: Optional PathStore of the paths of the games, used instead of the 'path' column.
+    :return lengths: Integer array of path lengths.
+    """
+    if paths is not None:
+        return paths.lengths()
+    if LENGTH_COLUMN in df.columns:
+        return df[LENGTH_COLUMN].to_numpy()
+    return df["path"].str.len().to_numpy()
+
+
+def _game_masks(df_finished, df_unfinished, min_length, type, paths=(None, None)):
+    """Returns boolean masks of the finished and unfinished games passing the length and type criteria."""
+    mask_finished = game_lengths(df_finished, paths[0]) >= min_length
+    mask_unfinished = game_lengths(df_unfinished, paths[1]) >= min_length
+    # For the moment we'll be considering all data. Unfinished path were not recorded before 2011-02-07,
+    # to keep only data matching the same period also mask df_finished["datetime"] on that date.
+    if type != "all":
+        mask_unfinished &= (df_unfinished["type"] == type).to_numpy()
+    return mask_finished, mask_unfinished
+
+
+def _player_mask(df, mask, num_games):
+    """Returns the mask of the masked games of the players in num_games."""
+    return mask & df["hashedIpAddress"].isin(num_games.index).to_numpy()
+
+
+def _keep_players(df, mask, num_games):
+    """Returns the games selected by mask (see '_player_mask'), with their player's 'num_games' column."""
+    filtered = df.take(np.flatnonzero(mask))
+    filtered.index = pd.RangeIndex(len(filtered))
+    filtered["num_games"] = num_games.reindex(filtered["hashedIpAddress"]).to_numpy()
+    return filtered
+
+
+@instrument
 def filter_games(
     df_finished: pd.DataFrame,
     df_unfinished: pd.DataFrame,
     min_length: int = 2,
     min_games: int = 10,
     type: str = "restart",
+    verbose: bool = True,
+    player_store=None,
+    paths=None,
 ):
     """
     Filter out games and players that do not match the following criteria:
     - Players that played at least min_games games
     - Games that are at least min_length pages long
     - Games that are of type type (restart or timeout)
+    The games are selected with boolean masks, using the LENGTH_COLUMN column for the path
+    lengths when the dataframes have one, so the inputs are never copied as a whole.
+    Returns a FilterResult holding the filtered dataframes, the filtered PathStores (see below)
+    and the FilterStats of the run.
+    When a PlayerStore (see player_store.PlayerStore) is given, the games of every player are
+    looked up in its running counts instead of being counted from the dataframes (unless
+    min_length is beyond the lengths the store tracks).
+    When paths is a (finished, unfinished) pair of PathStores (see path_store.PathStore) holding
+    the paths of the games, the dataframes need no 'path' column and the filtered PathStores are
+    returned in the paths_finished and paths_unfinished fields.
     """
+    _check_filter_parameters(min_length, min_games, type)
+    paths = (None, None) if paths is None else paths
+    if len(paths) != 2 or (paths[0] is None) != (paths[1] is None):
+        raise ValueError("paths must be a (finished, unfinished) pair of PathStores.")
+    mask_finished, mask_unfinished = _game_masks(df_finished, df_unfinished, min_length, type, paths)
 
-    if min_length < 0 or min_games < 0:
-        raise ValueError("min_length and min_games must be positive integers.")
+    # Keep only players that played overall at least n games
+    if player_store is not None and min_length <= player_store.max_tracked_length:
+        num_games = player_store.players_with(min_games, min_length, type)
+    else:
+        num_games = pd.concat(
+            [
+                df_finished["hashedIpAddress"][mask_finished],
+                df_unfinished["hashedIpAddress"][mask_unfinished],
+            ],
+            ignore_index=True,
+        ).value_counts()
+        num_games = num_games[num_games >= min_games]
+    count("players", len(num_games))
 
-    # Copy data since we're gonna filter out some games and players
-    bck_an_finished = df_finished.copy(deep=True)
-    bck_an_unfinished = df_unfinished.copy(deep=True)
+    mask_finished = _player_mask(df_finished, mask_finished, num_games)
+    mask_unfinished = _player_mask(df_unfinished, mask_unfinished, num_games)
+    bck_an_finished = _keep_players(df_finished, mask_finished, num_games)
+    bck_an_unfinished = _keep_players(df_unfinished, mask_unfinished, num_games)
+    filtered_paths = (None, None)
+    if paths[0] is not None:
+        filtered_paths = (paths[0].take(mask_finished), paths[1].take(mask_unfinished))
 
-    # For the moment we'll be considering all data. The following, comment line will keep only data matching
-    # the same period (unfinished path were not recorded before 2011-02-07)
-    # bck_an_finished = bck_an_finished[bck_an_finished["datetime"] >= bck_an_unfinished.sort_values(by="datetime").datetime[0]]
+    if verbose:
+        print(
+            "{} players played at least {} games longer than {} clicks.".format(
+                len(num_games), min_games, min_length
+            )
+        )
 
-    # Keep only unfinished games where the reason is "restart"
-    if type == "restart" or type == "timeout":
-        bck_an_unfinished = bck_an_unfinished[bck_an_unfinished["type"] == type]
-    elif type != "all":
-        raise ValueError("type must be either 'restart', 'timeout' or 'all'.")
+    stats = FilterStats(min_length, min_games, type, len(num_games), len(bck_an_finished), len(bck_an_unfinished))
+    return FilterResult(bck_an_finished, bck_an_unfinished, *filtered_paths, stats)
 
-    # Keep only games referring to path longer than l
-    bck_an_unfinished = bck_an_unfinished[
-        bck_an_unfinished["path"].apply(lambda x: len(x) >= min_length)
-    ]
-    bck_an_finished = bck_an_finished[
-        bck_an_finished["path"].apply(lambda x: len(x) >= min_length)
-    ]
 
-    # Keep only players that played overall at least n games
-    considered_players = pd.concat(
-        [
-            bck_an_finished[["hashedIpAddress", "datetime"]],
-            bck_an_unfinished[["hashedIpAddress", "datetime"]],
-        ]
-    )
-    considered_players = (
-        considered_players.groupby(by="hashedIpAddress")
-        .size()
-        .reset_index(name="num_games")
-    )
-    considered_players = considered_players[
-        considered_players["num_games"] >= min_games
-    ]
-
-    bck_an_finished = pd.merge(
-        left=bck_an_finished,
-        right=considered_players,
-        how="inner",
-        on="hashedIpAddress",
-    )
-    bck_an_unfinished = pd.merge(
-        left=bck_an_unfinished,
-        right=considered_players,
-        how="inner",
-        on="hashedIpAddress",
+@instrument
+def filter_games_grid(df_finished, df_unfinished, min_lengths, min_games_values, type="restart"):
+    """
+    Function to compute the statistics of 'filter_games' for a grid of parameters without filtering any frame.
+    :param df_finished: Dataframe of the finished games.
+    :param df_unfinished: Dataframe of the unfinished games.
+    :param min_lengths: Iterable of min_length values.
+    :param min_games_values: Iterable of min_games values.
+    :param type: Type of unfinished games to keep (restart, timeout or all).
+    :return stats: Dataframe with one FilterStats row per (min_length, min_games) pair.
+    """
+    codes, players = pd.factorize(
+        pd.concat([df_finished["hashedIpAddress"], df_unfinished["hashedIpAddress"]], ignore_index=True)
     )
+    is_finished = np.arange(len(codes)) < len(df_finished)
+    has_player = codes >= 0
+
+    rows = []
+    for min_length in min_lengths:
+        _check_filter_parameters(min_length, 0, type)
+        mask = np.concatenate(_game_masks(df_finished, df_unfinished, min_length, type)) & has_player
+        games = np.bincount(codes[mask], minlength=len(players))
+        finished = np.bincount(codes[mask & is_finished], minlength=len(games))
+        for min_games in min_games_values:
+            _check_filter_parameters(min_length, min_games, type)
+            kept = (games >= min_games) & (games > 0)
+            rows.append(
+                FilterStats(
+                    min_length,
+                    min_games,
+                    type,
+                    int(kept.sum()),
+                    int(finished[kept].sum()),
+                    int((games - finished)[kept].sum()),
+                )
+            )
+    return pd.DataFrame(rows, columns=FilterStats._fields)
 
-    print(
-        "{} players played at least {} games longer than {} clicks.".format(
-            len(considered_players), min_games, min_length
-        )
-    )
 
-    return bck_an_finished, bck_an_unfinished
+def filter_games_chunked(make_chunks, min_length=2, min_games=10, type="restart"):
+    """
+    Function to apply 'filter_games' lazily to data too large to hold at once. The chunks are read
+    twice: once to count the games of every player, then to yield the filtered chunks.
+    The parameters are checked when the function is called, before any chunk is read.
+    :param make_chunks: Function returning a fresh iterable of (finished chunk, unfinished chunk) dataframe pairs.
+    :param min_length: Minimum path length of the games.
+    :param min_games: Minimum number of games of the players.
+    :param type: Type of unfinished games to keep (restart, timeout or all).
+    :return: Generator of filtered (finished chunk, unfinished chunk) pairs.
+    """
+    _check_filter_parameters(min_length, min_games, type)
+    return _filter_chunks(make_chunks, min_length, min_games, type)
+
+
+def _filter_chunks(make_chunks, min_length, min_games, type):
+    num_games = None
+    for chunk_finished, chunk_unfinished in make_chunks():
+        mask_finished, mask_unfinished = _game_masks(chunk_finished, chunk_unfinished, min_length, type)
+        counts = pd.concat(
+            [
+                chunk_finished["hashedIpAddress"][mask_finished],
+                chunk_unfinished["hashedIpAddress"][mask_unfinished],
+            ],
+            ignore_index=True,
+        ).value_counts()
+        num_games = counts if num_games is None else num_games.add(counts, fill_value=0)
+    if num_games is None:
+        return
+    num_games = num_games[num_games >= min_games].astype(np.int64)
+
+    for chunk_finished, chunk_unfinished in make_chunks():
+        mask_finished, mask_unfinished = _game_masks(chunk_finished, chunk_unfinished, min_length, type)
+        yield (
+            _keep_players(chunk_finished, _player_mask(chunk_finished, mask_finished, num_games), num_games),
+            _keep_players(chunk_unfinished, _player_mask(chunk_unfinished, mask_unfinished, num_games), num_games),
+        )
@@ -0,0 +1,392 @@
+""" Module to store all functions related to scoring live games with a trained quit-prediction model """
+
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+import pandas as pd
+
+from .analysis import MISSING_PATH, distance_matrix, lookup_article_indices
+from .preprocessing import BACKCLICK, backclick_summary
+from .shortest_paths import UNREACHABLE
+
+MODEL_FILE = "model.pkl"
+ARTICLES_FILE = "articles.npz"
+SHORTEST_PATHS_FILE = "shortest_paths.npy"
+EMBEDDINGS_FILE = "embeddings.npy"
+
+
+def _distance_array(shortest_paths):
+    """Returns the shortest path lengths of a builder as a uint8 matrix that can be memory-mapped."""
+    if hasattr(shortest_paths, "distances"):
+        # ShortestPathOracle: only its precomputed matrix can be saved
+        if shortest_paths.distances_matrix is None:
+            raise ValueError(
+                "cannot save a ShortestPathOracle without a distance matrix, compute one with "
+                "shortest_paths.all_pairs_distances and pass it (or the oracle built on it) to the builder."
+            )
+        shortest_paths = shortest_paths.distances_matrix
+    matrix = distance_matrix(shortest_paths)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError("shortest_paths must be a square matrix, got shape {}.".format(matrix.shape))
+    if matrix.dtype != np.uint8:
+        if not np.issubdtype(matrix.dtype, np.integer) or matrix.min() < 0 or matrix.max() > UNREACHABLE:
+            raise ValueError("shortest_paths must hold integer lengths between 0 and {}.".format(UNREACHABLE))
+        matrix = matrix.astype(np.uint8)
+    return matrix
+
+
+def save_scoring_bundle(folder, model, builder):
+    """
+    Function to save a trained model with the per-article arrays it needs, for 'GameScorer.load'.
+    :param folder: Folder the bundle is written to.
+    :param model: Fitted model, trained on the columns of builder.feature_names() (a scikit-learn
+    classifier or a statsmodels results object of the formula with the same names).
+    :param builder: features.GameFeatureBuilder used to build the training matrix.
+    """
+    os.makedirs(folder, exist_ok=True)
+    features = builder.article_features
+    with open(os.path.join(folder, MODEL_FILE), "wb") as f:
+        pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    arrays = {
+        "articles": features.articles.to_numpy(dtype=str),
+        "metrics": features.metrics,
+        "metric_names": np.asarray(features.metric_names, dtype=str),
+        "out_degree": features.out_degree,
+        "in_degree": features.in_degree,
+        "category_offsets": features.categories.offsets,
+        "category_codes": features.categories.codes,
+        "category_labels": np.asarray(features.categories.labels, dtype=str),
+    }
+    if builder.shortest_paths is not None:
+        arrays["node"] = lookup_article_indices(features.articles, builder.article_index)
+        np.save(os.path.join(folder, SHORTEST_PATHS_FILE), _distance_array(builder.shortest_paths))
+    if builder.embeddings is not None:
+        arrays["embedding_row"] = builder.embeddings.ids(features.articles)
+        np.save(os.path.join(folder, EMBEDDINGS_FILE), np.asarray(builder.embeddings.embeddings))
+    np.savez(os.path.join(folder, ARTICLES_FILE), **arrays)
+
+
+class GameScorer:
+    """
+    Scores games with a trained model from per-article arrays loaded once. The start-side and
+    target-side features of every article are laid out in dense blocks, so building the features
+    of a game is two row lookups plus the pair features (shortest path, similarity).
+    With a partial path, the game is scored as a game from the current page (after undoing
+    back-clicks) to the target. Linear models (coef_/intercept_ or statsmodels params) are
+    evaluated directly, single games of scikit-learn tree models by traversing all the trees at
+    once, other models and batches of tree models through predict_proba.
+    """
+
+    def __init__(self, model, arrays, shortest_paths=None, embeddings=None):
+        self.model = model
+        self.articles = pd.Index(arrays["articles"])
+        labels = arrays["category_labels"]
+        n, k = len(self.articles), len(labels) - 1
+
+        # category indicators of every article, without the reference category
+        offsets, codes = arrays["category_offsets"], arrays["category_codes"]
+        categories = np.zeros((n, len(labels)))
+        categories[np.repeat(np.arange(n), np.diff(offsets)), codes] = 1
+        categories = categories[:, 1:]
+
+        metrics = arrays["metrics"]
+        self.start_block = np.hstack([categories, metrics, arrays["out_degree"][:, None]])
+        self.target_block = np.hstack([categories, metrics, arrays["in_degree"][:, None]])
+        self.valid_article = ~np.isnan(metrics).any(axis=1)
+
+        # positions of the blocks in the feature vector (see GameFeatureBuilder.feature_names)
+        m = metrics.shape[1]
+        self.start_columns = np.r_[0:k, 2 * k : 2 * k + m, 2 * k + 2 * m]
+        self.target_columns = np.r_[k : 2 * k, 2 * k + m : 2 * k + 2 * m, 2 * k + 2 * m + 1]
+        self.n_features = 2 * k + 2 * m + 2
+
+        self.shortest_paths = shortest_paths
+        self.node = arrays.get("node")
+        self.embeddings = embeddings
+        self.embedding_row = arrays.get("embedding_row")
+        self.n_features += (shortest_paths is not None) + (embeddings is not None)
+
+        self.feature_names = ["start_broad_category[T.{}]".format(label) for label in labels[1:]]
+        self.feature_names += ["target_broad_category[T.{}]".format(label) for label in labels[1:]]
+        self.feature_names += ["start_" + name for name in arrays["metric_names"]]
+        self.feature_names += ["target_" + name for name in arrays["metric_names"]]
+        self.feature_names += ["links_from_source", "links_to_target"]
+        if shortest_paths is not None:
+            self.feature_names.append("shortest_path_length")
+        if embeddings is not None:
+            self.feature_names.append("sims_start_target")
+        self._linear = self._linear_weights(model)
+        self._forest = self._forest_arrays(model) if self._linear is None else None
+
+    @classmethod
+    def load(cls, folder, mmap_mode="r"):
+        """
+        Function to load a bundle written by 'save_scoring_bundle'.
+        :param folder: Folder of the bundle.
+        :param mmap_mode: Memory-map mode of the shortest path and embedding matrices.
+        :return scorer: GameScorer ready to score.
+        """
+        with open(os.path.join(folder, MODEL_FILE), "rb") as f:
+            model = pickle.load(f)
+        with np.load(os.path.join(folder, ARTICLES_FILE)) as data:
+            arrays = {name: data[name] for name in data.files}
+        shortest_paths = embeddings = None
+        if os.path.exists(os.path.join(folder, SHORTEST_PATHS_FILE)):
+            shortest_paths = np.load(os.path.join(folder, SHORTEST_PATHS_FILE), mmap_mode=mmap_mode)
+        if os.path.exists(os.path.join(folder, EMBEDDINGS_FILE)):
+            embeddings = np.load(os.path.join(folder, EMBEDDINGS_FILE), mmap_mode=mmap_mode)
+        return cls(model, arrays, shortest_paths=shortest_paths, embeddings=embeddings)
+
+    def _linear_weights(self, model):
+        if hasattr(model, "coef_") and np.ndim(model.coef_) == 2 and model.coef_.shape[0] == 1:
+            return np.asarray(model.coef_[0], dtype=np.float64), float(model.intercept_[0])
+        params = getattr(model, "params", None)
+        if isinstance(params, pd.Series):
+            # a coefficient missing from the formula must not silently count as 0
+            names = params.index.drop("Intercept", errors="ignore")
+            missing, unknown = pd.Index(self.feature_names).difference(names), names.difference(self.feature_names)
+            if len(missing) or len(unknown):
+                raise ValueError(
+                    "The model parameters do not match the features of the bundle: missing {}, unknown {}.".format(
+                        list(missing), list(unknown)
+                    )
+                )
+            return params.reindex(self.feature_names).to_numpy(), float(params.get("Intercept", 0))
+        return None
+
+    def _forest_arrays(self, model):
+        """Flattens the trees of a scikit-learn forest (or single tree) to traverse them all at once."""
+        trees = [estimator.tree_ for estimator in getattr(model, "estimators_", [model]) if hasattr(estimator, "tree_")]
+        if not trees or any(tree.value.shape[1:] != (1, 2) for tree in trees):
+            # only single-output binary classification trees store class probabilities at the leaves
+            return None
+        sizes = np.array([tree.node_count for tree in trees])
+        shift = np.repeat(np.concatenate([[0], np.cumsum(sizes)[:-1]]), sizes)
+        left = np.concatenate([tree.children_left for tree in trees])
+        right = np.concatenate([tree.children_right for tree in trees])
+        values = np.concatenate([tree.value[:, 0, :] for tree in trees])
+        is_leaf = left < 0
+        return {
+            "roots": np.concatenate([[0], np.cumsum(sizes)[:-1]]),
+            "left": np.where(is_leaf, -1, left + shift),
+            "right": np.where(is_leaf, -1, right + shift),
+            "feature": np.concatenate([tree.feature for tree in trees]),
+            "threshold": np.concatenate([tree.threshold for tree in trees]),
+            "positive": values[:, 1] / values.sum(axis=1),
+        }
+
+    def _forest_probability(self, x):
+        forest = self._forest
+        x = x.astype(np.float32)  # scikit-learn compares float32 features with the thresholds
+        nodes = forest["roots"].copy()
+        inner = forest["left"][nodes] >= 0
+        while inner.any():
+            current = nodes[inner]
+            go_left = x[forest["feature"][current]] <= forest["threshold"][current]
+            nodes[inner] = np.where(go_left, forest["left"][current], forest["right"][current])
+            inner = forest["left"][nodes] >= 0
+        return float(forest["positive"][nodes].mean())
+
+    def features(self, start_ids, target_ids):
+        """
+        Function to build the feature rows of games given as article ids.
+        :param start_ids: Integer array of rows of self.articles.
+        :param target_ids: Integer array of rows of self.articles.
+        :return X: Dense feature matrix (games x features), NaN rows for games with unknown features.
+        """
+        start_ids = np.asarray(start_ids, dtype=np.int64)
+        target_ids = np.asarray(target_ids, dtype=np.int64)
+        X = np.empty((len(start_ids), self.n_features))
+        X[:, self.start_columns] = self.start_block[start_ids]
+        X[:, self.target_columns] = self.target_block[target_ids]
+        column = len(self.start_columns) + len(self.target_columns)
+        valid = (start_ids >= 0) & (target_ids >= 0)
+        valid &= self.valid_article[start_ids] & self.valid_article[target_ids]
+
+        if self.shortest_paths is not None:
+            source_nodes, target_nodes = self.node[start_ids], self.node[target_ids]
+            found = (source_nodes != MISSING_PATH) & (target_nodes != MISSING_PATH) & valid
+            lengths = np.asarray(self.shortest_paths[source_nodes[found], target_nodes[found]])
+            # pairs without a path are unknown, not 255 hops long
+            found[found] = lengths != UNREACHABLE
+            X[:, column] = np.nan
+            X[found, column] = lengths[lengths != UNREACHABLE]
+            valid &= found
+            column += 1
+        if self.embeddings is not None:
+            source_rows, target_rows = self.embedding_row[start_ids], self.embedding_row[target_ids]
+            found = (source_rows >= 0) & (target_rows >= 0) & valid
+            X[:, column] = np.nan
+            X[found, column] = np.einsum(
+                "ij,ij->i",
+                np.asarray(self.embeddings[source_rows[found]], dtype=np.float32),
+                np.asarray(self.embeddings[target_rows[found]], dtype=np.float32),
+            )
+            valid &= found
+        X[~valid] = np.nan
+        return X
+
+    def _probabilities(self, X):
+        scores = np.full(len(X), np.nan)
+        valid = ~np.isnan(X).any(axis=1)
+        if not valid.any():
+            return scores
+        if self._linear is not None:
+            weights, intercept = self._linear
+            scores[valid] = 1 / (1 + np.exp(-(X[valid] @ weights + intercept)))
+        else:
+            scores[valid] = self.model.predict_proba(X[valid])[:, 1]
+        return scores
+
+    def score_batch(self, starts, targets, paths=None):
+        """
+        Function to score many games at once.
+        :param starts: Array of start article names.
+        :param targets: Array of target article names.
+        :param paths: Optional iterable of partial paths (lists of article names, None for games not started).
+        :return scores: Array of predicted probabilities of the positive class, NaN for games with unknown articles.
+        """
+        starts = np.asarray(starts, dtype=object)
+        if paths is not None:
+            current = backclick_summary(paths).quit_page
+            starts = np.where(pd.isna(current), starts, current)
+        X = self.features(
+            self.articles.get_indexer(pd.Index(starts)), self.articles.get_indexer(pd.Index(targets))
+        )
+        return self._probabilities(X)
+
+    def score(self, start, target, path=None):
+        """
+        Function to score a single game.
+        :param start: Start article name.
+        :param target: Target article name.
+        :param path: Optional partial path (list of article names, with BACKCLICK for back-clicks).
+        :return score: Predicted probability of the positive class, NaN if an article is unknown.
+        """
+        if path:
+            stack = []
+            for page in path:
+                if page == BACKCLICK:
+                    stack.pop()
+                else:
+                    stack.append(page)
+            start = stack[-1] if stack else start
+        start_id = self.articles.get_loc(start) if start in self.articles else -1
+        target_id = self.articles.get_loc(target) if target in self.articles else -1
+        X = self.features(np.array([start_id]), np.array([target_id]))
+        if self._forest is not None and not np.isnan(X[0]).any():
+            return self._forest_probability(X[0])
+        return float(self._probabilities(X)[0])
+
+    def score_request(self, request):
+        """Scores a request dictionary (start, target, optional path), or a list of them."""
+        if isinstance(request, list):
+            return [self.score_request(item) for item in request]
+        score = self.score(request["start"], request["target"], request.get("path"))
+        return {"score": None if np.isnan(score) else score}
+
+
+def serve_stdin(scorer, stdin=sys.stdin, stdout=sys.stdout):
+    """
+    Function to score JSON requests read line by line from stdin, writing one JSON answer per line.
+    :param scorer: GameScorer.
+    """
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            answer = scorer.score_request(json.loads(line))
+        except (KeyError, TypeError, ValueError, IndexError) as error:
+            answer = {"error": str(error)}
+        stdout.write(json.dumps(answer) + "\n")
+        stdout.flush()
+
+
+def serve_http(scorer, host="127.0.0.1", port=8000):
+    """
+    Function to serve the scorer over HTTP: POST a JSON request (or list of requests) to /score.
+    :param scorer: GameScorer.
+    :param host: Interface to listen on.
+    :param port: Port to listen on.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/score":
+                self.send_error(404)
+                return
+            try:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                answer, status = scorer.score_request(json.loads(body)), 200
+            except (KeyError, TypeError, ValueError, IndexError) as error:
+                answer, status = {"error": str(error)}, 400
+            payload = json.dumps(answer).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    HTTPServer((host, port), Handler).serve_forever()
+
+
+def benchmark(scorer, n_single=10_000, batch_size=100_000, seed=0):
+    """
+    Function to measure the latency of single scores and the throughput of batch scores on random games.
+    :param scorer: GameScorer.
+    :param n_single: Number of single games scored one by one.
+    :param batch_size: Number of games of the batch.
+    :param seed: Seed of the random games.
+    :return: Dictionary with the p50/p90/p99/max single-game latencies (microseconds) and the batch
+    throughput (games per second).
+    """
+    rng = np.random.default_rng(seed)
+    articles = scorer.articles.to_numpy()
+    starts, targets = rng.choice(articles, n_single), rng.choice(articles, n_single)
+    latencies = np.empty(n_single)
+    for i in range(n_single):
+        start = time.perf_counter()
+        scorer.score(starts[i], targets[i])
+        latencies[i] = time.perf_counter() - start
+    latencies *= 1e6
+
+    starts, targets = rng.choice(articles, batch_size), rng.choice(articles, batch_size)
+    start = time.perf_counter()
+    scorer.score_batch(starts, targets)
+    batch_time = time.perf_counter() - start
+
+    return {
+        "p50_us": float(np.percentile(latencies, 50)),
+        "p90_us": float(np.percentile(latencies, 90)),
+        "p99_us": float(np.percentile(latencies, 99)),
+        "max_us": float(latencies.max()),
+        "batch_games_per_s": batch_size / batch_time,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score Wikispeedia games with a saved quit-prediction bundle.")
+    parser.add_argument("bundle", help="folder written by save_scoring_bundle")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--stdin", action="store_true", help="score JSON lines from stdin")
+    mode.add_argument("--http", type=int, metavar="PORT", help="serve POST /score on this port")
+    mode.add_argument("--benchmark", action="store_true", help="print latency percentiles")
+    args = parser.parse_args()
+
+    scorer = GameScorer.load(args.bundle)
+    if args.stdin:
+        serve_stdin(scorer)
+    elif args.http:
+        serve_http(scorer, port=args.http)
+    else:
+        print(json.dumps(benchmark(scorer), indent=2))
@@ -0,0 +1,281 @@
+""" Module to store all functions related to shortest paths in the article link graph """
+
+import os
+from collections import OrderedDict
+from multiprocessing import Pool
+from typing import NamedTuple
+from urllib.parse import unquote
+
+import numpy as np
+import pandas as pd
+
+# scipy.sparse is imported by the functions building matrices, so the constants and the oracle
+# lookups are cheap to import (see utils.analysis, utils.scoring)
+
+UNREACHABLE = 255  # distance stored for pairs without a path (and paths of 255+ hops)
+# int32 so the path counts of a sparse product cannot wrap around (int8 overflows at 128 parallel paths)
+PATH_COUNT_DTYPE = np.int32
+
+
+# byte -> distance table of the raw matrix format: digits map to their value, '_' (no path) to UNREACHABLE
+DIGIT_DISTANCES = np.full(256, UNREACHABLE, dtype=np.uint8)
+DIGIT_DISTANCES[ord("0") : ord("9") + 1] = np.arange(10)
+
+
+def parse_distance_rows(rows):
+    """
+    Function to parse the rows of a raw distance matrix (one string of digits per article, '_' when
+    there is no path) into a uint8 matrix in one vectorized pass.
+    :param rows: Sequence of equally long strings.
+    :return distances: uint8 matrix (len(rows) x row length), UNREACHABLE where there is no path.
+    """
+    rows = [row.strip() if isinstance(row, str) else row.decode().strip() for row in rows]
+    data = np.frombuffer("".join(rows).encode("ascii"), dtype=np.uint8)
+    return DIGIT_DISTANCES[data].reshape(len(rows), -1)
+
+
+class LinkGraph(NamedTuple):
+    """
+    Link graph in CSR form: the links of articles[i] point to articles[indices[indptr[i]:indptr[i + 1]]].
+    """
+
+    articles: pd.Index
+    indptr: np.ndarray
+    indices: np.ndarray
+
+    def adjacency(self):
+        """Returns the graph as a scipy.sparse CSR adjacency matrix."""
+        from scipy import sparse
+
+        n = len(self.articles)
+        data = np.ones(len(self.indices), dtype=PATH_COUNT_DTYPE)
+        return sparse.csr_matrix((data, self.indices, self.indptr), shape=(n, n))
+
+    def out_degree(self):
+        """Returns the number of links from every article."""
+        return np.diff(self.indptr)
+
+    def in_degree(self):
+        """Returns the number of links to every article."""
+        return np.bincount(self.indices, minlength=len(self.articles))
+
+
+def read_links(links_file):
+    """
+    Function to read the raw links file (tab separated, URL-encoded article names, '#' comments).
+    :param links_file: Path to links.tsv.
+    :return links: Dataframe with 'linkSource' and 'linkTarget' columns of decoded article names.
+    """
+    links = pd.read_csv(links_file, sep="\t", comment="#", header=None, names=["linkSource", "linkTarget"])
+    names, codes = np.unique(links.to_numpy(dtype=str), return_inverse=True)
+    decoded = np.array([unquote(name) for name in names], dtype=object)
+    return pd.DataFrame(decoded[codes.reshape(links.shape)], columns=links.columns)
+
+
+def build_link_graph(links, articles=None, source="linkSource", target="linkTarget"):
+    """
+    Function to build the CSR link graph.
+    :param links: Dataframe with one row per link.
+    :param articles: Optional array of article names fixing the node order (e.g. the order of the
+    'articles' dataframe, so node ids match its index). Links to unknown articles are dropped.
+    :param source: Column of the linking article.
+    :param target: Column of the linked article.
+    :return graph: LinkGraph of the links.
+    """
+    if articles is None:
+        articles = pd.unique(pd.concat([links[source], links[target]], ignore_index=True))
+    articles = pd.Index(articles)
+
+    sources = articles.get_indexer(links[source])
+    targets = articles.get_indexer(links[target])
+    known = (sources >= 0) & (targets >= 0)
+    sources, targets = sources[known], targets[known]
+
+    order = np.lexsort((targets, sources))
+    indptr = np.zeros(len(articles) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(articles)), out=indptr[1:])
+    return LinkGraph(articles, indptr, targets[order].astype(np.int32))
+
+
+def bfs_distances(adjacency, sources):
+    """
+    Function to run a batched breadth-first search from several sources at once, one sparse
+    matrix product per level.
+    :param adjacency: scipy.sparse CSR adjacency matrix of the graph.
+    :param sources: Integer array of source nodes.
+    :return distances: uint8 matrix (len(sources) x nodes) of hop distances, UNREACHABLE if none.
+    """
+    from scipy import sparse
+
+    n = adjacency.shape[0]
+    distances = np.full((len(sources), n), UNREACHABLE, dtype=np.uint8)
+    rows = np.arange(len(sources))
+    distances[rows, sources] = 0
+
+    frontier = sparse.csr_matrix(
+        (np.ones(len(sources), dtype=PATH_COUNT_DTYPE), (rows, sources)), shape=(len(sources), n)
+    )
+    visited = distances == 0
+    level = 0
+    while frontier.nnz and level < UNREACHABLE - 1:
+        level += 1
+        reached = (frontier @ adjacency).toarray() > 0
+        reached &= ~visited
+        visited |= reached
+        distances[reached] = level
+        frontier = sparse.csr_matrix(reached.astype(PATH_COUNT_DTYPE))
+    return distances
+
+
+_WORKER = {}
+
+
+def _init_worker(indptr, indices, output_file):
+    from scipy import sparse
+
+    n = len(indptr) - 1
+    data = np.ones(len(indices), dtype=PATH_COUNT_DTYPE)
+    _WORKER["adjacency"] = sparse.csr_matrix((data, indices, indptr), shape=(n, n))
+    _WORKER["output"] = np.load(output_file, mmap_mode="r+")
+
+
+def _fill_rows(bounds):
+    start, end = bounds
+    _WORKER["output"][start:end] = bfs_distances(_WORKER["adjacency"], np.arange(start, end))
+    _WORKER["output"].flush()
+    return end - start
+
+
+def all_pairs_distances(graph, output_file, batch_size=64, processes=None):
+    """
+    Function to compute the hop distance between all pairs of articles into a uint8 memory-mapped
+    matrix, spreading batches of source nodes over a process pool.
+    :param graph: LinkGraph of the articles.
+    :param output_file: .npy file the matrix is written to.
+    :param batch_size: Number of sources searched together by a worker.
+    :param processes: Number of worker processes, defaults to the number of CPUs.
+    :return distances: Read-only memory-mapped matrix (see 'load_distances').
+    """
+    n = len(graph.articles)
+    matrix = np.lib.format.open_memmap(output_file, mode="w+", dtype=np.uint8, shape=(n, n))
+    del matrix
+
+    batches = [(start, min(start + batch_size, n)) for start in range(0, n, batch_size)]
+    with Pool(
+        processes=processes,
+        initializer=_init_worker,
+        initargs=(graph.indptr, graph.indices, output_file),
+    ) as pool:
+        for _ in pool.imap_unordered(_fill_rows, batches):
+            pass
+    return load_distances(output_file)
+
+
+def load_distances(distance_file):
+    """
+    Function to memory-map a distance matrix written by 'all_pairs_distances'.
+    :param distance_file: .npy file of the matrix.
+    :return distances: Read-only memory-mapped uint8 matrix.
+    """
+    return np.load(distance_file, mmap_mode="r")
+
+
+class ShortestPathOracle:
+    """
+    Shortest path lengths between articles, looked up in a precomputed distance matrix when there
+    is one, or else answered on demand with a bidirectional BFS whose results are kept in an LRU
+    cache. Node ids are the positions in graph.articles. Instances can be passed as 'shortest_paths'
+    to analysis.shortest_path_find.
+    """
+
+    def __init__(self, graph, distances=None, cache_size=100_000):
+        self.graph = graph
+        self.distances_matrix = distances
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        reverse = graph.adjacency().T.tocsr()
+        self._reverse_indptr = reverse.indptr
+        self._reverse_indices = reverse.indices
+
+    def _neighbours(self, nodes, forward):
+        if forward:
+            indptr, indices = self.graph.indptr, self.graph.indices
+        else:
+            indptr, indices = self._reverse_indptr, self._reverse_indices
+        starts, ends = indptr[nodes], indptr[nodes + 1]
+        lengths = ends - starts
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.unique(indices[np.repeat(starts, lengths) + within])
+
+    def _bidirectional(self, source, target):
+        if source == target:
+            return 0
+        n = len(self.graph.articles)
+        seen = [np.zeros(n, dtype=bool), np.zeros(n, dtype=bool)]
+        seen[0][source] = seen[1][target] = True
+        frontiers = [np.array([source]), np.array([target])]
+        depth = 0
+        while len(frontiers[0]) and len(frontiers[1]) and depth < UNREACHABLE:
+            # expand the smaller side
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            nxt = self._neighbours(frontiers[side], forward=side == 0)
+            depth += 1
+            if seen[1 - side][nxt].any():
+                return depth
+            nxt = nxt[~seen[side][nxt]]
+            seen[side][nxt] = True
+            frontiers[side] = nxt
+        return UNREACHABLE
+
+    def distance(self, source, target):
+        """
+        Function to get the shortest path length between two articles.
+        :param source: Node id of the source article.
+        :param target: Node id of the target article.
+        :return length: Number of hops, UNREACHABLE if there is no path.
+        """
+        if self.distances_matrix is not None:
+            return int(self.distances_matrix[source, target])
+        key = (int(source), int(target))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        length = self._bidirectional(*key)
+        self._cache[key] = length
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return length
+
+    def distances(self, source_idx, target_idx):
+        """
+        Function to get the shortest path lengths of many (source, target) pairs.
+        :param source_idx: Integer array of source node ids.
+        :param target_idx: Integer array of target node ids.
+        :return lengths: Integer array of hop counts, UNREACHABLE where there is no path.
+        """
+        source_idx = np.asarray(source_idx, dtype=np.int64)
+        target_idx = np.asarray(target_idx, dtype=np.int64)
+        if self.distances_matrix is not None:
+            return np.asarray(self.distances_matrix[source_idx, target_idx], dtype=np.int64)
+        return np.fromiter(
+            (self.distance(s, t) for s, t in zip(source_idx, target_idx)),
+            dtype=np.int64,
+            count=len(source_idx),
+        )
+
+
+def shortest_path_oracle(links, articles=None, distance_file=None, cache_size=100_000):
+    """
+    Function to build a ShortestPathOracle from the links, memory-mapping a precomputed distance
+    matrix if 'distance_file' exists.
+    :param links: Dataframe with 'linkSource' and 'linkTarget' columns.
+    :param articles: Optional array of article names fixing the node order.
+    :param distance_file: Optional .npy file written by 'all_pairs_distances'.
+    :param cache_size: Number of on-demand queries kept in the LRU cache.
+    :return oracle: ShortestPathOracle of the link graph.
+    """
+    graph = build_link_graph(links, articles=articles)
+    distances = None
+    if distance_file is not None and os.path.exists(distance_file):
+        distances = load_distances(distance_file)
+    return ShortestPathOracle(graph, distances=distances, cache_size=cache_size)
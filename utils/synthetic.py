@@ -0,0 +1,276 @@
+""" Module to store all functions related to generating synthetic Wikispeedia-like data """
+
+import os
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from .path_store import BACK_ID, PathStore
+from .preprocessing import BACKCLICK
+from .shortest_paths import UNREACHABLE, bfs_distances, build_link_graph
+
+BROAD_CATEGORIES = [
+    "Art",
+    "Business_Studies",
+    "Citizenship",
+    "Countries",
+    "Design_and_Technology",
+    "Everyday_life",
+    "Geography",
+    "History",
+    "IT",
+    "Language_and_literature",
+    "Mathematics",
+    "Music",
+    "People",
+    "Religion",
+    "Science",
+]
+
+
+def synthetic_articles(n_articles=4604, extra_category_share=0.1, seed=0):
+    """
+    Function to generate article names and their categories.
+    :param n_articles: Number of articles.
+    :param extra_category_share: Share of articles with a second category.
+    :param seed: Seed of the generator.
+    :return articles: Dataframe with an 'article' column.
+    :return categories: Dataframe with 'article', 'category' and 'broad_category' columns.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array(["Article_{}".format(i) for i in range(n_articles)], dtype=object)
+    # skewed category sizes, as in Wikispeedia (Science and Geography are the largest)
+    weights = rng.dirichlet(np.full(len(BROAD_CATEGORIES), 0.8))
+
+    extra = rng.random(n_articles) < extra_category_share
+    article_rows = np.concatenate([np.arange(n_articles), np.flatnonzero(extra)])
+    broad = np.asarray(BROAD_CATEGORIES, dtype=object)[
+        rng.choice(len(BROAD_CATEGORIES), size=len(article_rows), p=weights)
+    ]
+    sub = rng.integers(0, 5, size=len(article_rows))
+    categories = pd.DataFrame(
+        {
+            "article": names[article_rows],
+            "category": ["subject.{}.Topic_{}".format(b, s) for b, s in zip(broad, sub)],
+            "broad_category": broad,
+        }
+    )
+    return pd.DataFrame({"article": names}), categories.sort_values("article", kind="stable", ignore_index=True)
+
+
+def synthetic_links(articles, mean_out_degree=26, seed=0):
+    """
+    Function to generate a link graph with a heavy-tailed in-degree distribution.
+    :param articles: Dataframe with an 'article' column.
+    :param mean_out_degree: Average number of links per article.
+    :param seed: Seed of the generator.
+    :return links: Dataframe with 'linkSource' and 'linkTarget' columns.
+    """
+    rng = np.random.default_rng(seed)
+    names = articles["article"].to_numpy()
+    n = len(names)
+    out_degree = np.maximum(rng.poisson(mean_out_degree, size=n), 1)
+    popularity = rng.zipf(1.8, size=n).astype(np.float64)
+    sources = np.repeat(np.arange(n), out_degree)
+    targets = rng.choice(n, size=len(sources), p=popularity / popularity.sum())
+    keep = sources != targets
+    links = pd.DataFrame({"linkSource": names[sources[keep]], "linkTarget": names[targets[keep]]})
+    return links.drop_duplicates(ignore_index=True)
+
+
+def synthetic_distance_matrix(articles, links, batch_size=256):
+    """
+    Function to compute the shortest path matrix of a synthetic graph (rows in the order of 'articles').
+    :param articles: Dataframe with an 'article' column.
+    :param links: Dataframe with 'linkSource' and 'linkTarget' columns.
+    :param batch_size: Number of sources searched together.
+    :return distances: uint8 matrix, 255 for unreachable pairs.
+    """
+    graph = build_link_graph(links, articles=articles["article"])
+    adjacency = graph.adjacency()
+    n = len(graph.articles)
+    return np.vstack(
+        [bfs_distances(adjacency, np.arange(start, min(start + batch_size, n))) for start in range(0, n, batch_size)]
+    )
+
+
+def _walks(graph, lengths, backclick_rate, rng):
+    """Random walks along the links with back-clicks, as PathStore tokens of graph ids + 1."""
+    n_games, max_length = len(lengths), int(lengths.max()) if len(lengths) else 0
+    degree = graph.out_degree()
+    stack = np.zeros((n_games, max_length + 1), dtype=np.int32)
+    depth = np.ones(n_games, dtype=np.int64)
+    stack[:, 0] = rng.integers(0, len(graph.articles), size=n_games)
+    tokens = np.full((n_games, max_length), -1, dtype=np.int32)
+    tokens[:, 0] = stack[:, 0] + 1
+    rows = np.arange(n_games)
+
+    for step in range(1, max_length):
+        rows = rows[lengths[rows] > step]
+        current = stack[rows, depth[rows] - 1]
+        has_links = degree[current] > 0
+        # no voluntary back-click on the last click, so finished paths end on a page
+        back = (depth[rows] > 1) & (lengths[rows] > step + 1) & (rng.random(len(rows)) < backclick_rate)
+        forward = ~back & has_links
+        # dead ends go back when possible, else the game stops
+        back |= ~forward & (depth[rows] > 1)
+
+        choice = graph.indptr[current] + (rng.random(len(rows)) * np.maximum(degree[current], 1)).astype(np.int64)
+        next_page = graph.indices[np.minimum(choice, len(graph.indices) - 1)]
+        moved, returned = rows[forward], rows[back]
+        stack[moved, depth[moved]] = next_page[forward]
+        tokens[moved, step] = next_page[forward] + 1
+        depth[moved] += 1
+        tokens[returned, step] = BACK_ID
+        depth[returned] -= 1
+    return tokens
+
+
+def synthetic_games(
+    n_games,
+    articles,
+    links,
+    n_players=None,
+    unfinished_share=0.33,
+    backclick_rate=0.06,
+    mean_length=6.5,
+    max_length=435,
+    seed=0,
+    as_path_store=False,
+):
+    """
+    Function to generate finished and unfinished games shaped like paths_finished/paths_unfinished.
+    Paths are random walks along the links with back-clicks, of lognormal lengths; players have a
+    heavy-tailed number of games.
+    :param n_games: Total number of games.
+    :param articles: Dataframe with an 'article' column.
+    :param links: Dataframe with 'linkSource' and 'linkTarget' columns.
+    :param n_players: Number of players, defaults to a quarter of the games.
+    :param unfinished_share: Share of unfinished games.
+    :param backclick_rate: Probability of a back-click at each step.
+    :param mean_length: Average path length.
+    :param max_length: Maximum path length.
+    :param seed: Seed of the generator.
+    :param as_path_store: Whether to return the paths as PathStores instead of a 'path' column of lists
+    (much lighter for millions of games).
+    :return finished: Dataframe of the finished games.
+    :return unfinished: Dataframe of the unfinished games.
+    :return paths: None, or the (finished, unfinished) PathStores if as_path_store.
+    """
+    rng = np.random.default_rng(seed)
+    graph = build_link_graph(links, articles=articles["article"])
+    n_players = n_players or max(n_games // 4, 1)
+
+    sigma = 0.6
+    lengths = rng.lognormal(np.log(mean_length) - sigma**2 / 2, sigma, size=n_games)
+    lengths = np.clip(np.round(lengths), 1, max_length).astype(np.int64)
+
+    tokens = np.empty(0, dtype=np.int64)
+    offsets = [np.zeros(1, dtype=np.int64)]
+    token_chunks = []
+    # the walks of a chunk are (games x longest path) matrices, small chunks bound their memory
+    chunk = 200_000
+    for start in range(0, n_games, chunk):
+        walk = _walks(graph, lengths[start : start + chunk], backclick_rate, rng)
+        filled = walk >= 0
+        token_chunks.append(walk[filled])
+        offsets.append(offsets[-1][-1] + np.cumsum(filled.sum(axis=1)))
+    tokens = np.concatenate(token_chunks) if token_chunks else tokens
+    offsets = np.concatenate(offsets)
+    vocabulary = np.concatenate([[BACKCLICK], graph.articles.to_numpy(dtype=str)])
+    store = PathStore(tokens.astype(np.int32), offsets, vocabulary)
+
+    finished_mask = rng.random(n_games) >= unfinished_share
+    activity = 1.0 / np.arange(1, n_players + 1) ** 1.1
+    players = rng.permutation(n_players)[rng.choice(n_players, size=n_games, p=activity / activity.sum())]
+    timestamps = np.sort(rng.integers(1_220_000_000, 1_390_000_000, size=n_games))
+    # the last page of a path, resolving the back-clicks of the few paths ending on one
+    last_pages = store.tokens[store.offsets[1:] - 1].astype(np.int64)
+    ends_back = last_pages == BACK_ID
+    last_pages[ends_back] = store.take(ends_back).backclicks().quit_page.astype(np.int64)
+    random_targets = rng.integers(1, len(vocabulary), size=n_games)
+
+    games = pd.DataFrame(
+        {
+            "hashedIpAddress": np.char.add("player_", players.astype(str)),
+            "timestamp": timestamps,
+            "durationInSec": (lengths * rng.gamma(2.0, 15.0, size=n_games)).astype(np.int64),
+            "target": vocabulary[np.where(finished_mask, last_pages, random_targets)],
+            "start": vocabulary[store.first_pages()],
+            "path_length": store.lengths(),
+        }
+    )
+    games["datetime"] = pd.to_datetime(games["timestamp"], unit="s")
+    games["type"] = np.where(rng.random(n_games) < 0.7, "restart", "timeout")
+
+    def split(mask):
+        rows = np.flatnonzero(mask)
+        part = games.iloc[rows].reset_index(drop=True)
+        starts, ends = store.offsets[rows], store.offsets[rows + 1]
+        lengths = ends - starts
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        part_store = PathStore(
+            store.tokens[np.repeat(starts, lengths) + within],
+            np.concatenate([[0], np.cumsum(lengths)]),
+            vocabulary,
+        )
+        if not as_path_store:
+            part["path"] = part_store.to_series()
+        return part, part_store
+
+    finished, finished_store = split(finished_mask)
+    unfinished, unfinished_store = split(~finished_mask)
+    finished = finished.drop(columns="type")
+    paths = (finished_store, unfinished_store) if as_path_store else None
+    return finished, unfinished, paths
+
+
+def write_raw_files(folder, articles, categories, links, finished, unfinished, distances=None):
+    """
+    Function to write synthetic data in the format of the raw Wikispeedia files: tab-separated,
+    URL-encoded article names, paths joined by ';' and 'NULL' for missing ratings.
+    :param folder: Folder to write articles.tsv, categories.tsv, links.tsv, paths_finished.tsv,
+    paths_unfinished.tsv and shortest-path-distance-matrix.txt to.
+    :param articles: Dataframe with an 'article' column.
+    :param categories: Dataframe with 'article' and 'category' columns.
+    :param links: Dataframe with 'linkSource' and 'linkTarget' columns.
+    :param finished: Dataframe of the finished games, with a 'path' column of lists of names.
+    :param unfinished: Dataframe of the unfinished games, with a 'path' column of lists of names.
+    :param distances: Shortest path matrix in the order of 'articles', computed if None.
+    :raises ValueError: If a distance does not fit the single digit of the raw matrix.
+    """
+    os.makedirs(folder, exist_ok=True)
+    if distances is None:
+        distances = synthetic_distance_matrix(articles, links)
+    distances = np.asarray(distances)
+    if ((distances > 9) & (distances != UNREACHABLE)).any():
+        raise ValueError("The raw matrix only stores distances of a single digit.")
+
+    def encode(names):
+        return [quote(name, safe="") for name in names]
+
+    def write(file, rows):
+        with open(os.path.join(folder, file), "w", encoding="utf-8") as f:
+            f.write("# synthetic Wikispeedia data\n\n")
+            f.writelines("\t".join(map(str, row)) + "\n" for row in rows)
+
+    def path_rows(games, columns):
+        paths = [
+            ";".join(BACKCLICK if page == BACKCLICK else quote(page, safe="") for page in path) for path in games["path"]
+        ]
+        return zip(games["hashedIpAddress"], games["timestamp"], games["durationInSec"], paths, *columns)
+
+    write("articles.tsv", zip(encode(articles["article"])))
+    write("categories.tsv", zip(encode(categories["article"]), categories["category"]))
+    write("links.tsv", zip(encode(links["linkSource"]), encode(links["linkTarget"])))
+    ratings = finished["rating"] if "rating" in finished else pd.Series(np.nan, index=finished.index)
+    write("paths_finished.tsv", path_rows(finished, [ratings.map(lambda r: "NULL" if pd.isna(r) else int(r))]))
+    write("paths_unfinished.tsv", path_rows(unfinished, [encode(unfinished["target"]), unfinished["type"]]))
+
+    digits = np.frombuffer(b"0123456789", dtype=np.uint8)
+    characters = np.where(distances == UNREACHABLE, ord("_"), digits[np.minimum(distances, 9)]).astype(np.uint8)
+    with open(os.path.join(folder, "shortest-path-distance-matrix.txt"), "wb") as f:
+        f.write(b"# synthetic Wikispeedia data\n\n")
+        for row in characters:
+            f.write(row.tobytes() + b"\n")